@@ -1,15 +1,16 @@
 WeChat: cstutorcs
 QQ: 749389476
 Email: tutorcs@163.com
-from typing import Callable
+from typing import Callable, Dict, List, Tuple
 
 from choco.dialects.choco_ast import *
 import re
 
+camel_to_snake_pattern = re.compile(r'(?<!^)(?=[A-Z])')
+
 
 def camel_to_snake(name):
-    pattern = re.compile(r'(?<!^)(?=[A-Z])')
-    return pattern.sub('_', name).lower()
+    return camel_to_snake_pattern.sub('_', name).lower()
 
 
 def get_method(instance: object, method: str) -> Optional[Callable]:
@@ -23,20 +24,80 @@ def get_method(instance: object, method: str) -> Optional[Callable]:
             return None
 
 
+Methods = Tuple[Optional[Callable], Optional[Callable]]
+
+
 class Visitor:
 
+    iterative: bool = True
+    """
+    Whether operations without a `traverse_*` method are traversed with an
+    explicit stack, instead of recursively. Both traversals visit the
+    operations in the same order, but only the iterative one works on
+    deeply nested programs.
+    """
+
+    def get_methods(self, op_type: Type[Operation]) -> Methods:
+        """
+        Get the `traverse_*` and `visit_*` functions of this visitor class for
+        an operation class. They are resolved once per visitor class and
+        operation class, and are called with the visitor as first argument.
+        """
+        cls = type(self)
+        # The cache is stored on each class, so that subclasses do not share
+        # the cache of their parent.
+        cache: Optional[Dict[Type[Operation], Methods]] = cls.__dict__.get(
+            '_methods_cache')
+        if cache is None:
+            cache = dict()
+            cls._methods_cache = cache
+        methods = cache.get(op_type)
+        if methods is None:
+            class_name = camel_to_snake(op_type.__name__)
+            methods = (get_method(cls, f"traverse_{class_name}"),
+                       get_method(cls, f"visit_{class_name}"))
+            cache[op_type] = methods
+        return methods
+
     def traverse(self, operation: Operation):
-        class_name = camel_to_snake(type(operation).__name__)
+        if not self.iterative:
+            self.traverse_recursively(operation)
+            return
+
+        # The stack contains operations to traverse, paired with None, and
+        # operations whose nested operations were traversed, paired with
+        # their `visit_*` function.
+        stack: List[Tuple[Operation, Optional[Callable]]] = [(operation, None)]
+        while stack:
+            op, visit = stack.pop()
+            if visit is not None:
+                visit(self, op)
+                continue
+
+            traverse, visit = self.get_methods(type(op))
+            if traverse is not None:
+                traverse(self, op)
+                if visit is not None:
+                    visit(self, op)
+                continue
+
+            if visit is not None:
+                stack.append((op, visit))
+            for r in reversed(op.regions):
+                for b in reversed(r.blocks):
+                    stack.extend([(nested_op, None)
+                                  for nested_op in reversed(b.ops)])
+
+    def traverse_recursively(self, operation: Operation):
+        traverse, visit = self.get_methods(type(operation))
 
-        traverse = get_method(self, f"traverse_{class_name}")
         if traverse:
-            traverse(operation)
+            traverse(self, operation)
         else:
             for r in operation.regions:
                 for b in r.blocks:
                     for op in b.ops:
-                        self.traverse(op)
+                        self.traverse_recursively(op)
 
-        visit = get_method(self, f"visit_{class_name}")
         if visit:
-            visit(operation)
+            visit(self, operation)
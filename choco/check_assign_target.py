@@ -7,6 +7,24 @@ from choco.dialects.choco_ast import *
 from choco.semantic_error import SemanticError
 
 
+def check_assign(assign: Assign):
+    """
+    Check that the left-hand side of an assignment is either:
+        - a variable name; or
+        - an index expression.
+    """
+    assert len(assign.target.blocks) == 1
+    assert len(assign.target.blocks[0].ops) == 1
+    target_op = assign.target.blocks[0].ops[0]
+    if isinstance(target_op, ExprName):
+        return
+    if isinstance(target_op, IndexExpr):
+        return
+    raise SemanticError(
+        f'Found {type(target_op).__name__} as the left-hand side of an assignment. '
+        f'Expected to find variable name or index expression only.')
+
+
 def check_assign_target(_: MLContext, module: ModuleOp) -> ModuleOp:
     """
     Check that the left-hand side of an assignment is either:
@@ -18,16 +36,7 @@ def check_assign_target(_: MLContext, module: ModuleOp) -> ModuleOp:
     class AssignVisitor(Visitor):
 
         def visit_assign(self, assign: Assign):
-            assert len(assign.target.blocks) == 1
-            assert len(assign.target.blocks[0].ops) == 1
-            target_op = assign.target.blocks[0].ops[0]
-            if isinstance(target_op, ExprName):
-                return
-            if isinstance(target_op, IndexExpr):
-                return
-            raise SemanticError(
-                f'Found {type(target_op).__name__} as the left-hand side of an assignment. '
-                f'Expected to find variable name or index expression only.')
+            check_assign(assign)
 
     visitor = AssignVisitor()
     visitor.traverse(module)
@@ -6,38 +6,49 @@ from xdsl.dialects.builtin import StringAttr, ModuleOp, IntegerAttr
 from xdsl.ir import Operation, Attribute, ParametrizedAttribute, Region, Block, SSAValue, MLContext, OpResult
 from xdsl.printer import Printer
 
-from util.list_ops import flatten
 from choco.dialects import choco_flat, choco_ast, choco_type
+from choco.source_location import copy_location
+from choco.symbol_table import SymbolTable
 from choco.type_checking import join, Type, to_attribute
 from dataclasses import dataclass, field
-from typing import List, Optional, Tuple, Dict
+from typing import List, Optional, Tuple
 from choco.dialects.choco_flat import Assign, GetAddress, IndexString, ListExpr, Yield, Alloc, Store, Load, MemlocType
 
 
-@dataclass
-class SSAValueCtx:
+class SSAValueCtx(SymbolTable[SSAValue]):
     """
     Context that relates identifiers from the AST to SSA values used in the flat representation.
     """
-    dictionary: Dict[str, SSAValue] = field(default_factory=dict)
-    parent_scope: Optional[SSAValueCtx] = None
 
     def __getitem__(self, identifier: str) -> Optional[SSAValue]:
-        """Check if the given identifier is in the current scope, or a parent scope"""
-        ssa_value = self.dictionary.get(identifier, None)
-        if ssa_value:
-            return ssa_value
-        elif self.parent_scope:
-            return self.parent_scope[identifier]
-        else:
-            return None
+        """Get the SSA value of the identifier in the current scope, or a parent scope"""
+        return self.lookup(identifier)
 
     def __setitem__(self, identifier: str, ssa_value: SSAValue):
         """Relate the given identifier and SSA value in the current scope"""
-        if identifier in self.dictionary:
+        if self.is_bound_in_scope(identifier, self.current_scope):
             raise Exception()
         else:
-            self.dictionary[identifier] = ssa_value
+            self.bind(identifier, ssa_value)
+
+
+@dataclass
+class Emitter:
+    """
+    Appends the translated operations, in order, to the end of a block.
+    The translate functions emit their operations into the emitter instead of
+    returning lists of operations, so that the operations of a block are
+    collected in linear time.
+    """
+    block: Block = field(default_factory=Block)
+
+    def emit(self, op: Operation):
+        """Append op to the end of the block"""
+        self.block.add_op(op)
+
+    def to_region(self) -> Region:
+        """Get a region containing the block of the emitted operations"""
+        return Region.from_block_list([self.block])
 
 
 def choco_ast_to_choco_flat(ctx: MLContext, input_module: ModuleOp):
@@ -69,68 +80,62 @@ def move_free_ops_into_main(ctx: MLContext, module: ModuleOp):
 def translate_program(p: choco_ast.Program) -> ModuleOp:
     # create an empty global context
     global_ctx = SSAValueCtx()
+    emitter = Emitter()
     # first translate all var definitions
-    nested_var_defs: List[List[Operation]] = [
-        translate_def(global_ctx, op) for op in p.defs.ops
-        if isinstance(op, choco_ast.VarDef)
-    ]
+    for op in p.defs.ops:
+        if isinstance(op, choco_ast.VarDef):
+            translate_def(global_ctx, emitter, op)
     # then translate all func definitions
-    nested_func_defs: List[List[Operation]] = [
-        translate_def(global_ctx, op) for op in p.defs.ops
-        if isinstance(op, choco_ast.FuncDef)
-    ]
-    defs: List[Operation] = flatten(nested_var_defs) + flatten(
-        nested_func_defs)
+    for op in p.defs.ops:
+        if isinstance(op, choco_ast.FuncDef):
+            translate_def(global_ctx, emitter, op)
     # then translate all statements
-    nested_stms: List[List[Operation]] = [
-        translate_stmt(global_ctx, op) for op in p.stmts.blocks[0].ops
-    ]
-    stms: List[Operation] = flatten(nested_stms)
-    return ModuleOp.from_region_or_ops(defs + stms)
+    for op in p.stmts.blocks[0].ops:
+        translate_stmt(global_ctx, emitter, op)
+    return ModuleOp.from_region_or_ops(emitter.to_region())
 
 
-def translate_def_or_stmt(ctx: SSAValueCtx, op: Operation) -> List[Operation]:
+def translate_def_or_stmt(ctx: SSAValueCtx, emitter: Emitter, op: Operation):
     """
     Translate an operation that can either be a definition or statement
     """
     # first try to translate op as a definition:
-    #   if op is a definition this will return a list of translated Operations
-    ops = try_translate_def(ctx, op)
-    if ops is not None:
-        return ops
+    #   if op is a definition this will emit the translated Operations
+    if try_translate_def(ctx, emitter, op):
+        return
     # op has not been a definition, try to translate op as a statement:
-    #   if op is a statement this will return a list of translated Operations
-    ops = try_translate_stmt(ctx, op)
-    if ops is not None:
-        return ops
+    #   if op is a statement this will emit the translated Operations
+    if try_translate_stmt(ctx, emitter, op):
+        return
     # operation must have been translated by now
     raise Exception(f"Could not translate `{op}' as a definition or statement")
 
 
-def try_translate_def(ctx: SSAValueCtx,
-                      op: Operation) -> Optional[List[Operation]]:
+def try_translate_def(ctx: SSAValueCtx, emitter: Emitter,
+                      op: Operation) -> bool:
     """
     Tries to translate op as a definition.
-    Returns a list of the translated Operations if op is a definition, returns None otherwise.
+    Emits the translated Operations and returns True if op is a definition, returns False otherwise.
+    The translated Operations get the location of op.
     """
+    start = len(emitter.block.ops)
     if isinstance(op, choco_ast.FuncDef):
-        return [translate_fun_def(ctx, op)]
+        emitter.emit(translate_fun_def(ctx, op))
     elif isinstance(op, choco_ast.VarDef):
-        return translate_var_def(ctx, op)
+        translate_var_def(ctx, emitter, op)
     else:
-        return None
+        return False
+    copy_location(op, emitter.block.ops[start:])
+    return True
 
 
-def translate_def(ctx: SSAValueCtx, op: Operation) -> List[Operation]:
+def translate_def(ctx: SSAValueCtx, emitter: Emitter, op: Operation):
     """
     Translates op as a definition.
-    Returns a list of the translated Operations if op is a definition, fails otherwise.
+    Emits the translated Operations if op is a definition, fails otherwise.
     """
-    ops = try_translate_def(ctx, op)
-    if ops is None:
+    if not try_translate_def(ctx, emitter, op):
         raise Exception(f"Could not translate `{op}' as a definition")
-    else:
-        return ops
 
 
 def translate_fun_def(ctx: SSAValueCtx,
@@ -174,13 +179,12 @@ def translate_fun_def(ctx: SSAValueCtx,
         # store the passed parameter value into the allocated memory location
         store = Store.build(operands=[alloc, arg])
         block.add_ops([alloc, store])
-    c = SSAValueCtx(dictionary=dict(zip(param_names, reversed(allocs))),
-                    parent_scope=ctx)
-    block.add_ops(
-        flatten([
-            translate_def_or_stmt(c, op)
-            for op in fun_def.func_body.blocks[0].ops
-        ]))
+    ctx.enter_scope(dict(zip(param_names, reversed(allocs))))
+    # emit the translated body after the parameter stores
+    emitter = Emitter(block)
+    for op in fun_def.func_body.blocks[0].ops:
+        translate_def_or_stmt(ctx, emitter, op)
+    ctx.exit_scope()
     body.add_block(block)
 
     return choco_flat.FuncDef.create(attributes={
@@ -211,8 +215,8 @@ def try_translate_type(op: Operation) -> Optional[Attribute]:
     return None
 
 
-def translate_var_def(ctx: SSAValueCtx,
-                      var_def: choco_ast.VarDef) -> List[Operation]:
+def translate_var_def(ctx: SSAValueCtx, emitter: Emitter,
+                      var_def: choco_ast.VarDef):
     typed_var = var_def.typed_var.blocks[0].ops[0]
     assert isinstance(typed_var, choco_ast.TypedVar)
     var_name = typed_var.attributes["var_name"]
@@ -220,7 +224,7 @@ def translate_var_def(ctx: SSAValueCtx,
     type = try_translate_type(typed_var.type.blocks[0].ops[0])
     assert type is not None
 
-    init, init_name = translate_expr(ctx, var_def.literal.blocks[0].ops[0])
+    init_name = translate_expr(ctx, emitter, var_def.literal.blocks[0].ops[0])
     alloc = Alloc.build(attributes={"type": type},
                         result_types=[MemlocType([type])])
     store = Store.build(operands=[alloc, init_name])
@@ -228,63 +232,67 @@ def translate_var_def(ctx: SSAValueCtx,
     # relate variable identifier and SSA value by adding it into the current context
     ctx[var_name.data] = alloc.results[0]
 
-    return init + [alloc, store]
+    emitter.emit(alloc)
+    emitter.emit(store)
 
 
 def try_translate_expr(
     ctx: SSAValueCtx,
+    emitter: Emitter,
     op: Operation,
-) -> Optional[Tuple[List[Operation], SSAValue]]:
+) -> Optional[SSAValue]:
     """
     Tries to translate op as an expression.
-    If op is an expression, returns a list of the translated Operations
-    and the ssa value representing the translated expression.
+    If op is an expression, emits the translated Operations
+    and returns the ssa value representing the translated expression.
     Returns None otherwise.
     """
     if isinstance(op, choco_ast.Literal):
         op = translate_literal(op)
-        return [op], op.results[0]
+        emitter.emit(op)
+        return op.results[0]
     if isinstance(op, choco_ast.ExprName):
         ssa_value = ctx[op.id.data]  #type: ignore
         assert isinstance(ssa_value, SSAValue)
-        return [], ssa_value
+        return ssa_value
     if isinstance(op, choco_ast.UnaryExpr):
-        return translate_unary_expr(ctx, op)
+        return translate_unary_expr(ctx, emitter, op)
     if isinstance(op, choco_ast.BinaryExpr):
-        return translate_binary_expr(ctx, op)
+        return translate_binary_expr(ctx, emitter, op)
     if isinstance(op, choco_ast.CallExpr):
-        return translate_call_expr(ctx, op)
+        return translate_call_expr(ctx, emitter, op)
     if isinstance(op, choco_ast.IfExpr):
-        return translate_if_expr(ctx, op)
+        return translate_if_expr(ctx, emitter, op)
     if isinstance(op, choco_ast.ListExpr):
-        return translate_list_expr(ctx, op)
+        return translate_list_expr(ctx, emitter, op)
     if isinstance(op, choco_ast.IndexExpr):
-        return translate_index_expr(ctx, op)
+        return translate_index_expr(ctx, emitter, op)
 
     assert False, "Unknown Expression"
 
 
 def translate_expr(ctx: SSAValueCtx,
+                   emitter: Emitter,
                    op: Operation,
-                   add_load=True) -> Tuple[List[Operation], SSAValue]:
+                   add_load=True) -> SSAValue:
     """
     Translates op as an expression.
-    If op is an expression, returns a list of the translated Operations
-    and the ssa value representing the translated expression.
+    If op is an expression, emits the translated Operations
+    and returns the ssa value representing the translated expression.
     Fails otherwise.
     """
-    res = try_translate_expr(ctx, op)
-    if res is None:
+    ssa_value = try_translate_expr(ctx, emitter, op)
+    if ssa_value is None:
         raise Exception(f"Could not translate `{op}' as an expression")
     else:
-        ops, ssa_value = res
         if add_load and isinstance(ssa_value.typ, MemlocType):
             load = Load.build(
                 operands=[ssa_value.op],  #type: ignore
                 result_types=[ssa_value.typ.type])  #type: ignore
-            return ops + [load], load.result  #type: ignore
+            emitter.emit(load)
+            return load.result  #type: ignore
 
-        return ops, ssa_value
+        return ssa_value
 
 
 def translate_literal(op: choco_ast.Literal) -> Operation:
@@ -308,23 +316,29 @@ def translate_literal(op: choco_ast.Literal) -> Operation:
     raise Exception(f"Could not translate `{op}' as a literal")
 
 
-def translate_unary_expr(
-        ctx: SSAValueCtx,
-        unary_expr: choco_ast.UnaryExpr) -> Tuple[List[Operation], SSAValue]:
-    value, ssa_value = translate_expr(ctx, unary_expr.value.blocks[0].ops[0])
+def translate_unary_expr(ctx: SSAValueCtx, emitter: Emitter,
+                         unary_expr: choco_ast.UnaryExpr) -> SSAValue:
+    ssa_value = translate_expr(ctx, emitter,
+                               unary_expr.value.blocks[0].ops[0])
     attr = unary_expr.op
     assert isinstance(attr, Attribute)
     flat_unary_expr = choco_flat.UnaryExpr.create(attributes={"op": attr},
                                                   operands=[ssa_value],
                                                   result_types=[ssa_value.typ])
-    return value + [flat_unary_expr], flat_unary_expr.results[0]
+    emitter.emit(flat_unary_expr)
+    return flat_unary_expr.results[0]
+
 
+def translate_binary_expr(ctx: SSAValueCtx, emitter: Emitter,
+                          binary_expr: choco_ast.BinaryExpr) -> SSAValue:
+    # Special case when the binary operation has a different execution order:
+    # the operands are emitted into their own regions
+    is_effectful = binary_expr.op.data in ['or', 'and']  #type: ignore
+    lhs = Emitter() if is_effectful else emitter
+    rhs = Emitter() if is_effectful else emitter
 
-def translate_binary_expr(
-        ctx: SSAValueCtx,
-        binary_expr: choco_ast.BinaryExpr) -> Tuple[List[Operation], SSAValue]:
-    lhs, lhs_ssa_value = translate_expr(ctx, binary_expr.lhs.blocks[0].ops[0])
-    rhs, rhs_ssa_value = translate_expr(ctx, binary_expr.rhs.blocks[0].ops[0])
+    lhs_ssa_value = translate_expr(ctx, lhs, binary_expr.lhs.blocks[0].ops[0])
+    rhs_ssa_value = translate_expr(ctx, rhs, binary_expr.rhs.blocks[0].ops[0])
     result_type = rhs_ssa_value.typ
 
     # list append, lhs rhs different type -> object type
@@ -344,52 +358,49 @@ def translate_binary_expr(
     attr = binary_expr.op
     assert isinstance(attr, Attribute)
 
-    # Special case when the binary operation has a different execution order
-    if binary_expr.op.data in ['or', 'and']:  #type: ignore
-        lhs.append(Yield.get(lhs_ssa_value))
-        rhs.append(Yield.get(rhs_ssa_value))
+    if is_effectful:
+        lhs.emit(Yield.get(lhs_ssa_value))
+        rhs.emit(Yield.get(rhs_ssa_value))
         flat_binary_expr = choco_flat.EffectfulBinaryExpr.build(
             attributes={"op": attr},
-            regions=[lhs, rhs],
+            regions=[lhs.to_region(), rhs.to_region()],
             result_types=[result_type])
-        return [flat_binary_expr], flat_binary_expr.results[0]
+        emitter.emit(flat_binary_expr)
+        return flat_binary_expr.results[0]
 
     flat_binary_expr = choco_flat.BinaryExpr.create(
         attributes={"op": attr},
         operands=[lhs_ssa_value, rhs_ssa_value],
         result_types=[result_type])
-    return lhs + rhs + [flat_binary_expr], flat_binary_expr.results[0]
+    emitter.emit(flat_binary_expr)
+    return flat_binary_expr.results[0]
 
 
-def translate_if_expr(
-        ctx: SSAValueCtx,
-        if_expr: choco_ast.IfExpr) -> Tuple[List[Operation], SSAValue]:
-    cond, cond_name = translate_expr(ctx, if_expr.cond.blocks[0].ops[0])
-    then, then_name = translate_expr(ctx, if_expr.then.blocks[0].ops[0])
-    or_else, or_else_name = translate_expr(ctx,
-                                           if_expr.or_else.blocks[0].ops[0])
+def translate_if_expr(ctx: SSAValueCtx, emitter: Emitter,
+                      if_expr: choco_ast.IfExpr) -> SSAValue:
+    cond_name = translate_expr(ctx, emitter, if_expr.cond.blocks[0].ops[0])
+    then = Emitter()
+    then_name = translate_expr(ctx, then, if_expr.then.blocks[0].ops[0])
+    or_else = Emitter()
+    or_else_name = translate_expr(ctx, or_else,
+                                  if_expr.or_else.blocks[0].ops[0])
 
-    then.append(choco_flat.Yield.build(operands=[then_name]))
-    or_else.append(choco_flat.Yield.build(operands=[or_else_name]))
+    then.emit(choco_flat.Yield.build(operands=[then_name]))
+    or_else.emit(choco_flat.Yield.build(operands=[or_else_name]))
     flat_if_expr = choco_flat.IfExpr.create(
         operands=[cond_name],
-        regions=[
-            Region.from_operation_list(then),
-            Region.from_operation_list(or_else)
-        ],
+        regions=[then.to_region(), or_else.to_region()],
         result_types=[then_name.typ])
-    return cond + [flat_if_expr], flat_if_expr.results[0]
+    emitter.emit(flat_if_expr)
+    return flat_if_expr.results[0]
 
 
-def translate_list_expr(
-        ctx: SSAValueCtx,
-        list_expr: choco_ast.ListExpr) -> Tuple[List[Operation], SSAValue]:
-    ops: List[Operation] = []
-    ops_names: List[SSAValue] = []
-    for region in list_expr.elems.blocks[0].ops:
-        op, op_name = translate_expr(ctx, region)
-        ops += op
-        ops_names.append(op_name)
+def translate_list_expr(ctx: SSAValueCtx, emitter: Emitter,
+                        list_expr: choco_ast.ListExpr) -> SSAValue:
+    ops_names: List[SSAValue] = [
+        translate_expr(ctx, emitter, op)
+        for op in list_expr.elems.blocks[0].ops
+    ]
 
     if len(ops_names) > 0:
         res_type = Type.from_attribute(ops_names[0].typ)
@@ -400,14 +411,16 @@ def translate_list_expr(
         result_type = choco_type.empty_type
     flat_list_expr = choco_flat.ListExpr.create(operands=ops_names,
                                                 result_types=[result_type])
-    return ops + [flat_list_expr], flat_list_expr.results[0]
+    emitter.emit(flat_list_expr)
+    return flat_list_expr.results[0]
 
 
-def translate_index_expr(
-        ctx: SSAValueCtx,
-        index_expr: choco_ast.IndexExpr) -> Tuple[List[Operation], SSAValue]:
-    value, value_name = translate_expr(ctx, index_expr.value.blocks[0].ops[0])
-    index, index_name = translate_expr(ctx, index_expr.index.blocks[0].ops[0])
+def translate_index_expr(ctx: SSAValueCtx, emitter: Emitter,
+                         index_expr: choco_ast.IndexExpr) -> SSAValue:
+    value_name = translate_expr(ctx, emitter,
+                                index_expr.value.blocks[0].ops[0])
+    index_name = translate_expr(ctx, emitter,
+                                index_expr.index.blocks[0].ops[0])
     assert isinstance(value_name.typ, ParametrizedAttribute)
 
     ty = value_name.typ
@@ -428,19 +441,16 @@ def translate_index_expr(
     else:
         raise Exception("Unknown type for the value of index expression")
 
-    return value + index + [address], address.results[0]
-
+    emitter.emit(address)
+    return address.results[0]
 
-def translate_call_expr(
-        ctx: SSAValueCtx,
-        call_expr: choco_ast.CallExpr) -> Tuple[List[Operation], SSAValue]:
-    ops: List[Operation] = []
-    args: List[SSAValue] = []
 
-    for arg in call_expr.args.blocks[0].ops:
-        op, arg = translate_expr(ctx, arg)
-        ops += op
-        args.append(arg)
+def translate_call_expr(ctx: SSAValueCtx, emitter: Emitter,
+                        call_expr: choco_ast.CallExpr) -> SSAValue:
+    args: List[SSAValue] = [
+        translate_expr(ctx, emitter, arg)
+        for arg in call_expr.args.blocks[0].ops
+    ]
 
     name = call_expr.attributes["func"]
     #print((call_expr))
@@ -448,70 +458,71 @@ def translate_call_expr(
         attributes={"func_name": name},
         operands=args,
         result_types=[call_expr.attributes["type_hint"]])
-    ops.append(call)
-    return ops, call.results[0]
+    emitter.emit(call)
+    return call.results[0]
 
 
 # This function could be avoided if we could remove the result type via rewriting in a separate pass
-def translate_call_expr_stmt(ctx: SSAValueCtx,
-                             call_expr: choco_ast.CallExpr) -> List[Operation]:
-    ops: List[Operation] = []
-    args: List[SSAValue] = []
-
-    for arg in call_expr.args.blocks[0].ops:
-        op, arg = translate_expr(ctx, arg)
-        ops += op
-        args.append(arg)
+def translate_call_expr_stmt(ctx: SSAValueCtx, emitter: Emitter,
+                             call_expr: choco_ast.CallExpr):
+    args: List[SSAValue] = [
+        translate_expr(ctx, emitter, arg)
+        for arg in call_expr.args.blocks[0].ops
+    ]
 
     name = call_expr.attributes["func"]
     call = choco_flat.CallExpr.create(attributes={"func_name": name},
                                       operands=args)
-    ops.append(call)
-    return ops
+    emitter.emit(call)
 
 
-def try_translate_stmt(ctx: SSAValueCtx,
-                       op: Operation) -> Optional[List[Operation]]:
+def try_translate_stmt(ctx: SSAValueCtx, emitter: Emitter,
+                       op: Operation) -> bool:
     """
     Tries to translate op as a statement.
-    If op is an expression, returns a list of the translated Operations.
-    Returns None otherwise.
+    If op is a statement, emits the translated Operations and returns True.
+    Returns False otherwise.
+    The translated Operations get the location of op.
     """
+    start = len(emitter.block.ops)
     if isinstance(op, choco_ast.Assign):
-        return translate_assign(ctx, op)
-    if isinstance(op, choco_ast.Return):
-        return translate_return(ctx, op)
-    if isinstance(op, choco_ast.CallExpr):
-        return translate_call_expr_stmt(ctx, op)
-    if isinstance(op, choco_ast.Pass):
-        return translate_pass(ctx, op)
-    if isinstance(op, choco_ast.If):
-        return translate_if(ctx, op)
-    if isinstance(op, choco_ast.While):
-        return translate_while(ctx, op)
-    if isinstance(op, choco_ast.For):
-        return translate_for(ctx, op)
-    if isinstance(op, choco_ast.GlobalDecl):
-        return translate_global_decl(ctx, op)
-
-    res = try_translate_expr(ctx, op)
-    if res is None:
-        return None
-    else:
-        return res[0]
-
-
-def translate_stmt(ctx: SSAValueCtx, op: Operation) -> List[Operation]:
+        translate_assign(ctx, emitter, op)
+    elif isinstance(op, choco_ast.Return):
+        translate_return(ctx, emitter, op)
+    elif isinstance(op, choco_ast.CallExpr):
+        translate_call_expr_stmt(ctx, emitter, op)
+    elif isinstance(op, choco_ast.Pass):
+        translate_pass(ctx, emitter, op)
+    elif isinstance(op, choco_ast.If):
+        translate_if(ctx, emitter, op)
+    elif isinstance(op, choco_ast.While):
+        translate_while(ctx, emitter, op)
+    elif isinstance(op, choco_ast.For):
+        translate_for(ctx, emitter, op)
+    elif isinstance(op, choco_ast.GlobalDecl):
+        translate_global_decl(ctx, emitter, op)
+    elif try_translate_expr(ctx, emitter, op) is None:
+        return False
+    copy_location(op, emitter.block.ops[start:])
+    return True
+
+
+def translate_stmt(ctx: SSAValueCtx, emitter: Emitter, op: Operation):
     """
     Translates op as a statement.
-    If op is an expression, returns a list of the translated Operations.
+    If op is a statement, emits the translated Operations.
     Fails otherwise.
     """
-    ops = try_translate_stmt(ctx, op)
-    if ops is None:
+    if not try_translate_stmt(ctx, emitter, op):
         raise Exception(f"Could not translate `{op}' as a statement")
-    else:
-        return ops
+
+
+def translate_stmts(ctx: SSAValueCtx, block: Block) -> Region:
+    """Translates the statements of block into a new region."""
+    emitter = Emitter()
+    for op in block.ops:
+        translate_stmt(ctx, emitter, op)
+    return emitter.to_region()
 
 
 def split_multi_assign(
@@ -523,98 +534,76 @@ def split_multi_assign(
     return [assign.target.op], assign.value.op
 
 
-def translate_assign(ctx: SSAValueCtx,
-                     assign: choco_ast.Assign) -> List[Operation]:
+def translate_assign(ctx: SSAValueCtx, emitter: Emitter,
+                     assign: choco_ast.Assign):
     targets, value = split_multi_assign(assign)
-    value_flat, value_var = translate_expr(ctx, value)
-    translated_targets = [
-        translate_expr(ctx, target, add_load=False) for target in targets
-    ]
-    target_ops: List[Operation] = []
-    for target_flat, target_var in translated_targets:
+    value_var = translate_expr(ctx, emitter, value)
+    for target in targets:
+        target_var = translate_expr(ctx, emitter, target, add_load=False)
         assert isinstance(target_var.typ, MemlocType)
-        target_ops += target_flat
-        target_ops.append(Store.build(operands=[target_var, value_var]))
+        emitter.emit(Store.build(operands=[target_var, value_var]))
 
-    return value_flat + target_ops
 
-
-def translate_return(ctx: SSAValueCtx,
-                     ret: choco_ast.Return) -> List[Operation]:
+def translate_return(ctx: SSAValueCtx, emitter: Emitter,
+                     ret: choco_ast.Return):
     ops = ret.value.blocks[0].ops
     if len(ops) == 0:
         none = choco_flat.Literal.create(
             attributes={"value": choco_flat.NoneAttr()},
             result_types=[choco_type.none_type])
-        return [none, choco_flat.Return.create(operands=[none.results[0]])]
-
-    value, value_name = translate_expr(ctx, ops[0])
-    return value + [choco_flat.Return.create(operands=[value_name])]
-
+        emitter.emit(none)
+        emitter.emit(choco_flat.Return.create(operands=[none.results[0]]))
+        return
 
-def translate_pass(ctx: SSAValueCtx,
-                   pass_stmt: choco_ast.Pass) -> List[Operation]:
-    return []
+    value_name = translate_expr(ctx, emitter, ops[0])
+    emitter.emit(choco_flat.Return.create(operands=[value_name]))
 
 
-def translate_if(ctx: SSAValueCtx, if_stmt: choco_ast.If) -> List[Operation]:
-    cond, cond_name = translate_expr(ctx, if_stmt.cond.blocks[0].ops[0])
+def translate_pass(ctx: SSAValueCtx, emitter: Emitter,
+                   pass_stmt: choco_ast.Pass):
+    pass
 
-    ops: List[Operation] = []
-    for op in if_stmt.then.blocks[0].ops:
-        stmt_ops = translate_stmt(ctx, op)
-        ops += stmt_ops
-    then = Region.from_operation_list(ops)
 
-    ops: List[Operation] = []
-    for op in if_stmt.orelse.blocks[0].ops:
-        stmt_ops = translate_stmt(ctx, op)
-        ops += stmt_ops
-    orelse = Region.from_operation_list(ops)
+def translate_if(ctx: SSAValueCtx, emitter: Emitter, if_stmt: choco_ast.If):
+    cond_name = translate_expr(ctx, emitter, if_stmt.cond.blocks[0].ops[0])
+    then = translate_stmts(ctx, if_stmt.then.blocks[0])
+    orelse = translate_stmts(ctx, if_stmt.orelse.blocks[0])
 
     new_op = choco_flat.If.build(operands=[cond_name], regions=[then, orelse])
-    return cond + [new_op]
+    emitter.emit(new_op)
 
 
-def translate_while(ctx: SSAValueCtx,
-                    while_stmt: choco_ast.While) -> List[Operation]:
-    ops: List[Operation] = []
-    stmt_ops, stmt_name = translate_expr(ctx, while_stmt.cond.ops[0])
-    stmt_ops.append(choco_flat.Yield.build(operands=[stmt_name]))
-    cond = Region.from_operation_list(stmt_ops)
+def translate_while(ctx: SSAValueCtx, emitter: Emitter,
+                    while_stmt: choco_ast.While):
+    cond_emitter = Emitter()
+    stmt_name = translate_expr(ctx, cond_emitter, while_stmt.cond.ops[0])
+    cond_emitter.emit(choco_flat.Yield.build(operands=[stmt_name]))
+    cond = cond_emitter.to_region()
 
-    ops: List[Operation] = []
-    for op in while_stmt.body.blocks[0].ops:
-        stmt_ops = translate_stmt(ctx, op)
-        ops += stmt_ops
-    body = Region.from_operation_list(ops)
+    body = translate_stmts(ctx, while_stmt.body.blocks[0])
 
     new_op = choco_flat.While.build(operands=[], regions=[cond, body])
-    return [new_op]
+    emitter.emit(new_op)
 
 
-def translate_for(ctx: SSAValueCtx,
-                  for_stmt: choco_ast.For) -> List[Operation]:
-    target, target_name = translate_expr(ctx, for_stmt.iter.blocks[0].ops[0])
+def translate_for(ctx: SSAValueCtx, emitter: Emitter,
+                  for_stmt: choco_ast.For):
+    target_name = translate_expr(ctx, emitter,
+                                 for_stmt.iter.blocks[0].ops[0])
 
-    ops: List[Operation] = []
-    for op in for_stmt.body.blocks[0].ops:
-        stmt_ops = translate_stmt(ctx, op)
-        ops += stmt_ops
-    body = Region.from_operation_list(ops)
+    body = translate_stmts(ctx, for_stmt.body.blocks[0])
 
     iterator = ctx[for_stmt.iter_name.data]  #type: ignore
     new_op = choco_flat.For.build(operands=[iterator, target_name],
                                   regions=[body])
-    return target + [new_op]
+    emitter.emit(new_op)
 
 
-def translate_global_decl(
-        ctx: SSAValueCtx,
-        global_decl: choco_ast.GlobalDecl) -> List[Operation]:
+def translate_global_decl(ctx: SSAValueCtx, emitter: Emitter,
+                          global_decl: choco_ast.GlobalDecl):
     # Global declarations have no use in the flat IR. They are used to
     # communicate the programmers intention to write to global variables.
     # In the IR, this fact is already communicated by the presence of
     # writes to such varibables and does not require a redundant
     # encoding that is purely meant to catch programming errors.
-    return []
+    pass
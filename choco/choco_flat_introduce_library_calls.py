@@ -16,6 +16,7 @@ from xdsl.pattern_rewriter import RewritePattern, PatternRewriter, PatternRewrit
 from typing import Dict, List, Tuple, Optional
 
 from choco.dialects.choco_type import ListType, int_type, str_type, bool_type, none_type
+from choco.source_location import LocatedPattern
 
 
 @dataclass(eq=False)
@@ -103,10 +104,11 @@ class BinaryExprPattern(RewritePattern):
 
 
 def choco_flat_introduce_library_calls(ctx: MLContext, op: ModuleOp):
-    walker = PatternRewriteWalker(GreedyRewritePatternApplier([
-        CallExprPattern(ctx),
-        BinaryExprPattern(ctx),
-    ]),
+    walker = PatternRewriteWalker(LocatedPattern(
+        GreedyRewritePatternApplier([
+            CallExprPattern(ctx),
+            BinaryExprPattern(ctx),
+        ])),
                                   apply_recursively=False)
 
     walker.rewrite_module(op)
@@ -5,6 +5,7 @@ Email: tutorcs@163.com
 
 from choco.dialects.choco_flat import *
 from riscv.ssa_dialect import *
+from choco.source_location import LocatedPattern
 
 from dataclasses import dataclass, field
 from xdsl.printer import Printer
@@ -193,25 +194,26 @@ class ReturnPattern(RewritePattern):
 
 
 def choco_flat_to_riscv_ssa(ctx: MLContext, op: ModuleOp):
-    walker = PatternRewriteWalker(GreedyRewritePatternApplier([
-        LiteralPattern(),
-        CallPattern(),
-        UnaryExprPattern(),
-        BinaryExprPattern(),
-        StorePattern(),
-        LoadPattern(),
-        AllocPattern(),
-        IfPattern(),
-        AndPattern(),
-        OrPattern(),
-        IfExprPattern(),
-        WhilePattern(),
-        ListExprPattern(),
-        GetAddressPattern(),
-        IndexStringPattern(),
-        FuncDefPattern(),
-        ReturnPattern(),
-    ]),
+    walker = PatternRewriteWalker(LocatedPattern(
+        GreedyRewritePatternApplier([
+            LiteralPattern(),
+            CallPattern(),
+            UnaryExprPattern(),
+            BinaryExprPattern(),
+            StorePattern(),
+            LoadPattern(),
+            AllocPattern(),
+            IfPattern(),
+            AndPattern(),
+            OrPattern(),
+            IfExprPattern(),
+            WhilePattern(),
+            ListExprPattern(),
+            GetAddressPattern(),
+            IndexStringPattern(),
+            FuncDefPattern(),
+            ReturnPattern(),
+        ])),
                                   apply_recursively=True)
 
     walker.rewrite_module(op)
@@ -0,0 +1,216 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+from __future__ import annotations
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Directories whose sources determine the output of choco-opt
+compiler_source_dirs = ['choco', 'riscv', 'tools', 'util']
+
+default_max_size = 64 * 1024 * 1024
+
+entry_suffix = '.json'
+
+_compiler_version: Optional[str] = None
+
+
+def compiler_version() -> str:
+    """
+    Get a version identifying the compiler: the hash of the compiler sources
+    and of the version of xDSL.
+    """
+    global _compiler_version
+    if _compiler_version is not None:
+        return _compiler_version
+    from importlib import metadata
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha256()
+    try:
+        h.update(metadata.version('xdsl').encode())
+    except metadata.PackageNotFoundError:
+        pass
+    for source_dir in compiler_source_dirs:
+        for dir_path, dir_names, file_names in os.walk(
+                os.path.join(root, source_dir)):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if not file_name.endswith('.py'):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                h.update(os.path.relpath(path, root).encode())
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+    _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+@dataclass
+class CacheEntry:
+    """
+    The cached result of compiling a program.
+    `output` is the printed program, or the printed diagnostic if
+    `is_diagnostic` is set. `flat_ir` is the choco_flat IR, if it was stored.
+    """
+    output: str
+    is_diagnostic: bool = False
+    flat_ir: Optional[str] = None
+
+
+@dataclass
+class CompileCache:
+    """
+    On-disk cache of compilation results, addressed by the hash of the
+    source, the options it is compiled with and the compiler version.
+
+    Each entry is a file in `directory`, whose modification time is updated
+    on every hit. The `stats.json` file of the directory keeps the total size
+    of the entries, and when it exceeds `max_size` bytes, the least recently
+    used entries are evicted. It also keeps the hit, miss and eviction
+    counts, the hits and misses being counted in memory until
+    `flush_stats` is called.
+    """
+    directory: str
+    max_size: int = default_max_size
+    stats_path: str = field(init=False)
+    lock_path: str = field(init=False)
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.stats_path = os.path.join(self.directory, 'stats.json')
+        self.lock_path = os.path.join(self.directory, 'stats.lock')
+
+    @staticmethod
+    def key(source: bytes, options: Dict[str, str]) -> str:
+        """Get the key of the result of compiling source with options"""
+        h = hashlib.sha256()
+        h.update(compiler_version().encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        h.update(source)
+        return h.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + entry_suffix)
+
+    def get(self,
+            key: str,
+            with_flat_ir: bool = False) -> Optional[CacheEntry]:
+        """
+        Get the entry of key, or None if it is not cached. If `with_flat_ir`
+        is set, an entry stored without the choco_flat IR is also a miss,
+        unless it is a diagnostic.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path) as f:
+                entry = CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        if with_flat_ir and entry.flat_ir is None and not entry.is_diagnostic:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        """Store the entry of key, then evict entries to fit in max_size"""
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so that concurrent compilations
+        # never read a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry.__dict__, f)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        self.update_stats(size=size)
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """Get the (last use, size, path) of all entries"""
+        entries: List[Tuple[float, int, str]] = []
+        for dir_entry in os.scandir(self.directory):
+            if not dir_entry.is_dir():
+                continue
+            for entry in os.scandir(dir_entry.path):
+                if not entry.name.endswith(entry_suffix):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self) -> Tuple[int, int]:
+        """
+        Remove the least recently used entries exceeding max_size, returning
+        the size of the remaining entries and the number of evictions.
+        """
+        entries = self.entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        evictions = 0
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                evictions += 1
+            except OSError:
+                pass
+            size -= entry_size
+        return size, evictions
+
+    def flush_stats(self):
+        """Add the hits and misses counted so far to the statistics"""
+        if self.hits or self.misses:
+            self.update_stats(hits=self.hits, misses=self.misses)
+            self.hits = self.misses = 0
+
+    def update_stats(self, **counts: int):
+        """
+        Add counts to the statistics of the cache, evicting entries if the
+        total size of the entries exceeds max_size.
+        """
+        with open(self.lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self.read_stats()
+            for name, count in counts.items():
+                stats[name] = stats.get(name, 0) + count
+            if stats.get('size', 0) > self.max_size:
+                stats['size'], evictions = self.evict()
+                stats['evictions'] = stats.get('evictions', 0) + evictions
+            with open(self.stats_path, 'w') as f:
+                json.dump(stats, f)
+
+    def read_stats(self) -> Dict[str, int]:
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def stats(self) -> Dict[str, int]:
+        """Get the hit, miss and eviction counts, and the current entries"""
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0}
+        stats.update(self.read_stats())
+        entries = self.entries()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(entry_size for _, entry_size, _ in entries)
+        return stats
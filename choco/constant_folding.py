@@ -11,6 +11,7 @@ from xdsl.pattern_rewriter import (GreedyRewritePatternApplier,
 
 from choco.dialects.choco_flat import *
 from choco.dialects.choco_type import *
+from choco.source_location import LocatedPattern
 
 
 @dataclass
@@ -35,9 +36,9 @@ class BinaryExprRewriter(RewritePattern):
 
 def choco_flat_constant_folding(ctx: MLContext, module: ModuleOp) -> ModuleOp:
     walker = PatternRewriteWalker(
-        GreedyRewritePatternApplier([
+        LocatedPattern(GreedyRewritePatternApplier([
             BinaryExprRewriter(),
-        ]))
+        ])))
 
     walker.rewrite_module(module)
 
@@ -9,6 +9,7 @@ from xdsl.pattern_rewriter import (GreedyRewritePatternApplier,
                                    RewritePattern, op_type_rewrite_pattern)
 
 from choco.dialects.choco_flat import *
+from choco.source_location import LocatedPattern
 
 
 @dataclass
@@ -114,9 +115,10 @@ class ForLoopRewriter(RewritePattern):
 
 
 def for_to_while(ctx: MLContext, module: ModuleOp) -> ModuleOp:
-    walker = PatternRewriteWalker(GreedyRewritePatternApplier([
-        ForLoopRewriter(),
-    ]),
+    walker = PatternRewriteWalker(LocatedPattern(
+        GreedyRewritePatternApplier([
+            ForLoopRewriter(),
+        ])),
                                   apply_recursively=False)
     walker.rewrite_module(module)
 
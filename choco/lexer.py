@@ -5,7 +5,10 @@ from io import TextIOBase, IOBase
 from enum import Enum, auto
 from dataclasses import dataclass
 
-from typing import Any, List, Union, Optional
+from typing import Any, Deque, Union, Optional, Pattern, Tuple
+from collections import deque
+from itertools import islice
+import re
 
 
 class TokenKind(Enum):
@@ -85,6 +88,8 @@ class Token:
     kind: TokenKind
     value: Any = None
     column: int = -1
+    # The line of the token, counted from zero like the column.
+    line: int = -1
 
     def __repr__(self) -> str:
         if self.value is None and self.column < 0:
@@ -106,6 +111,9 @@ class Token:
 
 class Scanner:
 
+    block_size = 1 << 16
+    """The number of characters read from the input stream at once."""
+
     def __init__(self, stream: TextIOBase):
         """ Create a new scanner.
 
@@ -124,7 +132,42 @@ class Scanner:
         self.stream: TextIOBase = stream
         self.buffer: Optional[str] = None  # A buffer of one character.
         self.column: int = -1  # The "tip" of the scanner, i.e. how far inside the line_buffer are we.
-        self.line_buffer: str = ''
+        self.text: str = ''  # The characters read from the input stream and not yet discarded.
+        self.pos: int = 0  # The index in `text` of the next character to read.
+        self.eof: bool = False  # Whether the whole input stream was read.
+        # The line buffer is `line_prefix` followed by the characters of `text`
+        # between `line_start` and `pos`. It is only built when requested.
+        self.line_prefix: str = ''
+        self.line_start: int = 0
+
+    @property
+    def line_buffer(self) -> str:
+        """ The characters read since the line buffer was last reset. """
+        return self.line_prefix + self.text[self.line_start:self.pos]
+
+    @line_buffer.setter
+    def line_buffer(self, line: str):
+        self.line_prefix = line
+        self.line_start = self.pos
+
+    def fill(self) -> bool:
+        """ Read the next block of the input stream.
+
+        The characters before the line buffer are discarded.
+        :return: False if the end of the stream was reached, True otherwise.
+        """
+        if self.eof:
+            return False
+        block = self.stream.read(self.block_size)
+        if not block:
+            self.eof = True
+            return False
+        # Keep the line buffer and the character in the one-character buffer.
+        keep = max(0, min(self.line_start, self.pos - 1))
+        self.text = self.text[keep:] + block
+        self.pos -= keep
+        self.line_start -= keep
+        return True
 
     def peek(self) -> str:
         """ Return the next character from input without consuming it.
@@ -147,17 +190,44 @@ class Scanner:
             c = self.buffer
             self.buffer = None
             return c
-        c = self.stream.read(1)
         self.column += 1
-        self.line_buffer += c
+        if self.pos == len(self.text) and not self.fill():
+            return ''
+        c = self.text[self.pos]
+        self.pos += 1
         return c
 
+    def consume_match(self, pattern: Pattern[str]) -> str:
+        """ Consume the longest sequence of characters matching a pattern.
+
+        :param pattern: A regular expression that never matches across a line break.
+        :return: The consumed characters.
+        """
+        # The buffered character, if any, was already read from `text`.
+        start = self.pos - 1 if self.buffer else self.pos
+        match = pattern.match(self.text, start)
+        while match.end() == len(self.text) and self.fill():
+            start = self.pos - 1 if self.buffer else self.pos
+            match = pattern.match(self.text, start)
+        end = match.end()
+        if end < self.pos:
+            # Nothing was matched, keep the buffered character.
+            return ''
+        self.column += end - self.pos
+        self.pos = end
+        self.buffer = None
+        return match.group()
+
+
+comment_pattern = re.compile(r'[^\n\r]*')
+identifier_pattern = re.compile(r'\w+')
+
 
 class Tokenizer:
 
     def __init__(self, scanner: Scanner):
         self.scanner = scanner
-        self.buffer: List[Token] = []  # A buffer of tokens
+        self.buffer: Deque[Token] = deque()  # A buffer of tokens
         self.line_number = 0
         self.is_new_line = True
         self.is_logical_line = False
@@ -165,30 +235,50 @@ class Tokenizer:
         # Resets after every end-of-line sequence.
         self.indent_stack = [0]
 
-    def peek(self, k: int = 1) -> Union[Token, List[Token]]:
+    def fill(self, k: int):
+        """ Fill the buffer of tokens up to `k` tokens, if needed. """
+        if not self.buffer:
+            self.buffer.append(self.scan())
+        for _ in range(k - len(self.buffer)):
+            self.buffer.append(self.scan(keep_buffer=True))
+
+    def scan(self, keep_buffer: bool = False) -> Token:
+        """ Scan the next token of the input, recording the line it starts on. """
+        token = self.consume(keep_buffer)
+        token.line = self.line_number
+        # The line number was already incremented by the end of the line.
+        if token.kind == TokenKind.NEWLINE:
+            token.line -= 1
+        return token
+
+    def peek(self, k: int = 1) -> Union[Token, Tuple[Token, ...]]:
         """ Peeks through the next `k` number of tokens.
 
         This functions looks ahead the next `k` number of tokens,
-        and returns them as a list.
+        and returns them as a tuple.
         It uses a FIFO buffer to store tokens temporarily.
         :param k: number of tokens
-        :return: one token or a list of tokens
+        :return: one token or a tuple of tokens
         """
-        if not self.buffer:
-            self.buffer = [self.consume()]
-
-        # Fill the buffer up to `k` tokens, if needed.
-        buffer_size = len(self.buffer)
-        if buffer_size < k:
-            for _ in list(range(k - buffer_size)):
-                self.buffer.append(self.consume(keep_buffer=True))
+        self.fill(k)
 
         # If you need only one token, return it as an element,
-        # not as a list with one element.
+        # not as a tuple with one element.
         if k == 1:
             return self.buffer[0]
 
-        return self.buffer[0:k]
+        return tuple(islice(self.buffer, k))
+
+    def lookahead(self, i: int) -> Token:
+        """ Return the token `i` positions ahead, without consuming any token.
+
+        `lookahead(0)` is the same as `peek()`.
+        :param i: the position of the token, starting from 0
+        :return: one token
+        """
+        if len(self.buffer) <= i:
+            self.fill(i + 1)
+        return self.buffer[i]
 
     def consume(self, keep_buffer: bool = False) -> Token:
         """ Consumes one token and implements peeking through the next one.
@@ -201,9 +291,7 @@ class Tokenizer:
         :return: one token
         """
         if self.buffer and not keep_buffer:
-            c = self.buffer[0]
-            self.buffer = self.buffer[1:]
-            return c
+            return self.buffer.popleft()
 
         # If we just switched line, flush the buffer.
         if self.is_new_line and not self.is_logical_line:
@@ -248,10 +336,8 @@ class Tokenizer:
             # get_char() returns None in the case of EOF.
             elif c == '#':
                 self.scanner.consume()
+                self.scanner.consume_match(comment_pattern)
                 c = self.scanner.peek()
-                while c and c != '\n' and c != '\r':
-                    self.scanner.consume()
-                    c = self.scanner.peek()
                 self.scanner.line_buffer = ''
                 continue
             # Indentation
@@ -362,11 +448,8 @@ class Tokenizer:
                 return Token(TokenKind.COMMA, ',', col)
             # Identifier: [a-zA-Z_][a-zA-Z0-9_]*
             elif c.isalpha() or c == '_':
-                name = self.scanner.consume()
-                c = self.scanner.peek()
-                while c.isalnum() or c == '_':
-                    name += self.scanner.consume()
-                    c = self.scanner.peek()
+                name = self.scanner.consume_match(identifier_pattern)
+                self.scanner.peek()
 
                 if name == 'class':
                     return Token(TokenKind.CLASS, 'class', col)
@@ -471,14 +554,168 @@ class Tokenizer:
                 raise Exception("Invalid character detected: '" + c + "'")
 
 
+# A token preceded by blanks, as recognized by the regex tokenizer.
+# Alternatives are tried in order, so two-character symbols come before their
+# one-character prefixes.
+token_pattern = re.compile(r'''
+    [^\S\n\r]*
+    (
+        [a-zA-Z_]\w*
+      | [0-9]+
+      | "(?:[ !#-\[\]-~]|\\[nt"\\])*"
+      | -> | == | <= | >= | // | !=
+      | [-+*%=<>():\[\],]
+    )
+''', re.VERBOSE)
+
+escape_pattern = re.compile(r'\\(.)')
+escaped_chars = {'n': '\n', 't': '\t', '"': '"', '\\': '\\'}
+
+token_kinds = {
+    'class': TokenKind.CLASS,
+    'def': TokenKind.DEF,
+    'global': TokenKind.GLOBAL,
+    'nonlocal': TokenKind.NONLOCAL,
+    'if': TokenKind.IF,
+    'elif': TokenKind.ELIF,
+    'else': TokenKind.ELSE,
+    'while': TokenKind.WHILE,
+    'for': TokenKind.FOR,
+    'in': TokenKind.IN,
+    'None': TokenKind.NONE,
+    'True': TokenKind.TRUE,
+    'False': TokenKind.FALSE,
+    'pass': TokenKind.PASS,
+    'or': TokenKind.OR,
+    'and': TokenKind.AND,
+    'not': TokenKind.NOT,
+    'is': TokenKind.IS,
+    'object': TokenKind.OBJECT,
+    'int': TokenKind.INT,
+    'bool': TokenKind.BOOL,
+    'str': TokenKind.STR,
+    'return': TokenKind.RETURN,
+    '+': TokenKind.PLUS,
+    '-': TokenKind.MINUS,
+    '*': TokenKind.MUL,
+    '//': TokenKind.DIV,
+    '%': TokenKind.MOD,
+    '=': TokenKind.ASSIGN,
+    '(': TokenKind.LROUNDBRACKET,
+    ')': TokenKind.RROUNDBRACKET,
+    ':': TokenKind.COLON,
+    '[': TokenKind.LSQUAREBRACKET,
+    ']': TokenKind.RSQUAREBRACKET,
+    ',': TokenKind.COMMA,
+    '->': TokenKind.RARROW,
+    '==': TokenKind.EQ,
+    '!=': TokenKind.NE,
+    '<': TokenKind.LT,
+    '>': TokenKind.GT,
+    '<=': TokenKind.LE,
+    '>=': TokenKind.GE,
+}
+"""The kind of the keywords and symbols."""
+
+lookahead_tokens = {'-', '=', '<', '>'}
+"""
+The symbols after which the handwritten tokenizer peeks the next character,
+to check if they are the prefix of a two-character symbol. It also peeks the
+character following identifiers, keywords and integers.
+"""
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    A tokenizer recognizing the tokens in the middle of a line with a single
+    regular expression. Indentation, line ends, comments, tokens at the end
+    of a block of input and malformed tokens are left to the handwritten
+    tokenizer, so both produce the same tokens and columns, and the same
+    line buffers at the end of each line.
+    """
+
+    def __init__(self, scanner: Scanner):
+        super().__init__(scanner)
+        # The tokens recognized in the current line but not yet consumed.
+        self.pending: Deque[Token] = deque()
+
+    def consume(self, keep_buffer: bool = False) -> Token:
+        if self.buffer and not keep_buffer:
+            return self.buffer.popleft()
+        if not self.pending and not self.is_new_line:
+            self.scan_line()
+        if self.pending:
+            return self.pending.popleft()
+        return super().consume(keep_buffer)
+
+    def scan_line(self):
+        """ Recognize the tokens up to the next character that is not part of a token. """
+        scanner = self.scanner
+        text = scanner.text
+        size = len(text)
+        # The character in the buffer of the scanner, if any, was already
+        # read from `text`.
+        pos = scanner.pos - 1 if scanner.buffer else scanner.pos
+        # Mid-line, the column advances by one for every character.
+        column = scanner.column - scanner.pos + 1
+        lookahead = False
+
+        pending = self.pending
+        match = token_pattern.match(text, pos)
+        while match is not None and match.end() < size:
+            start, end = match.span(1)
+            value = match.group(1)
+            c = value[0]
+            if c == '"':
+                kind = TokenKind.STRING
+                value = escape_pattern.sub(
+                    lambda m: escaped_chars[m.group(1)], value[1:-1])
+                next_lookahead = False
+            elif c.isdigit():
+                if text[end].isnumeric():
+                    break
+                kind = TokenKind.INTEGER
+                value = int(value)
+                next_lookahead = True
+            else:
+                kind = token_kinds.get(value, TokenKind.IDENTIFIER)
+                next_lookahead = c.isalpha() or c == '_' or \
+                    value in lookahead_tokens
+            pending.append(Token(kind, value, column + start))
+            pos = end
+            lookahead = next_lookahead
+            match = token_pattern.match(text, pos)
+
+        if not pending:
+            return
+        # Leave the scanner as the handwritten tokenizer would after the last
+        # token, with the next character in its buffer after a lookahead.
+        if lookahead:
+            scanner.buffer = text[pos]
+            pos += 1
+        else:
+            scanner.buffer = None
+        scanner.pos = pos
+        scanner.column = column + pos - 1
+
+
+tokenizers = {'handwritten': Tokenizer, 'regex': RegexTokenizer}
+"""The available tokenizer backends."""
+
+
 class Lexer:
 
-    def __init__(self, stream: TextIOBase):
+    def __init__(self, stream: TextIOBase, backend: str = 'handwritten'):
         scanner = Scanner(stream)
-        self.tokenizer = Tokenizer(scanner)
+        self.tokenizer = tokenizers[backend](scanner)
 
-    def peek(self, k: int = 1) -> Union[Token, List[Token]]:
+    def peek(self, k: int = 1) -> Union[Token, Tuple[Token, ...]]:
         return self.tokenizer.peek(k)
 
+    def lookahead(self, i: int) -> Token:
+        return self.tokenizer.lookahead(i)
+
     def consume(self) -> Token:
-        return self.tokenizer.consume()
+        if self.tokenizer.buffer:
+            return self.tokenizer.consume()
+        return self.tokenizer.scan()
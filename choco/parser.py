@@ -5,6 +5,7 @@ from xdsl.dialects.builtin import ModuleOp
 
 from choco.lexer import Token, TokenKind, Lexer
 import choco.dialects.choco_ast as ast
+from choco.source_location import get_location_attr
 
 from xdsl.ir import Operation
 from typing import List, Union
@@ -36,13 +37,36 @@ class Parser:
     Parse the given tokens from the lexer and call the xDSL API to create an AST.
     """
 
-    def __init__(self, lexer: Lexer):
+    def __init__(self, lexer: Lexer, locations: bool = False):
         """
         Create a new parser.
 
-        Initialize parser with the corresponding lexer.
+        Initialize parser with the corresponding lexer. If `locations` is
+        set, the statements and definitions are annotated with their
+        location in the source.
         """
         self.lexer = lexer
+        self.locations = locations
+
+    def locate(self, op: Operation, token: Token) -> Operation:
+        """
+        Annotate an operation with the location of the token it starts with,
+        if locations are enabled.
+
+        :param op: The parsed operation.
+        :param token: The first token of the operation.
+        :returns: The operation.
+        """
+        if self.locations:
+            op.attributes['loc'] = get_location_attr(token.line + 1,
+                                                     token.column + 1)
+        return op
+
+    def next_token(self) -> Token:
+        """ Get the next token, without consuming it. """
+        token = self.lexer.peek()
+        assert isinstance(token, Token), "A single token expected"
+        return token
 
     def check(self, expected: Union[List[TokenKind], TokenKind]) -> bool:
         """
@@ -58,10 +82,13 @@ class Parser:
         """
 
         if isinstance(expected, list):
-            tokens = self.lexer.peek(len(expected))
-            assert isinstance(tokens, list), "List of tokens expected"
-            return all(
-                [tok.kind == type_ for tok, type_ in zip(tokens, expected)])
+            # Lex all the expected tokens first, so that the position of the
+            # lexer does not depend on which token does not match.
+            self.lexer.lookahead(len(expected) - 1)
+            for i, type_ in enumerate(expected):
+                if self.lexer.lookahead(i).kind != type_:
+                    return False
+            return True
 
         token = self.lexer.peek()
         assert isinstance(token, Token), "Single token expected"
@@ -179,7 +206,7 @@ class Parser:
 
         :return: Operation
         """
-        self.match(TokenKind.DEF)
+        def_token = self.match(TokenKind.DEF)
 
         function_name = self.match(TokenKind.IDENTIFIER)
 
@@ -239,8 +266,9 @@ class Parser:
 
         self.match(TokenKind.DEDENT)
 
-        return ast.FuncDef.get(function_name.value, parameters, return_type,
-                               func_body)
+        return self.locate(
+            ast.FuncDef.get(function_name.value, parameters, return_type,
+                            func_body), def_token)
 
     def parse_typed_var(self) -> Operation:
         """
@@ -292,11 +320,12 @@ class Parser:
 
         :return: Operation
         """
+        token = self.next_token()
         typed_var = self.parse_typed_var()
         self.match(TokenKind.ASSIGN)
         literal = self.parse_literal()
         self.match(TokenKind.NEWLINE)
-        return ast.VarDef.get(typed_var, literal)
+        return self.locate(ast.VarDef.get(typed_var, literal), token)
 
     def parse_global_decl(self) -> Operation:
         """ Parse a global variable declaration.
@@ -305,10 +334,10 @@ class Parser:
 
         :return: Operation
         """
-        self.match(TokenKind.GLOBAL)
+        token = self.match(TokenKind.GLOBAL)
         identifier = self.match(TokenKind.IDENTIFIER)
         self.match(TokenKind.NEWLINE)
-        return ast.GlobalDecl.get(identifier.value)
+        return self.locate(ast.GlobalDecl.get(identifier.value), token)
 
     def parse_nonlocal_decl(self) -> Operation:
         """ Parse a nonlocal variable declaration.
@@ -317,10 +346,10 @@ class Parser:
 
         :return: Operation
         """
-        self.match(TokenKind.NONLOCAL)
+        token = self.match(TokenKind.NONLOCAL)
         identifier = self.match(TokenKind.IDENTIFIER)
         self.match(TokenKind.NEWLINE)
-        return ast.NonLocalDecl.get(identifier.value)
+        return self.locate(ast.NonLocalDecl.get(identifier.value), token)
 
     def parse_block(self) -> List[Operation]:
         """ Parse a block used in if/while/for statements.
@@ -401,16 +430,17 @@ class Parser:
             return self.parse_while_stmt()
         elif self.check(TokenKind.FOR):
             return self.parse_for_stmt()
+        token = self.next_token()
         simple_stmt = self.parse_simple_stmt()
         self.match(TokenKind.NEWLINE)
-        return simple_stmt
+        return self.locate(simple_stmt, token)
 
     def parse_if_stmt(self) -> Operation:
         """ Parse an if statement from input.
 
         :return: if operation
         """
-        self.match(TokenKind.IF)
+        if_token = self.match(TokenKind.IF)
 
         # if condition
         if_cond = self._parse_condition()
@@ -419,15 +449,15 @@ class Parser:
         if_body = self.parse_block()
         # Now we have, at least, the most basic if statement
 
-        if_blocks = [(if_cond, if_body)]
+        if_blocks = [(if_cond, if_body, if_token)]
 
         while self.check(TokenKind.ELIF):
-            self.match(TokenKind.ELIF)
+            elif_token = self.match(TokenKind.ELIF)
             # elif condition
             elif_cond = self._parse_condition()
             # elif body
             elif_body = self.parse_block()
-            if_blocks.append((elif_cond, elif_body))
+            if_blocks.append((elif_cond, elif_body, elif_token))
 
         else_body = []
         if self.check(TokenKind.ELSE):
@@ -442,7 +472,8 @@ class Parser:
         if_op = None
 
         for if_block in if_blocks:
-            if_op = ast.If.get(if_block[0], if_block[1], body)
+            if_op = self.locate(ast.If.get(if_block[0], if_block[1], body),
+                                if_block[2])
             body = [if_op]
 
         assert if_op != None, "At least one if-block expected"
@@ -453,7 +484,7 @@ class Parser:
 
         :return: while operation
         """
-        self.match(TokenKind.WHILE)
+        while_token = self.match(TokenKind.WHILE)
 
         # while condition
         while_cond = self._parse_condition()
@@ -462,14 +493,14 @@ class Parser:
         while_body = self.parse_block()
 
         while_op = ast.While.get(while_cond, while_body)
-        return while_op
+        return self.locate(while_op, while_token)
 
     def parse_for_stmt(self) -> Operation:
         """ Parse a for statement from input.
 
         :return: for operation
         """
-        self.match(TokenKind.FOR)
+        for_token = self.match(TokenKind.FOR)
 
         # iterator
         iter_name = self.match(TokenKind.IDENTIFIER)
@@ -482,7 +513,7 @@ class Parser:
         # for body
         for_body = self.parse_block()
         for_op = ast.For.get(iter_name.value, for_expr, for_body)
-        return for_op
+        return self.locate(for_op, for_token)
 
     def _parse_condition(self) -> Operation:
         """ Parse an expression as a condition.
@@ -0,0 +1,126 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+from __future__ import annotations
+import os
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, TypeVar
+
+from xdsl.ir import Operation
+
+T = TypeVar('T')
+
+
+def count_ops(op: Operation) -> int:
+    """Count the operations nested in op, op included"""
+    count = 0
+
+    def count_op(_: Operation):
+        nonlocal count
+        count += 1
+
+    op.walk(count_op)
+    return count
+
+
+@dataclass
+class PassRecord:
+    """
+    The statistics of a stage of the compilation. The op counts are None if
+    the stage does not have a module as input or output, and the peak memory
+    is None if memory is not traced.
+    """
+    name: str
+    wall_time: float
+    ops_before: Optional[int]
+    ops_after: Optional[int]
+    peak_memory: Optional[int]
+
+
+@dataclass
+class PassStatistics:
+    """
+    Records the wall time, the op counts and the peak memory of each stage of
+    the compilation, and optionally writes a profile of each stage in
+    `profile_dir`.
+
+    The peak memory is the peak size of the memory blocks allocated since
+    the first stage, as traced by tracemalloc. Tracing slows down the
+    allocations, so the wall times are only comparable with each other.
+    """
+    trace_memory: bool = True
+    profile_dir: Optional[str] = None
+    records: List[PassRecord] = field(default_factory=list)
+
+    def measure(self,
+                name: str,
+                run: Callable[[], T],
+                module: Optional[Operation] = None) -> T:
+        """
+        Run the stage name on module, or producing a module if none is given,
+        and record its statistics.
+        """
+        ops_before = count_ops(module) if module is not None else None
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        profile = None
+        if self.profile_dir is not None:
+            import cProfile
+            profile = cProfile.Profile()
+
+        start = time.perf_counter()
+        if profile is not None:
+            result = profile.runcall(run)
+        else:
+            result = run()
+        wall_time = time.perf_counter() - start
+
+        peak_memory = None
+        if self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+
+        if profile is not None:
+            assert self.profile_dir is not None
+            os.makedirs(self.profile_dir, exist_ok=True)
+            file_name = re.sub(r'[^\w.-]', '_', name)
+            profile.dump_stats(
+                os.path.join(self.profile_dir,
+                             f"{len(self.records):02}-{file_name}.pstats"))
+
+        output = module if module is not None else result
+        ops_after = count_ops(output) if isinstance(output,
+                                                    Operation) else None
+        self.records.append(
+            PassRecord(name, wall_time, ops_before, ops_after, peak_memory))
+        return result
+
+    def format_report(self) -> str:
+        """Format the statistics of the recorded stages as a table"""
+
+        def format_count(count: Optional[int]) -> str:
+            return '-' if count is None else str(count)
+
+        def format_memory(size: Optional[int]) -> str:
+            return '-' if size is None else f"{size / (1024 * 1024):.2f} MiB"
+
+        total = sum(record.wall_time for record in self.records)
+        lines = [
+            "  Wall time      %   Ops before   Ops after  Peak memory  Pass"
+        ]
+        for record in self.records:
+            percent = 100 * record.wall_time / total if total else 0
+            lines.append(f"{record.wall_time:9.4f} s {percent:5.1f}% "
+                         f"{format_count(record.ops_before):>12} "
+                         f"{format_count(record.ops_after):>11} "
+                         f"{format_memory(record.peak_memory):>12}  "
+                         f"{record.name}")
+        lines.append(f"{total:9.4f} s {100 if total else 0:5.1f}% "
+                     f"{'':>12} {'':>11} {'':>12}  total")
+        return "\n".join(lines) + "\n"
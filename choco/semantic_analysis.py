@@ -0,0 +1,133 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+
+from xdsl.dialects.builtin import ModuleOp
+from choco.ast_visitor import Visitor
+from choco.check_assign_target import check_assign
+from choco.dialects.choco_ast import *
+from choco.name_analysis import (BuildContextVisitor, NameAnalysisVisitor,
+                                 get_builtin_name_ctx, get_func_name_ctx)
+from choco.type_checking import (BuildEnvVisitor, FunctionInfo, FunctionType,
+                                 LocalEnvironment, check_program,
+                                 get_builtin_env, get_func_signature,
+                                 get_nested_defs)
+from choco.warn_dead_code import warn_dead_code
+
+
+@dataclass
+class DeferredErrors:
+    """
+    The first errors found while building the name context and the type
+    environment. Name analysis and type checking run after the check of
+    assignment targets, so their errors are only raised once no error of the
+    analyses running before them can be found.
+    """
+    name_ctx_error: Optional[Exception] = None
+    env_error: Optional[Exception] = None
+
+
+@dataclass
+class BuildSemanticInfoVisitor(Visitor):
+    """
+    Check the assignment targets, and build the name context of name analysis
+    and the environment of type checking, in a single traversal.
+    """
+    name_builder: Optional[BuildContextVisitor]
+    env_builder: Optional[BuildEnvVisitor]
+    errors: DeferredErrors
+
+    def visit_assign(self, assign: Assign):
+        check_assign(assign)
+
+    def visit_var_def(self, var_def: VarDef):
+        if self.name_builder is None or self.errors.name_ctx_error:
+            return
+        try:
+            self.name_builder.visit_var_def(var_def)
+        except Exception as e:
+            self.errors.name_ctx_error = e
+
+    def visit_typed_var(self, typed_var: TypedVar):
+        if self.env_builder is None or self.errors.env_error:
+            return
+        try:
+            self.env_builder.visit_typed_var(typed_var)
+        except Exception as e:
+            self.errors.env_error = e
+
+    def traverse_func_def(self, func_def: FuncDef):
+        """
+        Traverse the function body with a nested name context and a nested
+        environment, then add the function to the enclosing ones.
+        """
+        errors = self.errors
+        func_name: str = func_def.func_name.data  #type: ignore
+
+        body_name_builder = None
+        if self.name_builder is not None and not errors.name_ctx_error:
+            try:
+                body_name_builder = BuildContextVisitor(
+                    get_func_name_ctx(func_def))
+            except Exception as e:
+                errors.name_ctx_error = e
+
+        body_env_builder = None
+        if self.env_builder is not None and not errors.env_error:
+            try:
+                signature = get_func_signature(func_def)
+                body_env_builder = BuildEnvVisitor(
+                    {}, self.env_builder.global_env)
+            except Exception as e:
+                errors.env_error = e
+
+        body_visitor = BuildSemanticInfoVisitor(body_name_builder,
+                                                body_env_builder, errors)
+        for op in func_def.func_body.blocks[0].ops:
+            body_visitor.traverse(op)
+
+        if body_name_builder is not None and not errors.name_ctx_error:
+            try:
+                self.name_builder.name_ctx.add_func(  #type: ignore
+                    func_name, body_name_builder.name_ctx)
+            except Exception as e:
+                errors.name_ctx_error = e
+
+        if body_env_builder is not None and not errors.env_error:
+            try:
+                xs, ts, t = signature
+                vs = get_nested_defs(body_env_builder.o)
+                body_env_builder.global_env.update(
+                    {func_name: FunctionInfo(FunctionType(ts, t), xs, vs)})
+            except Exception as e:
+                errors.env_error = e
+
+
+def semantic_analysis(ctx: MLContext, module: ModuleOp) -> ModuleOp:
+    """
+    Run check-assign-target, name-analysis, type-checking and warn-dead-code,
+    reporting the same first error as running them one after the other.
+
+    The assignment targets, the name context and the type environment are
+    handled in a single traversal, followed by a traversal checking the
+    names, and the typing rules.
+    """
+    name_ctx = get_builtin_name_ctx()
+    o: LocalEnvironment = get_builtin_env()
+    errors = DeferredErrors()
+
+    BuildSemanticInfoVisitor(BuildContextVisitor(name_ctx),
+                             BuildEnvVisitor(o, o), errors).traverse(module)
+
+    if errors.name_ctx_error:
+        raise errors.name_ctx_error
+    NameAnalysisVisitor(name_ctx).traverse(module)
+
+    if errors.env_error:
+        raise errors.env_error
+    check_program(o, module)
+
+    return warn_dead_code(ctx, module)
@@ -0,0 +1,71 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+"""
+The locations in the ChocoPy source of the operations of a program.
+
+The location of an operation is its `loc` attribute, holding the line and
+column of the statement or definition the operation comes from, counting
+from one. The parser only attaches locations when asked to, so that the
+printed IR does not change otherwise, and the passes give the location of
+the operations they translate or rewrite to the operations they create.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from xdsl.dialects.builtin import ArrayAttr, IntegerAttr
+from xdsl.ir import Operation
+from xdsl.pattern_rewriter import PatternRewriter, RewritePattern
+
+
+def get_location_attr(line: int, column: int) -> ArrayAttr:
+    """Get the attribute of the location at the given line and column"""
+    return ArrayAttr([
+        IntegerAttr.from_int_and_width(line, 32),
+        IntegerAttr.from_int_and_width(column, 32)
+    ])
+
+
+def get_location(op: Operation) -> Optional[Tuple[int, int]]:
+    """Get the line and column of an operation, if it has a location"""
+    attr = op.attributes.get('loc')
+    if not isinstance(attr, ArrayAttr):
+        return None
+    line, column = attr.data
+    return line.value.data, column.value.data
+
+
+def copy_location(source: Operation, ops: Iterable[Operation]):
+    """
+    Give the location of source to the operations, and to the operations
+    nested in them, that do not have a location yet.
+    """
+    if 'loc' not in source.attributes:
+        return
+    loc = source.attributes['loc']
+    for op in ops:
+        if 'loc' not in op.attributes:
+            op.attributes['loc'] = loc
+        for region in op.regions:
+            for block in region.blocks:
+                copy_location(source, block.ops)
+
+
+@dataclass(eq=False)
+class LocatedPattern(RewritePattern):
+    """
+    Apply a pattern, giving the location of the matched operation to the
+    operations the pattern adds.
+    """
+
+    pattern: RewritePattern
+
+    def match_and_rewrite(self, op: Operation, rewriter: PatternRewriter):
+        self.pattern.match_and_rewrite(op, rewriter)
+        if rewriter.has_done_action:
+            copy_location(
+                op, rewriter.added_operations_before +
+                rewriter.added_operations_after)
@@ -0,0 +1,74 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+@dataclass
+class SymbolTable(Generic[T]):
+    """
+    Flat table of the names bound in the currently open scopes.
+
+    Each name is related to the stack of its bindings, the innermost binding
+    on top, so resolving a name does not walk a chain of parent scopes.
+    Scopes are identified by their nesting depth, the global scope being 0.
+    """
+    bindings: Dict[str, List[Tuple[int, T]]] = field(default_factory=dict)
+    scopes: List[List[str]] = field(default_factory=lambda: [[]])
+
+    @property
+    def current_scope(self) -> int:
+        return len(self.scopes) - 1
+
+    def enter_scope(self, bindings: Optional[Dict[str, T]] = None) -> int:
+        """Open a nested scope containing the given bindings"""
+        self.scopes.append([])
+        if bindings:
+            for name, value in bindings.items():
+                self.bind(name, value)
+        return self.current_scope
+
+    def exit_scope(self):
+        """Close the innermost scope, removing its bindings"""
+        assert self.current_scope > 0, "Cannot exit the global scope"
+        for name in self.scopes.pop():
+            stack = self.bindings[name]
+            stack.pop()
+            if not stack:
+                del self.bindings[name]
+
+    def bind(self, name: str, value: T):
+        """Relate the given name and value in the innermost scope"""
+        scope = self.current_scope
+        stack = self.bindings.setdefault(name, [])
+        if stack and stack[-1][0] == scope:
+            stack[-1] = (scope, value)
+        else:
+            stack.append((scope, value))
+            self.scopes[scope].append(name)
+
+    def lookup(self, name: str) -> Optional[T]:
+        """Get the value of the innermost binding of name, if any"""
+        stack = self.bindings.get(name)
+        if stack:
+            return stack[-1][1]
+        return None
+
+    def is_bound(self, name: str) -> bool:
+        """Check if name is bound in any open scope"""
+        return name in self.bindings
+
+    def is_bound_in_scope(self, name: str, scope: int) -> bool:
+        """Check if name is bound in the given scope"""
+        stack = self.bindings.get(name)
+        if not stack:
+            return False
+        # only the scopes nested in the given one can shadow its binding
+        for binding_scope, _ in reversed(stack):
+            if binding_scope <= scope:
+                return binding_scope == scope
+        return False
@@ -192,6 +192,13 @@ LocalEnvironment = Dict[str, Union[Type, FunctionInfo]]
 
 def type_checking(_: MLContext, module: ModuleOp) -> ModuleOp:
     o = build_env(module)
+    check_program(o, module)
+
+    return module
+
+
+def check_program(o: LocalEnvironment, module: ModuleOp):
+    """Check the typing rules of a program, given its global environment."""
     r = bottom_type
 
     program = module.ops[0]
@@ -201,12 +208,10 @@ def type_checking(_: MLContext, module: ModuleOp) -> ModuleOp:
     if len(program.stmts.ops) >= 1:
         check_stmt_or_def_list(o, r, program.stmts.ops)
 
-    return module
-
 
 # Build local environments
-def build_env(module: ModuleOp) -> LocalEnvironment:
-    o: LocalEnvironment = {
+def get_builtin_env() -> LocalEnvironment:
+    return {
         "len": FunctionInfo(FunctionType([object_type], int_type), ["arg"],
                             []),
         "print": FunctionInfo(FunctionType([object_type], none_type), ["arg"],
@@ -214,42 +219,60 @@ def build_env(module: ModuleOp) -> LocalEnvironment:
         "input": FunctionInfo(FunctionType([], str_type), [], [])
     }
 
-    @dataclass
-    class BuildEnvVisitor(Visitor):
-        o: LocalEnvironment
-
-        def visit_typed_var(self, typed_var: choco_ast.TypedVar):
-            name, type = typed_var.var_name.data, Type.from_op(  #type: ignore
-                typed_var.type.op)
-            self.o.update({name: type})
-
-        def traverse_func_def(self, func_def: choco_ast.FuncDef):
-            f: str = func_def.func_name.data  #type: ignore
-            # collect function parameter names and types
-            xs: List[str] = []
-            ts: List[Type] = []
-            for op in func_def.params.ops:
-                assert isinstance(op, choco_ast.TypedVar)
-                name, type = op.var_name.data, Type.from_op(  #type: ignore
-                    op.type.op)
-                xs.append(name)
-                ts.append(type)
-            # collect return type
-            t = Type.from_op(func_def.return_type.op) \
-                if (len(func_def.return_type.ops) == 1) else none_type
-            # collect nested variable definitions
-            body_visitor = BuildEnvVisitor({})
-            for op in func_def.func_body.ops:
-                body_visitor.traverse(op)
-            vs: List[Tuple[str, Type]] = []
-            for var_name, var_type in body_visitor.o.items():
-                assert isinstance(var_type, Type)
-                vs.append((var_name, var_type))
-
-            o.update({f: FunctionInfo(FunctionType(ts, t), xs, vs)})
-
-    BuildEnvVisitor(o).traverse(module)
 
+def get_func_signature(
+        func_def: choco_ast.FuncDef) -> Tuple[List[str], List[Type], Type]:
+    """Get the parameter names, the parameter types and the return type of a function."""
+    # collect function parameter names and types
+    xs: List[str] = []
+    ts: List[Type] = []
+    for op in func_def.params.ops:
+        assert isinstance(op, choco_ast.TypedVar)
+        name, type = op.var_name.data, Type.from_op(  #type: ignore
+            op.type.op)
+        xs.append(name)
+        ts.append(type)
+    # collect return type
+    t = Type.from_op(func_def.return_type.op) \
+        if (len(func_def.return_type.ops) == 1) else none_type
+    return xs, ts, t
+
+
+def get_nested_defs(body_env: LocalEnvironment) -> List[Tuple[str, Type]]:
+    """Get the variables defined in the body of a function."""
+    vs: List[Tuple[str, Type]] = []
+    for var_name, var_type in body_env.items():
+        assert isinstance(var_type, Type)
+        vs.append((var_name, var_type))
+    return vs
+
+
+@dataclass
+class BuildEnvVisitor(Visitor):
+    o: LocalEnvironment
+    global_env: LocalEnvironment
+    """The environment functions are added to, including nested ones."""
+
+    def visit_typed_var(self, typed_var: choco_ast.TypedVar):
+        name, type = typed_var.var_name.data, Type.from_op(  #type: ignore
+            typed_var.type.op)
+        self.o.update({name: type})
+
+    def traverse_func_def(self, func_def: choco_ast.FuncDef):
+        f: str = func_def.func_name.data  #type: ignore
+        xs, ts, t = get_func_signature(func_def)
+        # collect nested variable definitions
+        body_visitor = BuildEnvVisitor({}, self.global_env)
+        for op in func_def.func_body.ops:
+            body_visitor.traverse(op)
+        vs = get_nested_defs(body_visitor.o)
+
+        self.global_env.update({f: FunctionInfo(FunctionType(ts, t), xs, vs)})
+
+
+def build_env(module: ModuleOp) -> LocalEnvironment:
+    o = get_builtin_env()
+    BuildEnvVisitor(o, o).traverse(module)
     return o
 
 
@@ -1,3 +1,5 @@
 WeChat: cstutorcs
 QQ: 749389476
 Email: tutorcs@163.com
+register_allocators = ["linear-scan", "graph-coloring", "spill"]
+"""The register allocation strategies supported by riscv_ssa_to_riscv."""
@@ -0,0 +1,564 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+"""
+An execution engine for the simulator of `riscv.simulator` translating each
+basic block of the program into a Python function.
+
+A block starts at the instruction the program is at when it is first
+executed, and ends at the first branch, jump or system call, or before the
+next labelled instruction. Its instructions are translated into Python
+source, which is compiled once and cached for the next executions of the
+block, so that a loop runs as straight-line Python code. The instructions
+that are not worth translating are executed by calling their closure of
+`PredecodedSimulator`.
+
+`LockStepSimulator` checks the translation by executing each block in the
+interpreter of `Simulator` and comparing the states of both simulators.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import struct
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Set
+
+from xdsl.dialects.builtin import IntegerAttr
+from xdsl.ir import Operation
+
+import riscv.dialect as riscv
+from riscv.predecoded_simulator import (Halt, PredecodedSimulator, int16,
+                                        int32, memory_fault, sink, uint16)
+from riscv.simulator import (Simulator, SimulatorError,
+                             branch_conditions, branch_zero_conditions,
+                             loads, stores, text_base, to_signed)
+
+Block = Callable[[], int]
+"""A translated block, returning the index of the next block."""
+
+truncate = ("{0} = value if -0x80000000 <= value <= 0x7FFFFFFF "
+            "else ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000")
+"""Assign the 32-bit truncation of `value` to a register."""
+
+# The conditions of the branches, as Python expressions of their operands
+branch_expressions = {
+    riscv.BEQOp: "{0} == {1}",
+    riscv.BNEOp: "{0} != {1}",
+    riscv.BLTOp: "{0} < {1}",
+    riscv.BGEOp: "{0} >= {1}",
+    riscv.BLTUOp: "({0} & 0xFFFFFFFF) < ({1} & 0xFFFFFFFF)",
+    riscv.BGEUOp: "({0} & 0xFFFFFFFF) >= ({1} & 0xFFFFFFFF)",
+    riscv.BGTOp: "{0} > {1}",
+    riscv.BLEOp: "{0} <= {1}",
+    riscv.BGTUOp: "({0} & 0xFFFFFFFF) > ({1} & 0xFFFFFFFF)",
+    riscv.BLEUOp: "({0} & 0xFFFFFFFF) <= ({1} & 0xFFFFFFFF)",
+    riscv.BEQZOp: "{0} == 0",
+    riscv.BNEZOp: "{0} != 0",
+    riscv.BLEZOp: "{0} <= 0",
+    riscv.BGEZOp: "{0} >= 0",
+    riscv.BLTZOp: "{0} < 0",
+    riscv.BGTZOp: "{0} > 0",
+}
+
+# The operations whose result never has to be truncated, as Python
+# expressions of their operands
+exact_expressions = {
+    riscv.ANDOp: "{0} & {1}",
+    riscv.OROp: "{0} | {1}",
+    riscv.XOROp: "{0} ^ {1}",
+    riscv.SLTOp: "int({0} < {1})",
+    riscv.SLTUOp: "int(({0} & 0xFFFFFFFF) < ({1} & 0xFFFFFFFF))",
+    riscv.ANDIOp: "{0} & {1}",
+    riscv.ORIOp: "{0} | {1}",
+    riscv.XORIOp: "{0} ^ {1}",
+    riscv.SLTIOp: "int({0} < {1})",
+    riscv.SLTIUOp: "int(({0} & 0xFFFFFFFF) < ({1} & 0xFFFFFFFF))",
+}
+
+# The operations whose result may have to be truncated, as Python
+# expressions of their operands
+truncated_expressions = {
+    riscv.AddOp: "{0} + {1}",
+    riscv.SubOp: "{0} - {1}",
+    riscv.MULOp: "{0} * {1}",
+    riscv.AddIOp: "{0} + {1}",
+}
+
+control_flow_ops = (set(branch_conditions) | set(branch_zero_conditions)
+                    | {
+                        riscv.JOp, riscv.JALOp, riscv.JALROp, riscv.RETOp,
+                        riscv.ECALLOp, riscv.EBREAKOp
+                    })
+"""The instructions ending a block."""
+
+
+class BlockSimulator(PredecodedSimulator):
+    """
+    Runs a program by translating each of its blocks into a Python function
+    once the block has been executed `translation_threshold` times. Until
+    then, the block is executed by the closures of its instructions, so that
+    the code executed only a few times is not compiled.
+    """
+
+    translation_threshold = 8
+
+    def __post_init__(self):
+        super().__post_init__()
+        instructions = self.program.instructions
+        # the blocks and their number of instructions, by first instruction
+        self.blocks: List[Optional[Block]] = [None] * (len(instructions) + 1)
+        self.block_sizes: List[int] = [0] * (len(instructions) + 1)
+        self.leaders: Set[int] = {
+            (self.program.labels[label] - text_base) >> 2
+            for label in self.program.text_labels
+        }
+        self.block_globals = {
+            'regs': self.registers,
+            'memory': self.memory,
+            'sim': self,
+            'memory_fault': memory_fault,
+            'get_instruction_index': self.program.get_instruction_index,
+            'unpack_int32': int32.unpack_from,
+            'unpack_int16': int16.unpack_from,
+            'unpack_uint16': uint16.unpack_from,
+            'pack_int32': int32.pack_into,
+            'pack_uint16': uint16.pack_into,
+            'struct_error': struct.error,
+            'SimulatorError': SimulatorError,
+        }
+
+    def get_block(self, start: int) -> Block:
+        """Get the block starting at the given index, creating it if needed"""
+        block = self.blocks[start]
+        if block is not None:
+            return block
+
+        code = self.decode()
+        if start == len(self.program.instructions):
+            # the end of the program, which is not an instruction
+            self.blocks[start] = code[start]
+            return code[start]
+        if self.translation_threshold <= 1:
+            return self.translate(start)
+
+        end = get_block_end(self, start)
+        instructions = code[start:end]
+        threshold = self.translation_threshold
+        executions = 0
+
+        def block() -> int:
+            nonlocal executions
+            executions += 1
+            if executions == threshold:
+                # the next executions run the translated block
+                self.translate(start)
+            pc = start
+            try:
+                for instruction in instructions:
+                    pc = instruction()
+            except SimulatorError:
+                self.pc = pc
+                raise
+            return pc
+
+        self.blocks[start] = block
+        self.block_sizes[start] = end - start
+        return block
+
+    def translate(self, start: int) -> Block:
+        """Translate the block starting at the given index"""
+        namespace = dict(self.block_globals, code=self.decode())
+        exec(
+            compile(self.get_block_source(start),
+                    f"<block at {text_base + 4 * start:#x}>", 'exec'),
+            namespace)
+        block = namespace[f"block_{start}"]
+        self.blocks[start] = block
+        self.block_sizes[start] = get_block_end(self, start) - start
+        return block
+
+    def get_block_source(self, start: int) -> str:
+        """Get the Python source of the block starting at the given index"""
+        self.decode()
+        return translate_block(self, start)
+
+    def run(self) -> int:
+        """Run the program until it exits, returning its exit code"""
+        self.decode()
+        blocks = self.blocks
+        sizes = self.block_sizes
+        end = len(self.program.instructions)
+        pc = self.pc
+        count = self.instructions_executed
+        limit = (math.inf
+                 if self.max_instructions is None else self.max_instructions)
+        size = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                block = blocks[pc]
+                if block is None:
+                    block = self.get_block(pc)
+                size = sizes[pc]
+                if count + size > limit:
+                    break
+                count += size
+                pc = block()
+        except Halt:
+            pc = self.pc
+        except SimulatorError:
+            # the block stops at the instruction that failed
+            count -= size
+            if pc < end:
+                count += self.pc - pc + 1
+                pc = self.pc
+            raise
+        finally:
+            self.run_time += time.perf_counter() - start
+            self.instructions_executed = count
+            self.pc = pc
+
+        if self.exit_code is None:
+            # the limit is reached in the middle of a block, which we
+            # execute one instruction at a time
+            return super().run()
+        return self.exit_code
+
+    def run_block(self):
+        """Execute the block at the pc"""
+        pc = self.pc
+        block = self.get_block(pc)
+        count = self.instructions_executed
+        self.instructions_executed += self.block_sizes[pc]
+        try:
+            self.pc = block()
+        except Halt:
+            pass
+        except SimulatorError:
+            if pc < len(self.program.instructions):
+                self.instructions_executed = count + self.pc - pc + 1
+            else:
+                self.instructions_executed = count
+                self.pc = pc
+            raise
+
+
+def get_block_end(sim: BlockSimulator, start: int) -> int:
+    """Get the index following the last instruction of the block at start"""
+    instructions = sim.program.instructions
+    index = start
+    while True:
+        op_type = type(instructions[index])
+        index += 1
+        if (op_type in control_flow_ops or index == len(instructions)
+                or index in sim.leaders):
+            return index
+
+
+def translate_block(sim: BlockSimulator, start: int) -> str:
+    """
+    Translate the block starting at the given index into the source of a
+    function named `block_<start>`.
+    """
+    instructions = sim.program.instructions
+    end = get_block_end(sim, start)
+    lines = [f"def block_{start}():", "    try:"]
+    for index in range(start, end):
+        lines.extend("        " + line for line in translate_instruction(
+            sim, instructions[index], index))
+    if type(instructions[end - 1]) not in control_flow_ops:
+        lines.append(f"        return {end}")
+    lines.extend([
+        "    except struct_error:",
+        "        sim.pc = i",
+        "        memory_fault(address)",
+        "    except IndexError:",
+        "        sim.pc = i",
+        "        memory_fault(address)",
+        "    except SimulatorError:",
+        "        sim.pc = i",
+        "        raise",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def translate_instruction(sim: BlockSimulator, op: Operation,
+                          index: int) -> List[str]:
+    """
+    Translate the instruction op at index into lines of Python. The lines
+    assign `i` before the operations that may fail, so that the pc is known
+    when they do.
+    """
+    program = sim.program
+    op_type = type(op)
+    next_index = index + 1
+
+    def src(name: str) -> str:
+        register = op.attributes[name].data.index
+        return f"regs[{register}]" if register else "0"
+
+    def dst(name: str) -> str:
+        return f"regs[{op.attributes[name].data.index or sink}]"
+
+    def fallback() -> List[str]:
+        # execute the closure of the predecoded simulator
+        if op_type in control_flow_ops:
+            return [f"i = {index}", f"return code[{index}]()"]
+        return [f"i = {index}", f"code[{index}]()"]
+
+    try:
+        if op_type in exact_expressions or op_type in truncated_expressions:
+            if 'rs2' in op.attributes:
+                rhs = src('rs2')
+            else:
+                attr = op.attributes['immediate']
+                rhs = str(
+                    to_signed(attr.value.data if isinstance(
+                        attr, IntegerAttr) else program.get_symbol(attr.data)))
+            if op_type in exact_expressions:
+                expression = exact_expressions[op_type].format(
+                    src('rs1'), rhs)
+                return [f"{dst('rd')} = {expression}"]
+            expression = truncated_expressions[op_type].format(
+                src('rs1'), rhs)
+            return [f"value = {expression}",
+                    truncate.format(dst('rd'))]
+
+        if op_type in (riscv.SLLIOp, riscv.SRLIOp, riscv.SRAIOp):
+            shift = op.attributes['immediate']
+            if not isinstance(shift, IntegerAttr):
+                return fallback()
+            amount = shift.value.data & 31
+            if op_type is riscv.SLLIOp:
+                return [
+                    f"value = {src('rs1')} << {amount}",
+                    "value &= 0xFFFFFFFF",
+                    f"{dst('rd')} = value - 0x100000000 "
+                    "if value > 0x7FFFFFFF else value"
+                ]
+            if op_type is riscv.SRAIOp or amount == 0:
+                return [f"{dst('rd')} = {src('rs1')} >> {amount}"]
+            return [
+                f"{dst('rd')} = ({src('rs1')} & 0xFFFFFFFF) >> {amount}"
+            ]
+
+        if op_type is riscv.MVOp:
+            return [f"{dst('rd')} = {src('rs')}"]
+
+        if op_type in (riscv.LIOp, riscv.LUIOp, riscv.AUIPCOp, riscv.LAOp):
+            if op_type is riscv.LAOp:
+                value = program.get_symbol(op.attributes['offset'].data)
+            else:
+                attr = op.attributes['immediate']
+                value = attr.value.data if isinstance(
+                    attr, IntegerAttr) else program.get_symbol(attr.data)
+                if op_type is riscv.LUIOp:
+                    value <<= 12
+                elif op_type is riscv.AUIPCOp:
+                    value = text_base + 4 * index + (value << 12)
+            return [f"{dst('rd')} = {to_signed(value)}"]
+
+        if op_type in loads or op_type in stores:
+            attr = op.attributes['immediate']
+            if not isinstance(attr, IntegerAttr):
+                return fallback()
+            offset = attr.value.data
+            if op_type in loads:
+                base = src('rs1')
+            else:
+                # stores keep the stored value in rs1, and the base address
+                # in rs2
+                base = src('rs2')
+            lines = [
+                f"i = {index}",
+                f"address = {base} + {offset}",
+                f"if address < {program.data_base}:",
+                "    memory_fault(address)",
+            ]
+            if op_type in loads:
+                size, signed = loads[op_type]
+                if size == 4:
+                    lines.append(
+                        f"{dst('rd')} = unpack_int32(memory, address)[0]")
+                elif size == 2:
+                    unpack = 'unpack_int16' if signed else 'unpack_uint16'
+                    lines.append(f"{dst('rd')} = {unpack}(memory, address)[0]")
+                elif signed:
+                    lines.extend([
+                        "value = memory[address]",
+                        f"{dst('rd')} = value - 256 if value > 127 else value"
+                    ])
+                else:
+                    lines.append(f"{dst('rd')} = memory[address]")
+            else:
+                size = stores[op_type]
+                if size == 4:
+                    lines.append(f"pack_int32(memory, address, {src('rs1')})")
+                elif size == 2:
+                    lines.append(
+                        f"pack_uint16(memory, address, {src('rs1')} & 0xFFFF)")
+                else:
+                    lines.append(f"memory[address] = {src('rs1')} & 0xFF")
+            return lines
+
+        if op_type in branch_expressions:
+            if issubclass(op_type, riscv.Riscv2Rs1OffOperation):
+                operands = (src('rs1'), src('rs2'))
+            elif op_type in branch_zero_conditions:
+                operands = (src('rs'), )
+            else:
+                # the pseudo branches name their operands rs and rt
+                operands = (src('rs'), src('rt'))
+            target = program.get_target(op, index)
+            condition = branch_expressions[op_type].format(*operands)
+            return [
+                f"return {target} if {condition} else {next_index}"
+            ]
+
+        if op_type is riscv.JOp:
+            return [f"return {program.get_target(op, index)}"]
+
+        if op_type is riscv.JALOp:
+            return [
+                f"{dst('rd')} = {text_base + 4 * next_index}",
+                f"return {program.get_target(op, index)}"
+            ]
+
+        if op_type is riscv.RETOp:
+            ra = riscv.Register.abi_names['ra']
+            return [
+                f"i = {index}",
+                f"return get_instruction_index(regs[{ra}] & 0xFFFFFFFF)"
+            ]
+
+        if op_type is riscv.NOPOp:
+            return []
+    except SimulatorError:
+        # e.g. an unknown label, raised by the closure when it is executed
+        pass
+
+    return fallback()
+
+
+class RecordedInput:
+    """Reads the lines of a stream, recording them to replay them later."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines: Deque[str] = deque()
+
+    def readline(self, size: int = -1) -> str:
+        line = self.stream.readline(size)
+        self.lines.append(line)
+        return line
+
+
+class ReplayedInput:
+    """Replays the lines read from a RecordedInput."""
+
+    def __init__(self, recorded: RecordedInput):
+        self.recorded = recorded
+
+    def readline(self, size: int = -1) -> str:
+        return self.recorded.lines.popleft()
+
+
+class LockStepSimulator(BlockSimulator):
+    """
+    Runs a program one block at a time, executing each block in a reference
+    interpreter as well and raising a SimulatorError as soon as the states
+    of the simulators differ. The reference interpreter reads the input
+    read by this simulator, and its output is discarded.
+
+    The blocks are translated when they are first executed, and the
+    instruction limit is only checked before each block.
+    """
+
+    translation_threshold = 1
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.stdin = RecordedInput(self.stdin)
+        self.reference = Simulator(self.program,
+                                   stdin=ReplayedInput(self.stdin),
+                                   stdout=io.StringIO(),
+                                   stderr=io.StringIO(),
+                                   stack_size=self.stack_size)
+
+    def run(self) -> int:
+        """Run the program until it exits, returning its exit code"""
+        start = time.perf_counter()
+        try:
+            while self.exit_code is None:
+                if (self.max_instructions is not None and
+                        self.instructions_executed >= self.max_instructions):
+                    raise SimulatorError(
+                        f"Aborted after {self.instructions_executed} instructions"
+                    )
+                block_start = self.pc
+                error = None
+                try:
+                    self.run_block()
+                except SimulatorError as e:
+                    error = e
+                reference_error = self.run_reference(error is not None)
+                self.check(block_start, error, reference_error)
+                if error is not None:
+                    raise error
+        finally:
+            self.run_time += time.perf_counter() - start
+        return self.exit_code
+
+    def run_reference(self, failed: bool) -> Optional[SimulatorError]:
+        """
+        Run the reference interpreter up to the pc of this simulator,
+        returning its error if any. If this simulator failed, the reference
+        interpreter is expected to fail at its next instruction at the latest,
+        which is not counted if it is past the end of the program.
+        """
+        reference = self.reference
+        count = self.instructions_executed
+        try:
+            while (reference.exit_code is None
+                   and reference.instructions_executed < count):
+                reference.step()
+            if failed and reference.exit_code is None:
+                reference.step()
+        except SimulatorError as e:
+            return e
+        return None
+
+    def check(self, block_start: int, error: Optional[SimulatorError],
+              reference_error: Optional[SimulatorError]):
+        """Check that the block left both simulators in the same state"""
+        reference = self.reference
+        differences: List[str] = []
+
+        def compare(name: str, value, expected):
+            if value != expected:
+                differences.append(f"{name} is {value}, expected {expected}")
+
+        compare("error", error and str(error), reference_error
+                and str(reference_error))
+        compare("instruction count", self.instructions_executed,
+                reference.instructions_executed)
+        compare("pc", self.pc, reference.pc)
+        compare("exit code", self.exit_code, reference.exit_code)
+        for register in range(32):
+            compare(riscv.Register.names[register],
+                    self.registers[register], reference.registers[register])
+        if self.memory != reference.memory:
+            address = next(
+                address for address, (byte, expected) in enumerate(
+                    zip(self.memory, reference.memory)) if byte != expected)
+            compare(f"memory at {address:#x}", self.memory[address],
+                    reference.memory[address])
+
+        if differences:
+            raise SimulatorError(
+                f"The block at {text_base + 4 * block_start:#x} differs "
+                f"from the interpreter: " + ", ".join(differences) +
+                "\n" + self.get_block_source(block_start))
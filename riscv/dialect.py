@@ -4,9 +4,10 @@ Email: tutorcs@163.com
 # type: ignore
 
 from __future__ import annotations
+import re
 from dataclasses import dataclass, field
 
-from typing import Union, TypeVar, Type
+from typing import ClassVar, List, Union, TypeVar, Type
 
 from xdsl.ir import Operation, Data, MLContext, Dialect
 from xdsl.irdl import (irdl_op_definition, irdl_attr_definition, builder,
@@ -59,25 +60,35 @@ class Register:
         "t6": 31
     }
 
+    registers: ClassVar[List[Register]]
+    """The 32 registers, indexed by their index."""
+
+    names: ClassVar[List[str]]
+    """The ABI name of each register, indexed by the register index."""
+
     @staticmethod
     def from_index(index: int) -> Register:
         assert 32 > index >= 0
-        register = Register(index)
-        return register
+        return Register.registers[index]
 
     @staticmethod
     def from_name(name: str) -> Register:
         if name in Register.abi_names:
-            return Register.from_index(Register.abi_names[name])
+            return Register.registers[Register.abi_names[name]]
         if name[0] == 'x' and name[1:].isnumeric():
             return Register.from_index(int(name[1:]))
         assert False and "register with unknown name"
 
     def get_abi_name(self) -> str:
-        for name, index in Register.abi_names.items():
-            if index == self.index:
-                return name
-        assert False and "Register with unknown index"
+        return Register.names[self.index]
+
+
+Register.registers = [Register(index) for index in range(32)]
+Register.names = [""] * 32
+for name, index in reversed(Register.abi_names.items()):
+    # Iterate in reverse so that the first name of a register wins, e.g. the
+    # register 8 is named "fp" rather than "s0".
+    Register.names[index] = name
 
 
 @irdl_attr_definition
@@ -98,17 +109,22 @@ class RegisterAttr(Data[Register]):
     @staticmethod
     @builder
     def from_index(index: int) -> RegisterAttr:
-        return RegisterAttr(Register.from_index(index))
+        assert 32 > index >= 0
+        return register_attrs[index]
 
     @staticmethod
     @builder
     def from_name(name: str) -> RegisterAttr:
-        return RegisterAttr(Register.from_name(name))
+        return register_attrs[Register.from_name(name).index]
 
     @staticmethod
     @builder
     def from_register(register: Register) -> RegisterAttr:
-        return RegisterAttr(register)
+        return register_attrs[register.index]
+
+
+register_attrs = [RegisterAttr(register) for register in Register.registers]
+"""The attribute of each register, indexed by the register index."""
 
 
 @irdl_attr_definition
@@ -116,9 +132,11 @@ class LabelAttr(Data[str]):
     name = "riscv.label"
 
     @staticmethod
-    def parse_parameter(parser: Parser) -> Data:
-        data = parser.parse_while(lambda x: x != ">")
-        return LabelAttr(data)
+    def parse_parameter(parser: Parser) -> str:
+        data = parser.tokenizer.next_token_of_pattern(re.compile(r"[^>]+"))
+        if data is None:
+            parser.raise_error("Expected a label name")
+        return data.text
 
     @staticmethod
     def print_parameter(label: str, printer: Printer) -> None:
@@ -136,13 +154,15 @@ Op = TypeVar("Op", bound=Operation)
 class Riscv1Rd1Rs1ImmOperation(Operation):
     rd: OpAttr[RegisterAttr]
     rs1: OpAttr[RegisterAttr]
-    immediate: OpAttr[IntegerAttr]
+    immediate: OpAttr[IntegerAttr | LabelAttr]
     comment: OptOpAttr[StringAttr]
 
     @classmethod
     def get(cls: Type[Op], rd, rs1, immediate, comment=None) -> Op:
         if isinstance(immediate, int):
             immediate = IntegerAttr.from_int_and_width(immediate, 64)
+        if isinstance(immediate, str):
+            immediate = LabelAttr.from_str(immediate)
         attributes = {
             "rd": rd,
             "rs1": rs1,
@@ -259,13 +279,15 @@ class Riscv1Rs1Rt1OffOperation(Operation):
 
 class Riscv1Rd1ImmOperation(Operation):
     rd: OpAttr[RegisterAttr]
-    immediate: OpAttr[IntegerAttr]
+    immediate: OpAttr[IntegerAttr | LabelAttr]
     comment: OptOpAttr[StringAttr]
 
     @classmethod
     def get(cls: Type[Op], rd, immediate, comment=None) -> Op:
         if isinstance(immediate, int):
             immediate = IntegerAttr.from_int_and_width(immediate, 64)
+        if isinstance(immediate, str):
+            immediate = LabelAttr.from_str(immediate)
         attributes = {
             "rd": rd,
             "immediate": immediate,
@@ -664,6 +686,11 @@ class LIOp(Riscv1Rd1ImmOperation):
     name = "riscv.li"
 
 
+@irdl_op_definition
+class LAOp(Riscv1Rd1OffOperation):
+    name = "riscv.la"
+
+
 @irdl_op_definition
 class MVOp(Riscv1Rd1RsOperation):
     name = "riscv.mv"
@@ -851,6 +878,7 @@ riscv_ops: List[Type[Operation]] = [
     REMUOp,
     NOPOp,
     LIOp,
+    LAOp,
     MVOp,
     NOTOp,
     NEGOp,
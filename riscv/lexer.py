@@ -94,9 +94,12 @@ class Tokenizer:
             return Token(TokenClass.COLON)
         elif c == '\n':
             return Token(TokenClass.NEWLINE)
-        elif c == '#':
+        elif c == '#' or c == ';':
             while c != '\n' and c != '\r' and c is not None:
                 c = self.scanner.next()
+            # a comment ends the line it is on, e.g. the line of an operation
+            if c == '\n':
+                return Token(TokenClass.NEWLINE)
             return self.next()
         elif c == ' ' or c == '\t':
             return self.next()
@@ -118,7 +121,7 @@ class Tokenizer:
                 value += self.scanner.next()
                 c = self.scanner.peek()
             return Token(TokenClass.INTEGER, value)
-        elif c.isalpha():
+        elif c.isalpha() or c == '_':
             name = c
             c = self.scanner.peek()
             while c is not None and (c.isalpha() or c.isnumeric() or c == '_'):
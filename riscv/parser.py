@@ -40,6 +40,13 @@ class Operand():
         return s
 
 
+def register(operand: Operand) -> riscv.RegisterAttr:
+    # Building the attribute directly is much faster than letting build()
+    # convert the name of the register.
+    assert operand.name
+    return riscv.RegisterAttr.from_name(operand.name)
+
+
 class Parser():
 
     def __init__(self, stream):
@@ -101,11 +108,17 @@ class Parser():
                     yield riscv.DirectiveOp.get(name)
                     continue
 
-                op = self.parseOperand()
-
-                assert op.name
+                # The operands are separated by commas, or by spaces as in
+                # `.loc 1 3 5`
+                values = [self.parseOperand()]
+                while self.token() and not self.isType(TokenClass.NEWLINE):
+                    self.tryMatch(TokenClass.COMMA)
+                    values.append(self.parseOperand())
 
-                yield riscv.DirectiveOp.get(name, op.name)
+                yield riscv.DirectiveOp.get(
+                    name, ", ".join(
+                        value.name if value.name else str(value.immediate)
+                        for value in values))
 
             elif self.isType(TokenClass.SYMBOL):
                 name = self.match(TokenClass.SYMBOL).value
@@ -135,9 +148,16 @@ class Parser():
                 if issubclass(op_def, Riscv1Rd1ImmOperation):
                     assert len(ops) == 2
                     assert ops[0].immediate == None
-                    assert ops[1].name == None
+                    assert ops[1].name == None or ops[1].immediate == None
+
+                    if ops[1].name:
+                        yield f(register(ops[0]), ops[1].name)
+                    else:
+                        yield f(register(ops[0]), ops[1].immediate)
+                elif issubclass(op_def, Riscv1OffOperation):
+                    assert len(ops) == 1
 
-                    yield f(ops[0].name, ops[1].immediate)
+                    yield f(ops[0].name)
                 elif (issubclass(op_def, Riscv1Rs1OffOperation)
                       or issubclass(op_def, Riscv1Rd1OffOperation)):
 
@@ -146,20 +166,27 @@ class Parser():
                     assert ops[1].name == None or ops[1].immediate == None
 
                     if ops[1].name:
-                        yield f(ops[0].name, ops[1].name)
+                        yield f(register(ops[0]), ops[1].name)
                     else:
-                        yield f(ops[0].name, ops[1].immediate)
+                        yield f(register(ops[0]), ops[1].immediate)
                 elif issubclass(op_def, Riscv1Rd2RsOperation):
                     assert ops[1].immediate == None
                     assert ops[2].immediate == None
 
-                    yield f(ops[0].name, ops[1].name, ops[2].name)
+                    yield f(register(ops[0]), register(ops[1]),
+                            register(ops[2]))
                 elif (issubclass(op_def, Riscv1Rd1Rs1ImmOperation)
                       or issubclass(op_def, Riscv2Rs1ImmOperation)):
                     assert len(ops) in [2, 3]
                     if len(ops) == 3:
-                        assert ops[2].name == None
                         assert ops[1].immediate == None
+                        assert ops[2].name == None or ops[2].immediate == None
+
+                        if ops[2].name:
+                            yield f(register(ops[0]), register(ops[1]),
+                                    ops[2].name)
+                            continue
+
                         immediate = ops[2].immediate
                     else:
                         immediate = ops[1].immediate
@@ -169,7 +196,7 @@ class Parser():
 
                     immediate_int = int(immediate)  # type: ignore
 
-                    yield f(ops[0].name, ops[1].name, immediate_int)
+                    yield f(register(ops[0]), register(ops[1]), immediate_int)
                 elif (issubclass(op_def, Riscv2Rs1OffOperation)
                       or issubclass(op_def, Riscv1Rd1Rs1OffOperation)
                       or issubclass(op_def, Riscv1Rs1Rt1OffOperation)):
@@ -179,7 +206,8 @@ class Parser():
                         assert ops[2].name == None or ops[2].immediate == None
 
                         if ops[2].name:
-                            yield f(ops[0].name, ops[1].name, ops[2].name)
+                            yield f(register(ops[0]), register(ops[1]),
+                                    ops[2].name)
                             continue
 
                         immediate = ops[2].immediate
@@ -188,12 +216,12 @@ class Parser():
 
                     immediate_int = int(immediate)  # type: ignore
 
-                    yield f(ops[0].name, ops[1].name, immediate_int)
+                    yield f(register(ops[0]), register(ops[1]), immediate_int)
                 elif issubclass(op_def, Riscv1Rd1RsOperation):
                     assert len(ops) == 2
                     assert ops[0].immediate == None
 
-                    yield f(ops[0].name, ops[1].name)
+                    yield f(register(ops[0]), register(ops[1]))
                 else:
                     raise Exception(f"Unknown operation {name}")
             else:
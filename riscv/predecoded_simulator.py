@@ -0,0 +1,488 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+"""
+An execution engine for the simulator of `riscv.simulator` that decodes the
+program once, rather than reading the attributes of each instruction
+whenever it is executed.
+
+Each instruction is decoded into a closure specialised for its class and
+operands. Its registers are indices in the register list, its immediates
+are integers and its branch targets are indices in the list of closures.
+Executing a closure returns the index of the next instruction, so the main
+loop is only `pc = code[pc]()`.
+"""
+
+from __future__ import annotations
+
+import itertools
+import struct
+import time
+from typing import Callable, Iterable, List
+
+from xdsl.dialects.builtin import IntegerAttr
+from xdsl.ir import Operation
+
+import riscv.dialect as riscv
+from riscv.simulator import (Simulator, SimulatorError, alu_imm_ops, alu_ops,
+                             branch_conditions, branch_zero_conditions,
+                             get_executor, loads, stores, text_base,
+                             to_signed, to_unsigned, unary_ops)
+
+Instruction = Callable[[], int]
+"""A decoded instruction, returning the index of the next instruction."""
+
+sink = 32
+"""
+The index of the register written instead of x0, so that the instructions
+writing a register do not have to check that it is not x0.
+"""
+
+
+class Halt(Exception):
+    """Raised by the system call ending the program."""
+    pass
+
+
+int16 = struct.Struct('<h')
+uint16 = struct.Struct('<H')
+int32 = struct.Struct('<i')
+
+
+class PredecodedSimulator(Simulator):
+    """
+    Runs a program by decoding it into closures before its first instruction
+    is executed. The registers and the memory are the ones of the simulator,
+    so the state is the same as with the interpreter of `Simulator`.
+    """
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.registers.append(0)  # the sink
+        self.code: List[Instruction] = []
+
+    def decode(self) -> List[Instruction]:
+        """Decode the program, once"""
+        if not self.code:
+            instructions = self.program.instructions
+            self.code = [
+                self.decode_instruction(op, index)
+                for index, op in enumerate(instructions)
+            ]
+            self.code.append(fail("Execution reached the end of the program"))
+        return self.code
+
+    def decode_instruction(self, op: Operation, index: int) -> Instruction:
+        """
+        Decode the instruction at index. The instructions that cannot be
+        decoded, e.g. a branch to an unknown label, are executed by the
+        interpreter, which raises their errors when they are executed.
+        """
+        try:
+            return decode(self, op, index)
+        except SimulatorError:
+            pass
+
+        try:
+            execute_op = get_executor(type(op))
+        except SimulatorError as e:
+            return fail(str(e))
+
+        def execute() -> int:
+            self.pc = index + 1
+            execute_op(self, op)
+            return self.pc
+
+        return execute
+
+    def run(self) -> int:
+        """Run the program until it exits, returning its exit code"""
+        code = self.decode()
+        pc = self.pc
+        # the loop variable counts the executed instructions, which is
+        # cheaper than incrementing a counter in the loop
+        first = self.instructions_executed + 1
+        if self.max_instructions is None:
+            counter: Iterable[int] = itertools.count(first)
+        else:
+            counter = range(first, self.max_instructions + 1)
+        count = first - 1
+        start = time.perf_counter()
+        try:
+            for count in counter:
+                pc = code[pc]()
+            raise SimulatorError(f"Aborted after {count} instructions")
+        except Halt:
+            pc = self.pc
+        except SimulatorError:
+            if pc == len(self.program.instructions):
+                # reaching the end of the program is not an instruction
+                count -= 1
+            raise
+        finally:
+            self.run_time += time.perf_counter() - start
+            self.instructions_executed = count
+            self.pc = pc
+        assert self.exit_code is not None
+        return self.exit_code
+
+    def step(self):
+        """Execute the next instruction"""
+        code = self.decode()
+        self.instructions_executed += 1
+        try:
+            self.pc = code[self.pc]()
+        except Halt:
+            pass
+
+
+def fail(message: str) -> Instruction:
+    """An instruction raising a SimulatorError when executed"""
+
+    def execute() -> int:
+        raise SimulatorError(message)
+
+    return execute
+
+
+def memory_fault(address: int):
+    raise SimulatorError(
+        f"Invalid memory access at {to_unsigned(address):#x}")
+
+
+def decode(sim: PredecodedSimulator, op: Operation,
+           index: int) -> Instruction:
+    """Decode the instruction op at index into a closure"""
+    regs = sim.registers
+    program = sim.program
+    get_instruction_index = program.get_instruction_index
+    data_base = program.data_base
+    op_type = type(op)
+    next_index = index + 1
+
+    def src(name: str) -> int:
+        return op.attributes[name].data.index
+
+    def dst(name: str) -> int:
+        return op.attributes[name].data.index or sink
+
+    def immediate() -> int:
+        attr = op.attributes['immediate']
+        if isinstance(attr, IntegerAttr):
+            return attr.value.data
+        return program.get_symbol(attr.data)
+
+    if op_type in alu_ops:
+        d, a, b = dst('rd'), src('rs1'), src('rs2')
+        # the results of additions rarely overflow, so checking if they do
+        # is cheaper than truncating them, and the results of the bitwise
+        # operations and comparisons of 32-bit values never need to be
+        if op_type is riscv.AddOp:
+
+            def execute() -> int:
+                value = regs[a] + regs[b]
+                if -0x80000000 <= value <= 0x7FFFFFFF:
+                    regs[d] = value
+                else:
+                    regs[d] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                return next_index
+        elif op_type is riscv.SubOp:
+
+            def execute() -> int:
+                value = regs[a] - regs[b]
+                if -0x80000000 <= value <= 0x7FFFFFFF:
+                    regs[d] = value
+                else:
+                    regs[d] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                return next_index
+        elif op_type is riscv.MULOp:
+
+            def execute() -> int:
+                value = regs[a] * regs[b]
+                regs[d] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                return next_index
+        elif op_type is riscv.ANDOp:
+
+            def execute() -> int:
+                regs[d] = regs[a] & regs[b]
+                return next_index
+        elif op_type is riscv.OROp:
+
+            def execute() -> int:
+                regs[d] = regs[a] | regs[b]
+                return next_index
+        elif op_type is riscv.XOROp:
+
+            def execute() -> int:
+                regs[d] = regs[a] ^ regs[b]
+                return next_index
+        elif op_type is riscv.SLTOp:
+
+            def execute() -> int:
+                regs[d] = int(regs[a] < regs[b])
+                return next_index
+        else:
+            f2 = alu_ops[op_type]
+
+            def execute() -> int:
+                regs[d] = to_signed(f2(regs[a], regs[b]))
+                return next_index
+    elif op_type in alu_imm_ops:
+        d, a, imm = dst('rd'), src('rs1'), to_signed(immediate())
+        if op_type is riscv.AddIOp:
+
+            def execute() -> int:
+                value = regs[a] + imm
+                if -0x80000000 <= value <= 0x7FFFFFFF:
+                    regs[d] = value
+                else:
+                    regs[d] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                return next_index
+        elif op_type is riscv.ANDIOp:
+
+            def execute() -> int:
+                regs[d] = regs[a] & imm
+                return next_index
+        elif op_type is riscv.ORIOp:
+
+            def execute() -> int:
+                regs[d] = regs[a] | imm
+                return next_index
+        elif op_type is riscv.XORIOp:
+
+            def execute() -> int:
+                regs[d] = regs[a] ^ imm
+                return next_index
+        elif op_type is riscv.SLTIOp:
+
+            def execute() -> int:
+                regs[d] = int(regs[a] < imm)
+                return next_index
+        elif op_type is riscv.SRAIOp:
+            shift = imm & 31
+
+            def execute() -> int:
+                regs[d] = regs[a] >> shift
+                return next_index
+        elif op_type is riscv.SLLIOp:
+            shift = imm & 31
+
+            def execute() -> int:
+                value = regs[a] << shift
+                regs[d] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                return next_index
+        else:
+            fi = alu_imm_ops[op_type]
+
+            def execute() -> int:
+                regs[d] = to_signed(fi(regs[a], imm))
+                return next_index
+    elif op_type in unary_ops:
+        d, a = dst('rd'), src('rs')
+        if op_type is riscv.MVOp:
+
+            def execute() -> int:
+                regs[d] = regs[a]
+                return next_index
+        else:
+            f1 = unary_ops[op_type]
+
+            def execute() -> int:
+                regs[d] = to_signed(f1(regs[a]))
+                return next_index
+    elif op_type in branch_conditions:
+        # the pseudo branches name their operands rs and rt
+        if issubclass(op_type, riscv.Riscv2Rs1OffOperation):
+            a, b = src('rs1'), src('rs2')
+        else:
+            a, b = src('rs'), src('rt')
+        target = program.get_target(op, index)
+        if op_type is riscv.BEQOp:
+
+            def execute() -> int:
+                return target if regs[a] == regs[b] else next_index
+        elif op_type is riscv.BNEOp:
+
+            def execute() -> int:
+                return target if regs[a] != regs[b] else next_index
+        elif op_type is riscv.BLTOp:
+
+            def execute() -> int:
+                return target if regs[a] < regs[b] else next_index
+        elif op_type is riscv.BGEOp:
+
+            def execute() -> int:
+                return target if regs[a] >= regs[b] else next_index
+        else:
+            cond2 = branch_conditions[op_type]
+
+            def execute() -> int:
+                return target if cond2(regs[a], regs[b]) else next_index
+    elif op_type in branch_zero_conditions:
+        a = src('rs')
+        target = program.get_target(op, index)
+        if op_type is riscv.BEQZOp:
+
+            def execute() -> int:
+                return target if regs[a] == 0 else next_index
+        elif op_type is riscv.BNEZOp:
+
+            def execute() -> int:
+                return target if regs[a] != 0 else next_index
+        else:
+            cond1 = branch_zero_conditions[op_type]
+
+            def execute() -> int:
+                return target if cond1(regs[a]) else next_index
+    elif op_type in loads:
+        # the accesses past the end of the memory are detected by the
+        # exceptions they raise, the ones before the data section are not
+        d, a, imm = dst('rd'), src('rs1'), immediate()
+        size, signed = loads[op_type]
+        memory = sim.memory
+        if size == 4:
+            unpack = int32.unpack_from
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    regs[d] = unpack(memory, address)[0]
+                except struct.error:
+                    memory_fault(address)
+                return next_index
+        elif size == 2:
+            unpack = (int16 if signed else uint16).unpack_from
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    regs[d] = unpack(memory, address)[0]
+                except struct.error:
+                    memory_fault(address)
+                return next_index
+        elif signed:
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    value = memory[address]
+                except IndexError:
+                    memory_fault(address)
+                regs[d] = value - 256 if value > 127 else value
+                return next_index
+        else:
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    regs[d] = memory[address]
+                except IndexError:
+                    memory_fault(address)
+                return next_index
+    elif op_type in stores:
+        # stores keep the stored value in rs1, and the base address in rs2
+        v, a, imm = src('rs1'), src('rs2'), immediate()
+        size = stores[op_type]
+        memory = sim.memory
+        if size == 4:
+            pack = int32.pack_into
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    pack(memory, address, regs[v])
+                except struct.error:
+                    memory_fault(address)
+                return next_index
+        elif size == 2:
+            pack = uint16.pack_into
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    pack(memory, address, regs[v] & 0xFFFF)
+                except struct.error:
+                    memory_fault(address)
+                return next_index
+        else:
+
+            def execute() -> int:
+                address = regs[a] + imm
+                if address < data_base:
+                    memory_fault(address)
+                try:
+                    memory[address] = regs[v] & 0xFF
+                except IndexError:
+                    memory_fault(address)
+                return next_index
+    elif op_type in (riscv.LIOp, riscv.LUIOp, riscv.AUIPCOp, riscv.LAOp):
+        d = dst('rd')
+        if op_type is riscv.LIOp:
+            value = to_signed(immediate())
+        elif op_type is riscv.LUIOp:
+            value = to_signed(immediate() << 12)
+        elif op_type is riscv.AUIPCOp:
+            value = to_signed(text_base + 4 * index + (immediate() << 12))
+        else:
+            value = to_signed(program.get_symbol(op.attributes['offset'].data))
+
+        def execute() -> int:
+            regs[d] = value
+            return next_index
+    elif op_type is riscv.JOp:
+        target = program.get_target(op, index)
+
+        def execute() -> int:
+            return target
+    elif op_type is riscv.JALOp:
+        d = dst('rd')
+        target = program.get_target(op, index)
+        return_address = text_base + 4 * next_index
+
+        def execute() -> int:
+            regs[d] = return_address
+            return target
+    elif op_type is riscv.JALROp:
+        d, a = dst('rd'), src('rs1')
+        attr = op.attributes['offset']
+        offset = attr.value.data if isinstance(
+            attr, IntegerAttr) else program.get_symbol(attr.data)
+        return_address = text_base + 4 * next_index
+
+        def execute() -> int:
+            target = (regs[a] + offset) & ~1
+            regs[d] = return_address
+            return get_instruction_index(to_unsigned(target))
+    elif op_type is riscv.RETOp:
+        ra = riscv.Register.abi_names['ra']
+
+        def execute() -> int:
+            return get_instruction_index(to_unsigned(regs[ra]))
+    elif op_type is riscv.ECALLOp:
+
+        def execute() -> int:
+            sim.ecall()
+            if sim.exit_code is not None:
+                sim.pc = next_index
+                raise Halt()
+            return next_index
+    elif op_type is riscv.NOPOp:
+
+        def execute() -> int:
+            return next_index
+    else:
+        raise SimulatorError(f"Unsupported instruction '{op_type.name[6:]}'")
+
+    return execute
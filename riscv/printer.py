@@ -3,149 +3,221 @@ QQ: 749389476
 Email: tutorcs@163.com
 from riscv.dialect import *
 import sys
+from typing import Callable, Dict, List, Optional, Tuple, Type
 
+from xdsl.dialects.builtin import ArrayAttr
+from xdsl.ir import Attribute
 
-def print_op(op, stream=sys.stdout):
-    attr = op.attributes
+OperandFormatter = Callable[[Dict[str, Attribute]], str]
 
-    if isinstance(op, CommentOp):
-        if 'comment' in attr.keys():
-            print(f"    \t# {attr['comment'].data}", file=stream)
-        else:
-            print("", file=stream)
 
-        return
+def get_offset(attr: Dict[str, Attribute]):
+    """Get the offset of an operation, that is an integer or a label."""
+    if isinstance(attr['offset'], IntegerAttr):
+        return attr['offset'].parameters[0].data
+    return attr['offset'].data
 
-    if isinstance(op, LabelOp):
-        print("%s:" % (attr['label'].data), file=stream)
-        return
 
-    if isinstance(op, DirectiveOp):
-        print(".%s %s" % (attr['directive'].data, attr['value'].data),
-              file=stream)
-        return
+def get_immediate(attr: Dict[str, Attribute]):
+    """Get the immediate of an operation, that is an integer or a symbol."""
+    if isinstance(attr['immediate'], IntegerAttr):
+        return attr['immediate'].value.data
+    return attr['immediate'].data
 
-    name = op.name[6:]
 
-    print(f"\t{name}", end='', file=stream)
+def format_no_params(attr: Dict[str, Attribute]) -> str:
+    return ""
 
-    if isinstance(op, RiscvNoParamsOperation):
-        print("", file=stream, end="")
 
-    elif isinstance(op, Riscv1Rd1ImmOperation):
-        print(" %s, %s" %
-              (attr['rd'].data.get_abi_name(), attr['immediate'].value.data),
-              file=stream,
-              end="")
+def format_rd_imm(attr: Dict[str, Attribute]) -> str:
+    return f" {attr['rd'].data.get_abi_name()}, {get_immediate(attr)}"
 
-    elif isinstance(op, Riscv1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
-        print(" %s" % (offset), file=stream, end="")
 
-    elif isinstance(op, Riscv1Rd1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
-        print(" %s, %s" % (attr['rd'].data.get_abi_name(), offset),
-              file=stream,
-              end="")
-
-    elif isinstance(op, Riscv1Rd1RsOperation):
-        print(" %s, %s" %
-              (attr['rd'].data.get_abi_name(), attr['rs'].data.get_abi_name()),
-              file=stream,
-              end="")
-
-    elif isinstance(op, Riscv1Rs1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
-        print(" %s, %s" % (attr['rs'].data.get_abi_name(), offset),
-              file=stream,
-              end="")
-
-    elif isinstance(op, Riscv1Rd2RsOperation):
-        print(" %s, %s, %s" %
-              (attr['rd'].data.get_abi_name(), attr['rs1'].data.get_abi_name(),
-               attr['rs2'].data.get_abi_name()),
-              file=stream,
-              end="")
-
-    elif isinstance(op, Riscv1Rd1Rs1ImmOperation):
-        rd = attr['rd'].data.get_abi_name()
-        rs1 = attr['rs1'].data.get_abi_name()
-        immediate = attr['immediate'].value.data
-        if isinstance(op, (LBOp, LBUOp, LHOp, LHUOp, LWOp)):
-            output = f" {rd}, {immediate}({rs1})"
-        else:
-            output = f" {rd}, {rs1}, {immediate}"
-        print(output, file=stream, end="")
-
-    elif isinstance(op, Riscv1Rd1RsOperation):
-        print(
-            " %s, %s" %
-            (attr['rd'].data.get_abi_name(), attr['rs1'].data.get_abi_name()),
-            end='',
-            file=stream)
-
-        immediate = attr['immediate'].value.data
-        print(", %s" % (immediate), file=stream, end="")
-
-    elif isinstance(op, Riscv2Rs1ImmOperation):
-        rs1 = attr['rs1'].data.get_abi_name()
-        rs2 = attr['rs2'].data.get_abi_name()
-        immediate = attr['immediate'].value.data
-        if isinstance(op, (SBOp, SHOp, SWOp)):
-            output = f" {rs1}, {immediate}({rs2})"
-        else:
-            output = f" {rs1}, {rs2}, {immediate}"
-        print(output, file=stream, end="")
+def format_off(attr: Dict[str, Attribute]) -> str:
+    return f" {get_offset(attr)}"
 
-    elif isinstance(op, Riscv2Rs1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
 
-        print(" %s, %s, %s" % (attr['rs1'].data.get_abi_name(),
-                               attr['rs2'].data.get_abi_name(), offset),
-              file=stream,
-              end="")
+def format_rd_off(attr: Dict[str, Attribute]) -> str:
+    return f" {attr['rd'].data.get_abi_name()}, {get_offset(attr)}"
 
-    elif isinstance(op, Riscv1Rs1Rt1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
 
-        print(" %s, %s, %s" % (attr['rs'].data.get_abi_name(),
-                               attr['rt'].data.get_abi_name(), offset),
-              file=stream,
-              end="")
+def format_rd_rs(attr: Dict[str, Attribute]) -> str:
+    return f" {attr['rd'].data.get_abi_name()}, {attr['rs'].data.get_abi_name()}"
+
+
+def format_rs_off(attr: Dict[str, Attribute]) -> str:
+    return f" {attr['rs'].data.get_abi_name()}, {get_offset(attr)}"
+
+
+def format_rd_rs1_rs2(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rd'].data.get_abi_name()}, "
+            f"{attr['rs1'].data.get_abi_name()}, "
+            f"{attr['rs2'].data.get_abi_name()}")
+
+
+def format_load(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rd'].data.get_abi_name()}, "
+            f"{attr['immediate'].value.data}"
+            f"({attr['rs1'].data.get_abi_name()})")
+
+
+def format_rd_rs1_imm(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rd'].data.get_abi_name()}, "
+            f"{attr['rs1'].data.get_abi_name()}, "
+            f"{get_immediate(attr)}")
+
+
+def format_store(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rs1'].data.get_abi_name()}, "
+            f"{attr['immediate'].value.data}"
+            f"({attr['rs2'].data.get_abi_name()})")
+
+
+def format_rs1_rs2_imm(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rs1'].data.get_abi_name()}, "
+            f"{attr['rs2'].data.get_abi_name()}, "
+            f"{attr['immediate'].value.data}")
 
-    elif isinstance(op, Riscv1Rd1Rs1OffOperation):
-        if isinstance(attr['offset'], IntegerAttr):
-            offset = attr['offset'].parameters[0].data
-        else:
-            offset = attr['offset'].data
 
-        print(" %s, %s, %s" % (attr['rd'].data.get_abi_name(),
-                               attr['rs1'].data.get_abi_name(), offset),
-              file=stream,
-              end="")
+def format_rs1_rs2_off(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rs1'].data.get_abi_name()}, "
+            f"{attr['rs2'].data.get_abi_name()}, {get_offset(attr)}")
 
+
+def format_rs_rt_off(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rs'].data.get_abi_name()}, "
+            f"{attr['rt'].data.get_abi_name()}, {get_offset(attr)}")
+
+
+def format_rd_rs1_off(attr: Dict[str, Attribute]) -> str:
+    return (f" {attr['rd'].data.get_abi_name()}, "
+            f"{attr['rs1'].data.get_abi_name()}, {get_offset(attr)}")
+
+
+operand_formats: List[Tuple[Type[Operation], OperandFormatter]] = [
+    (RiscvNoParamsOperation, format_no_params),
+    (Riscv1Rd1ImmOperation, format_rd_imm),
+    (Riscv1OffOperation, format_off),
+    (Riscv1Rd1OffOperation, format_rd_off),
+    (Riscv1Rd1RsOperation, format_rd_rs),
+    (Riscv1Rs1OffOperation, format_rs_off),
+    (Riscv1Rd2RsOperation, format_rd_rs1_rs2),
+    ((LBOp, LBUOp, LHOp, LHUOp, LWOp), format_load),
+    (Riscv1Rd1Rs1ImmOperation, format_rd_rs1_imm),
+    ((SBOp, SHOp, SWOp), format_store),
+    (Riscv2Rs1ImmOperation, format_rs1_rs2_imm),
+    (Riscv2Rs1OffOperation, format_rs1_rs2_off),
+    (Riscv1Rs1Rt1OffOperation, format_rs_rt_off),
+    (Riscv1Rd1Rs1OffOperation, format_rd_rs1_off),
+]
+"""
+The format of the operands of each operation class. The first entry
+matching an operation is used.
+"""
+
+OpFormatter = Callable[[Operation], str]
+
+op_formatters: Dict[Type[Operation], OpFormatter] = dict()
+"""The formatter of each operation class that was printed, built lazily."""
+
+
+def format_comment_op(op: Operation) -> str:
+    if 'comment' in op.attributes:
+        return f"    \t# {op.attributes['comment'].data}"
+    return ""
+
+
+def format_label_op(op: Operation) -> str:
+    return f"{op.attributes['label'].data}:"
+
+
+def format_directive_op(op: Operation) -> str:
+    attr = op.attributes
+    return f".{attr['directive'].data} {attr['value'].data}"
+
+
+def get_op_formatter(op_type: Type[Operation]) -> OpFormatter:
+    """Get the function formatting the operations of a class."""
+    if op_type in op_formatters:
+        return op_formatters[op_type]
+
+    if issubclass(op_type, CommentOp):
+        formatter = format_comment_op
+    elif issubclass(op_type, LabelOp):
+        formatter = format_label_op
+    elif issubclass(op_type, DirectiveOp):
+        formatter = format_directive_op
     else:
-        raise Exception(f"Trying to print unknown operation '{op.name}'")
+        for op_class, format_operands in operand_formats:
+            if issubclass(op_type, op_class):
+                break
+        else:
+            raise Exception(
+                f"Trying to print unknown operation '{op_type.name}'")
+        prefix = f"\t{op_type.name[6:]}"
 
-    if 'comment' in attr.keys():
-        print(f"    \t# {attr['comment'].data}", file=stream, end="")
+        def formatter(op: Operation,
+                      prefix: str = prefix,
+                      format_operands: OperandFormatter = format_operands
+                      ) -> str:
+            attr = op.attributes
+            line = prefix + format_operands(attr)
+            if 'comment' in attr:
+                line += f"    \t# {attr['comment'].data}"
+            return line
 
-    print("", file=stream)
+    op_formatters[op_type] = formatter
+    return formatter
+
+
+def format_op(op: Operation) -> str:
+    """Format an operation as a line of assembly, without the newline."""
+    return get_op_formatter(type(op))(op)
+
+
+def print_op(op, stream=sys.stdout):
+    stream.write(format_op(op) + "\n")
+
+
+program_header = [
+    "\t.data",
+    "_heap:\t.space 102400",
+    "_heap_tree_ptr:\t.word 100",
+    "\t.text",
+    "# Initialize the heap memory",
+    "\tla t0, _heap",
+    "\tla t1, _heap_tree_ptr",
+    "\tsw t0, 0(t1)",
+]
+
+program_footer = [
+    "_malloc:",
+    "\tla t0, _heap_tree_ptr",
+    "\tlw t1, 0(t0)",
+    "\tadd t2, t1, a0",
+    "\tsw t2, 0(t0)",
+    "\taddi a0, t1, 0",
+    "\tret",
+]
+
+unlocated_ops = (CommentOp, LabelOp, DirectiveOp)
+"""The operations that are not instructions, and need no .loc directive."""
+
+
+def format_location(loc: Optional[Attribute]) -> str:
+    """
+    Format the `loc` attribute of an instruction as a .loc directive, whose
+    file is always 1, the compiled source. Instructions without location
+    are given line 0.
+    """
+    if not isinstance(loc, ArrayAttr):
+        return "\t.loc 1 0 0"
+    line, column = loc.data
+    return f"\t.loc 1 {line.value.data} {column.value.data}"
+
+
+lines_per_write = 4096
+"""Number of lines of assembly buffered before writing them to the stream."""
 
 
 def print_program(instructions, fmt, stream=sys.stdout):
@@ -155,22 +227,19 @@ def print_program(instructions, fmt, stream=sys.stdout):
             printer.print_op(i)
             print("", file=stream)
     else:
-        print("\t.data", file=stream)
-        print("_heap:\t.space 102400", file=stream)
-        print("_heap_tree_ptr:\t.word 100", file=stream)
-        print("\t.text", file=stream)
-        print("# Initialize the heap memory", file=stream)
-        print("\tla t0, _heap", file=stream)
-        print("\tla t1, _heap_tree_ptr", file=stream)
-        print("\tsw t0, 0(t1)", file=stream)
-
+        lines = list(program_header)
+        # The location of the previous instruction
+        loc = None
         for op in instructions:
-            print_op(op, stream=stream)
-
-        print("_malloc:", file=stream)
-        print("\tla t0, _heap_tree_ptr", file=stream)
-        print("\tlw t1, 0(t0)", file=stream)
-        print("\tadd t2, t1, a0", file=stream)
-        print("\tsw t2, 0(t0)", file=stream)
-        print("\taddi a0, t1, 0", file=stream)
-        print("\tret", file=stream)
+            op_loc = op.attributes.get('loc')
+            if op_loc != loc and not isinstance(op, unlocated_ops):
+                loc = op_loc
+                lines.append(format_location(loc))
+            lines.append(get_op_formatter(type(op))(op))
+            if len(lines) >= lines_per_write:
+                lines.append("")
+                stream.write("\n".join(lines))
+                lines = []
+        lines += program_footer
+        lines.append("")
+        stream.write("\n".join(lines))
@@ -0,0 +1,210 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+"""
+A profiler of the programs run by the simulator of `riscv.simulator`,
+counting the instructions executed per label, per function and per class
+of instruction, e.g. loads or branches.
+
+The functions of a program are the entry point and the targets of the
+calls, i.e. of the jumps saving a return address. Each instruction belongs
+to the function whose entry precedes it, and to the label preceding it.
+Besides, the calls and returns executed are tracked to attribute the
+instructions to their call stack, which can be written in the folded stack
+format of flame graph tools: one line per stack, with its functions
+separated by `;` and followed by its number of instructions.
+
+When the program has .loc directives, as emitted by choco-opt with
+--source-locations, the instructions are also counted per source line.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Type
+
+from xdsl.ir import Operation
+
+import riscv.dialect as riscv
+from riscv.predecoded_simulator import Instruction, PredecodedSimulator
+from riscv.simulator import (SimulatorError, alu_imm_ops, alu_ops,
+                             branch_conditions, branch_zero_conditions, loads,
+                             stores, text_base, unary_ops)
+
+instruction_classes: Dict[Type[Operation], str] = {
+    **{op_type: 'load' for op_type in loads},
+    **{op_type: 'store' for op_type in stores},
+    **{op_type: 'branch' for op_type in branch_conditions},
+    **{op_type: 'branch' for op_type in branch_zero_conditions},
+    **{
+        op_type: 'jump'
+        for op_type in [riscv.JOp, riscv.JALOp, riscv.JALROp, riscv.RETOp]
+    },
+    **{op_type: 'alu' for op_type in alu_ops},
+    **{op_type: 'alu' for op_type in alu_imm_ops},
+    **{op_type: 'alu' for op_type in unary_ops},
+    **{
+        op_type: 'alu'
+        for op_type in
+        [riscv.LIOp, riscv.LUIOp, riscv.AUIPCOp, riscv.LAOp]
+    },
+    riscv.ECALLOp: 'system',
+    riscv.EBREAKOp: 'system',
+}
+"""The class of each instruction, the other instructions are of class 'other'."""
+
+
+def get_instruction_class(op: Operation) -> str:
+    return instruction_classes.get(type(op), 'other')
+
+
+def is_call(op: Operation) -> bool:
+    """Check if an instruction is a jump saving its return address"""
+    return (isinstance(op, (riscv.JALOp, riscv.JALROp))
+            and op.attributes['rd'].data.index != 0)
+
+
+def is_return(op: Operation) -> bool:
+    """Check if an instruction is a jump to the return address"""
+    ra = riscv.Register.abi_names['ra']
+    return isinstance(op, riscv.RETOp) or (
+        isinstance(op, riscv.JALROp) and op.attributes['rd'].data.index == 0
+        and op.attributes['rs1'].data.index == ra)
+
+
+class ProfilingSimulator(PredecodedSimulator):
+    """
+    Runs a program with the predecoded engine, counting the executions of
+    each instruction and tracking the calls and returns.
+    """
+
+    def __post_init__(self):
+        super().__post_init__()
+        instructions = self.program.instructions
+        self.instruction_counts: List[int] = [0] * len(instructions)
+        self.call_counts: Counter[str] = Counter()
+        self.stack_counts: Counter[str] = Counter()
+        # the number of instructions executed, and when the call stack last
+        # changed
+        self.executed = [0]
+        self.stack_changed = 0
+
+        self.label_names: Dict[int, str] = dict()
+        for name, address in self.program.labels.items():
+            if name in self.program.text_labels:
+                self.label_names.setdefault((address - text_base) >> 2, name)
+
+        self.function_entries = {self.program.entry}
+        for index, op in enumerate(instructions):
+            if isinstance(op, riscv.JALOp) and is_call(op):
+                try:
+                    self.function_entries.add(
+                        self.program.get_target(op, index))
+                except SimulatorError:
+                    pass
+        self.stack = [self.get_name(self.program.entry)]
+
+    def get_name(self, index: int) -> str:
+        """Get the name of the instruction at index, its label if any"""
+        if index in self.label_names:
+            return self.label_names[index]
+        return f"{text_base + 4 * index:#x}"
+
+    def decode_instruction(self, op: Operation, index: int) -> Instruction:
+        execute = super().decode_instruction(op, index)
+        counts = self.instruction_counts
+        executed = self.executed
+
+        if is_call(op):
+
+            def call() -> int:
+                counts[index] += 1
+                executed[0] += 1
+                target = execute()
+                self.change_stack()
+                self.stack.append(self.get_name(target))
+                self.call_counts[self.stack[-1]] += 1
+                return target
+
+            return call
+
+        if is_return(op):
+
+            def return_() -> int:
+                counts[index] += 1
+                executed[0] += 1
+                target = execute()
+                self.change_stack()
+                if len(self.stack) > 1:
+                    self.stack.pop()
+                return target
+
+            return return_
+
+        def count() -> int:
+            counts[index] += 1
+            executed[0] += 1
+            return execute()
+
+        return count
+
+    def change_stack(self):
+        """
+        Attribute the instructions executed since the last call or return to
+        the current call stack
+        """
+        self.stack_counts[';'.join(self.stack)] += (self.executed[0] -
+                                                    self.stack_changed)
+        self.stack_changed = self.executed[0]
+
+    def get_stack_counts(self) -> Counter[str]:
+        """Get the number of instructions executed by each call stack"""
+        self.change_stack()
+        return Counter({
+            stack: count
+            for stack, count in self.stack_counts.items() if count
+        })
+
+    def get_profile(self) -> Dict[str, object]:
+        """Get the instruction counts of the profile, as a JSON object"""
+        classes: Counter[str] = Counter()
+        labels: Counter[str] = Counter()
+        functions: Counter[str] = Counter()
+        lines: Counter[str] = Counter()
+        label: Optional[str] = None
+        function: Optional[str] = None
+        for index, op in enumerate(self.program.instructions):
+            if index in self.label_names:
+                label = self.label_names[index]
+            if index in self.function_entries:
+                function = self.get_name(index)
+            count = self.instruction_counts[index]
+            if not count:
+                continue
+            classes[get_instruction_class(op)] += count
+            labels[label or self.get_name(0)] += count
+            functions[function or self.get_name(0)] += count
+            if self.program.lines[index]:
+                lines[str(self.program.lines[index])] += count
+
+        return {
+            'instructions': sum(self.instruction_counts),
+            'classes': dict(classes.most_common()),
+            'functions': {
+                name: {
+                    'instructions': count,
+                    'calls': self.call_counts[name],
+                }
+                for name, count in functions.most_common()
+            },
+            'labels': dict(labels.most_common()),
+            'lines': dict(lines.most_common()),
+        }
+
+    def format_json(self) -> str:
+        return json.dumps(self.get_profile(), indent=2) + "\n"
+
+    def format_folded_stacks(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(
+            self.get_stack_counts().items()))
@@ -6,6 +6,7 @@ Email: tutorcs@163.com
 from __future__ import annotations
 
 from choco.dialects.choco_flat import FuncDef
+from choco.source_location import LocatedPattern, copy_location
 import riscv.dialect as riscv
 from riscv.dialect import RegisterAttr, Register
 import riscv.ssa_dialect as riscvssa
@@ -13,35 +14,746 @@ import riscv.ssa_dialect as riscvssa
 from xdsl.ir import ErasedSSAValue, Operation, SSAValue, MLContext
 from xdsl.printer import Printer
 from xdsl.pattern_rewriter import RewritePattern, PatternRewriter, GreedyRewritePatternApplier, PatternRewriteWalker
-from xdsl.dialects.builtin import ModuleOp
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp
 
+from bisect import bisect_right
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Optional, List, Tuple, Dict
+import heapq
+from typing import Optional, List, Tuple, Dict, Set, Union, Deque
 from io import StringIO
+import sys
+
+from riscv import register_allocators
+
+caller_saved_registers = [
+    "t3", "t4", "t5", "t6", "a0", "a1", "a2", "a3", "a4", "a5", "a6", "a7"
+]
+"""Registers available to values that are not live across a call."""
+
+callee_saved_registers = [
+    "s1", "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9", "s10", "s11"
+]
+"""
+Registers that are preserved across calls, saved by the callee.
+s0 is left out as it is the frame pointer.
+"""
+
+branch_ops = (riscvssa.BEQOp, riscvssa.BNEOp, riscvssa.BLTOp, riscvssa.BGEOp,
+              riscvssa.BLTUOp, riscvssa.BGEUOp)
+call_ops = (riscvssa.CallOp, riscvssa.ECALLOp, riscvssa.JALOp,
+            riscvssa.JALROp)
 
 
 def allocate_registers(
-        func: FuncDef) -> Tuple[int, Dict[SSAValue, int], int, Dict[Op, int]]:
+    func: FuncDef,
+    pinned: Set[SSAValue] = set()
+) -> Tuple[int, Dict[SSAValue, int], int, Dict[Operation, int]]:
     """
-    Allocate each infinite register to a place in the stack.
-    returns the number of register spilled, and the position of
+    Allocate each infinite register to a place in the stack. Infinite
+    registers that are never live at the same time share the same place,
+    except the ones in `pinned`.
+    returns the number of places used, and the position of
     each infinite register on the stack.
     """
-    spilled_reg = 0
+    spilled_reg, stack_pos = assign_stack_slots(func,
+                                                get_defined_values(func),
+                                                pinned)
+    stack_vars, alloc_to_stack_var = get_stack_vars(func)
+    return spilled_reg, stack_pos, stack_vars, alloc_to_stack_var
+
+
+@dataclass
+class Allocation:
+    """
+    The allocation of the infinite registers of a function to physical
+    registers and stack slots.
+    """
+
+    spilled_reg: int
+    """The number of stack slots used by spilled infinite registers."""
+    stack_pos: Dict[SSAValue, int]
+    """The stack slot of each spilled infinite register."""
+    register_pos: Dict[SSAValue, Register]
+    """The physical register of each other infinite register."""
+    stack_vars: int
+    """The number of stack slots of the variables allocated on the stack."""
+    alloc_to_stack_var: Dict[Operation, int]
+    """The stack slot of each variable allocated on the stack."""
+
+
+@dataclass
+class LiveInterval:
+    """
+    The positions between which an SSA value is live, in the linear order
+    of the operations of a function. Block arguments start at position -1.
+    """
+
+    value: SSAValue
+    start: int
+    end: int
+    crosses_call: bool = False
+    """Whether the value is live across a call or an ecall."""
+
+
+def get_function_ops(func: riscvssa.FuncOp) -> List[Operation]:
+    """Get the operations of a function, without nested function definitions."""
+    return [
+        op for op in func.func_body.ops if not isinstance(op, riscvssa.FuncOp)
+    ]
+
+
+def get_branch_label(op: Operation) -> Optional[str]:
+    """Get the label a branch or jump operation jumps to, if it is known."""
+    offset = op.attributes['offset']
+    if isinstance(offset, riscv.LabelAttr):
+        return offset.data
+    return None
+
+
+def get_basic_blocks(
+        ops: List[Operation]) -> Tuple[List[Tuple[int, int]], List[List[int]]]:
+    """
+    Split a list of operations into basic blocks.
+    returns the first and last position of each block, and the
+    successors of each block.
+    """
+    if not ops:
+        return [], []
+
+    block_starts = [0]
+    for idx, op in enumerate(ops):
+        if isinstance(op, riscvssa.LabelOp) and idx != block_starts[-1]:
+            block_starts.append(idx)
+        elif isinstance(op, branch_ops + (riscvssa.JOp, riscvssa.ReturnOp)):
+            if idx + 1 < len(ops):
+                block_starts.append(idx + 1)
+    blocks = [(start, end - 1)
+              for start, end in zip(block_starts, block_starts[1:] +
+                                    [len(ops)])]
+
+    label_to_block = dict()
+    for idx, (start, _) in enumerate(blocks):
+        if isinstance(ops[start], riscvssa.LabelOp):
+            label_to_block[ops[start].attributes['label'].data] = idx
+
+    successors = []
+    for idx, (_, end) in enumerate(blocks):
+        last = ops[end]
+        block_successors = []
+        if isinstance(last, branch_ops + (riscvssa.JOp, )):
+            label = get_branch_label(last)
+            # Jumps to labels outside of the function, such as the runtime
+            # error handlers, never come back.
+            if label in label_to_block:
+                block_successors.append(label_to_block[label])
+        if not isinstance(last, (riscvssa.JOp, riscvssa.ReturnOp)):
+            if idx + 1 < len(blocks):
+                block_successors.append(idx + 1)
+        successors.append(block_successors)
+
+    return blocks, successors
+
+
+def compute_liveness(
+    ops: List[Operation]
+) -> Tuple[List[Tuple[int, int]], List[List[int]], List[Set[SSAValue]],
+           List[Set[SSAValue]]]:
+    """
+    Compute the values live at the beginning and at the end of each
+    basic block of a list of operations.
+    returns the basic blocks, their successors, and the values live
+    at their beginning and at their end.
+    """
+    blocks, successors = get_basic_blocks(ops)
+
+    # Compute the values used before being defined, and the values
+    # defined, in each basic block.
+    uses: List[Set[SSAValue]] = []
+    defs: List[Set[SSAValue]] = []
+    for start, end in blocks:
+        block_uses = set()
+        block_defs = set()
+        for op in ops[start:end + 1]:
+            for operand in op.operands:
+                if operand not in block_defs:
+                    block_uses.add(operand)
+            block_defs.update(op.results)
+        uses.append(block_uses)
+        defs.append(block_defs)
+
+    # Backward dataflow analysis until a fixpoint is reached.
+    live_in: List[Set[SSAValue]] = [set() for _ in blocks]
+    live_out: List[Set[SSAValue]] = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for idx in reversed(range(len(blocks))):
+            out = set()
+            for succ in successors[idx]:
+                out |= live_in[succ]
+            new_in = uses[idx] | (out - defs[idx])
+            if out != live_out[idx] or new_in != live_in[idx]:
+                live_out[idx] = out
+                live_in[idx] = new_in
+                changed = True
+
+    return blocks, successors, live_in, live_out
+
+
+def get_defined_values(func: riscvssa.FuncOp) -> List[SSAValue]:
+    """
+    Get the values defined in a function, including its arguments,
+    in the order of their definition.
+    """
+    defined: List[SSAValue] = list(func.func_body.blocks[0].args)
+    for op in get_function_ops(func):
+        defined.extend(op.results)
+    return defined
+
+
+def get_stack_vars(
+        func: riscvssa.FuncOp) -> Tuple[int, Dict[Operation, int]]:
+    """Get the number of stack-allocated variables, and their position."""
     stack_vars = 0
-    stack_pos = dict()
     alloc_to_stack_var = dict()
-    for arg in func.func_body.blocks[0].args:
-        stack_pos[arg] = spilled_reg
-        spilled_reg += 1
-    for op in func.func_body.ops:
-        for result in op.results:
-            stack_pos[result] = spilled_reg
-            spilled_reg += 1
+    for op in get_function_ops(func):
         if isinstance(op, riscvssa.AllocOp):
             alloc_to_stack_var[op] = stack_vars
             stack_vars += 1
-    return spilled_reg, stack_pos, stack_vars, alloc_to_stack_var
+    return stack_vars, alloc_to_stack_var
+
+
+def compute_live_intervals(
+        func: riscvssa.FuncOp) -> Dict[SSAValue, LiveInterval]:
+    """
+    Compute the live interval of each SSA value defined in a function.
+    Liveness is computed on the control-flow graph formed by labels and
+    branches, and each interval spans all positions where its value may
+    be live.
+    """
+    ops = get_function_ops(func)
+    blocks, _, live_in, live_out = compute_liveness(ops)
+    defined = set(get_defined_values(func))
+
+    intervals: Dict[SSAValue, LiveInterval] = dict()
+
+    def extend(value: SSAValue, pos: int):
+        # Values defined outside of the function are not allocated here.
+        if value not in defined:
+            return
+        interval = intervals.get(value)
+        if interval is None:
+            intervals[value] = LiveInterval(value, pos, pos)
+        else:
+            interval.start = min(interval.start, pos)
+            interval.end = max(interval.end, pos)
+
+    for arg in func.func_body.blocks[0].args:
+        extend(arg, -1)
+    for idx, op in enumerate(ops):
+        for operand in op.operands:
+            extend(operand, idx)
+        for result in op.results:
+            extend(result, idx)
+    for idx, (start, end) in enumerate(blocks):
+        for value in live_in[idx]:
+            extend(value, start)
+        for value in live_out[idx]:
+            extend(value, end)
+
+    call_positions = [
+        idx for idx, op in enumerate(ops) if isinstance(op, call_ops)
+    ]
+    for interval in intervals.values():
+        next_call = bisect_right(call_positions, interval.start)
+        if next_call < len(call_positions):
+            interval.crosses_call = call_positions[next_call] < interval.end
+
+    return intervals
+
+
+def allocate_registers_linear_scan(
+    func: riscvssa.FuncOp,
+    pinned: Set[SSAValue] = set()
+) -> Allocation:
+    """
+    Allocate each infinite register to a physical register, using a linear
+    scan over the live intervals of the function. Values are spilled on
+    the stack only when no register is left, values live across a call
+    only use callee-saved registers, and values in `pinned` are always
+    placed on the stack. Values that are never used are not allocated.
+    returns the allocation of the function.
+    """
+    intervals = compute_live_intervals(func)
+
+    spilled: List[SSAValue] = []
+    register_pos = dict()
+
+    callee_saved = [Register.from_name(name) for name in callee_saved_registers]
+    free_caller_saved: Deque[Register] = deque(
+        Register.from_name(name) for name in caller_saved_registers)
+    free_callee_saved: Deque[Register] = deque(callee_saved)
+
+    # The intervals holding a register, as a heap of (end, order, interval)
+    # where order is the position of the interval in the scan. Spilled
+    # intervals are left in the heap, and skipped once they lost their
+    # register.
+    active: List[Tuple[int, int, LiveInterval]] = []
+    intervals = sorted(intervals.values(), key=lambda i: i.start)
+    for order, interval in enumerate(intervals):
+        if interval.value in pinned:
+            spilled.append(interval.value)
+            continue
+        if not interval.value.uses:
+            continue
+
+        # Free the registers of the intervals that ended, in the order they
+        # were allocated. An interval ending where the current one starts
+        # is only read by the operation defining the current value, so they
+        # can share a register.
+        ended = []
+        while active and active[0][0] <= interval.start:
+            ended.append(heapq.heappop(active))
+        for _, _, old in sorted(ended, key=lambda entry: entry[1]):
+            reg = register_pos.get(old.value)
+            if reg is None:
+                continue
+            if reg in callee_saved:
+                free_callee_saved.append(reg)
+            else:
+                free_caller_saved.append(reg)
+
+        if not interval.crosses_call and free_caller_saved:
+            register_pos[interval.value] = free_caller_saved.popleft()
+            heapq.heappush(active, (interval.end, order, interval))
+            continue
+        if free_callee_saved:
+            register_pos[interval.value] = free_callee_saved.popleft()
+            heapq.heappush(active, (interval.end, order, interval))
+            continue
+
+        # No register is free: spill the interval that ends last. Only the
+        # intervals still holding a register are candidates, so there are at
+        # most as many candidates as registers.
+        candidates = [
+            (end, -other_order, other)
+            for end, other_order, other in active
+            if other.value in register_pos and (
+                not interval.crosses_call
+                or register_pos[other.value] in callee_saved)
+        ]
+        victim = max(candidates, key=lambda entry: entry[:2], default=None)
+        if victim is not None and victim[0] > interval.end:
+            register_pos[interval.value] = register_pos.pop(victim[2].value)
+            spilled.append(victim[2].value)
+            heapq.heappush(active, (interval.end, order, interval))
+        else:
+            spilled.append(interval.value)
+
+    spilled_reg, stack_pos = assign_stack_slots(func, spilled, pinned)
+    stack_vars, alloc_to_stack_var = get_stack_vars(func)
+    return Allocation(spilled_reg, stack_pos, register_pos, stack_vars,
+                      alloc_to_stack_var)
+
+
+def is_copy(op: Operation) -> bool:
+    """Check whether an operation copies a register into another one."""
+    return isinstance(op, riscvssa.AddIOp) and isinstance(
+        op.attributes['immediate'],
+        IntegerAttr) and op.attributes['immediate'].value.data == 0
+
+
+def get_loop_depths(blocks: List[Tuple[int, int]],
+                    successors: List[List[int]]) -> List[int]:
+    """
+    Get the loop depth of each basic block. Loops are lowered with a
+    backward jump to their header, so each backward edge in the block
+    order forms a loop containing the blocks between its two ends.
+    """
+    depths = [0] * len(blocks)
+    for idx, block_successors in enumerate(successors):
+        for succ in block_successors:
+            if succ <= idx:
+                for block in range(succ, idx + 1):
+                    depths[block] += 1
+    return depths
+
+
+@dataclass
+class InterferenceGraph:
+    """
+    The interference graph of the values of a function, with the
+    information used to color it.
+    """
+
+    edges: Dict[SSAValue, Set[SSAValue]] = field(default_factory=dict)
+    """The values each value interferes with."""
+    spill_cost: Dict[SSAValue, float] = field(default_factory=dict)
+    """The number of uses and definitions, weighted by the loop depth."""
+    crosses_call: Set[SSAValue] = field(default_factory=set)
+    """The values that are live across a call."""
+    copies: List[Tuple[SSAValue, SSAValue]] = field(default_factory=list)
+    """The (destination, source) pairs of copy operations."""
+    hints: Dict[SSAValue, List[Register]] = field(default_factory=dict)
+    """The registers in which the values are expected by other operations."""
+
+    def add_node(self, value: SSAValue):
+        self.edges.setdefault(value, set())
+        self.spill_cost.setdefault(value, 0)
+
+    def add_edge(self, a: SSAValue, b: SSAValue):
+        if a is b or a not in self.edges or b not in self.edges:
+            return
+        self.edges[a].add(b)
+        self.edges[b].add(a)
+
+    def add_hint(self, value: SSAValue, reg: Register):
+        if value in self.edges:
+            self.hints.setdefault(value, []).append(reg)
+
+
+def build_interference_graph(func: riscvssa.FuncOp,
+                             nodes: List[SSAValue]) -> InterferenceGraph:
+    """
+    Build the interference graph of a function, restricted to the
+    given values. Two values interfere if one is defined while the
+    other is live, except for the source and destination of a copy.
+    """
+    ops = get_function_ops(func)
+    blocks, successors, live_in, live_out = compute_liveness(ops)
+    depths = get_loop_depths(blocks, successors)
+
+    graph = InterferenceGraph()
+    for value in nodes:
+        graph.add_node(value)
+
+    for block_idx, (start, end) in enumerate(blocks):
+        weight = 10**depths[block_idx]
+        live = set(live_out[block_idx])
+        for op in reversed(ops[start:end + 1]):
+            if isinstance(op, call_ops):
+                graph.crosses_call.update(
+                    value for value in live
+                    if value in graph.edges and value not in op.results)
+            for result in op.results:
+                for value in live:
+                    if is_copy(op) and value is op.operands[0]:
+                        continue
+                    graph.add_edge(result, value)
+            for value in list(op.operands) + list(op.results):
+                if value in graph.edges:
+                    graph.spill_cost[value] += weight
+            if is_copy(op) and op.results[0] in graph.edges and op.operands[
+                    0] in graph.edges:
+                graph.copies.append((op.results[0], op.operands[0]))
+            live.difference_update(op.results)
+            live.update(op.operands)
+
+            # Registers in which the operands and results are expected
+            if isinstance(op, riscvssa.CallOp):
+                for idx, arg in enumerate(op.args):
+                    graph.add_hint(arg, Register.from_name(f"a{idx}"))
+                for result in op.results:
+                    graph.add_hint(result, Register.from_name("a0"))
+            elif isinstance(op, riscvssa.ECALLOp):
+                graph.add_hint(op.syscall_num, Register.from_name("a7"))
+                for idx, arg in enumerate(op.args):
+                    graph.add_hint(arg, Register.from_name(f"a{idx}"))
+            elif isinstance(op, riscvssa.ReturnOp) and op.value is not None:
+                graph.add_hint(op.value, Register.from_name("a0"))
+
+    # Function arguments are all defined when entering the function
+    args = list(func.func_body.blocks[0].args)
+    entry_live = live_in[0] if blocks else set()
+    for idx, arg in enumerate(args):
+        graph.add_hint(arg, Register.from_name(f"a{idx}"))
+        for value in entry_live:
+            graph.add_edge(arg, value)
+
+    return graph
+
+
+def allocate_registers_graph_coloring(
+    func: riscvssa.FuncOp,
+    pinned: Set[SSAValue] = set()
+) -> Allocation:
+    """
+    Allocate each infinite register to a physical register, by coloring
+    the interference graph of the function. Copies are coalesced when
+    this does not make the graph harder to color (Briggs criterion), and
+    values with the lowest spill cost per interference are chosen for
+    spilling, the cost of a use being weighted by its loop depth.
+    Values live across a call only use callee-saved registers, values in
+    `pinned` are always placed on the stack, and values that are never
+    used are not allocated.
+    returns the allocation of the function.
+    """
+    defined = get_defined_values(func)
+    nodes = [
+        value for value in defined if value.uses and value not in pinned
+    ]
+    graph = build_interference_graph(func, nodes)
+
+    caller_saved = [Register.from_name(name) for name in caller_saved_registers]
+    callee_saved = [Register.from_name(name) for name in callee_saved_registers]
+    colors: Dict[SSAValue, List[Register]] = {
+        value: callee_saved if value in graph.crosses_call else caller_saved +
+        callee_saved
+        for value in nodes
+    }
+
+    # Coalesce copies, merging the source into the destination
+    alias: Dict[SSAValue, SSAValue] = dict()
+
+    def get_alias(value: SSAValue) -> SSAValue:
+        while value in alias:
+            value = alias[value]
+        return value
+
+    for dst, src in graph.copies:
+        dst, src = get_alias(dst), get_alias(src)
+        if dst is src or src in graph.edges[dst]:
+            continue
+        merged_colors = [reg for reg in colors[dst] if reg in colors[src]]
+        neighbors = graph.edges[dst] | graph.edges[src]
+        significant = [
+            value for value in neighbors
+            if len(graph.edges[value]) >= len(colors[value])
+        ]
+        if len(significant) >= len(merged_colors):
+            continue
+        alias[src] = dst
+        for value in graph.edges.pop(src):
+            graph.edges[value].discard(src)
+            graph.add_edge(dst, value)
+        colors[dst] = merged_colors
+        graph.spill_cost[dst] += graph.spill_cost.pop(src)
+        graph.hints.setdefault(dst, []).extend(graph.hints.pop(src, []))
+        del colors[src]
+
+    # Simplify the graph, pushing the nodes on a stack. When all nodes
+    # have too many neighbors, optimistically push the cheapest to spill.
+    # Neighbors are visited in definition order, to keep the allocation
+    # deterministic.
+    position = {value: idx for idx, value in enumerate(graph.edges)}
+    degree = {value: len(edges) for value, edges in graph.edges.items()}
+    remaining = dict.fromkeys(graph.edges)
+    low_degree = [
+        value for value in remaining if degree[value] < len(colors[value])
+    ]
+    stack: List[SSAValue] = []
+    while remaining:
+        if low_degree:
+            value = low_degree.pop()
+        else:
+            value = min(remaining,
+                        key=lambda v: graph.spill_cost[v] / (degree[v] + 1))
+        del remaining[value]
+        stack.append(value)
+        for neighbor in sorted(graph.edges[value], key=position.__getitem__):
+            degree[neighbor] -= 1
+            if neighbor in remaining and degree[neighbor] == len(
+                    colors[neighbor]) - 1:
+                low_degree.append(neighbor)
+
+    # Pop the nodes and give them a color not used by their neighbors
+    color_of: Dict[SSAValue, Register] = dict()
+    spilled: Set[SSAValue] = set()
+    for value in reversed(stack):
+        used = set(color_of[neighbor] for neighbor in graph.edges[value]
+                   if neighbor in color_of)
+        preferred = [
+            reg for reg in graph.hints.get(value, []) if reg in colors[value]
+        ]
+        for reg in preferred + colors[value]:
+            if reg not in used:
+                color_of[value] = reg
+                break
+        else:
+            spilled.add(value)
+
+    # Coalesced values share the register of the value they were merged in
+    register_pos = dict()
+    for value in defined:
+        if get_alias(value) in color_of:
+            register_pos[value] = color_of[get_alias(value)]
+
+    spilled_reg, stack_pos = assign_stack_slots(
+        func, [
+            value for value in defined
+            if value in pinned or get_alias(value) in spilled
+        ], pinned)
+    stack_vars, alloc_to_stack_var = get_stack_vars(func)
+    return Allocation(spilled_reg, stack_pos, register_pos, stack_vars,
+                      alloc_to_stack_var)
+
+
+def assign_stack_slots(
+        func: riscvssa.FuncOp,
+        spilled: List[SSAValue],
+        pinned: Set[SSAValue] = set()) -> Tuple[int, Dict[SSAValue, int]]:
+    """
+    Give a stack slot to each spilled value of a function. Values that
+    are never live at the same time share the same slot, except the
+    values in `pinned`, which are read by other functions and get their
+    own slot.
+    returns the number of slots, and the slot of each spilled value.
+    """
+    stack_pos: Dict[SSAValue, int] = dict()
+    for value in spilled:
+        if value in pinned:
+            stack_pos[value] = len(stack_pos)
+    first_shared_slot = len(stack_pos)
+
+    shared = [value for value in spilled if value not in pinned]
+    graph = build_interference_graph(func, shared)
+    slots = first_shared_slot
+    for value in shared:
+        used = set(stack_pos.get(neighbor) for neighbor in graph.edges[value])
+        slot = first_shared_slot
+        while slot in used:
+            slot += 1
+        stack_pos[value] = slot
+        slots = max(slots, slot + 1)
+
+    return slots, stack_pos
+
+
+def get_values_used_in_functions(main: riscvssa.FuncOp) -> Set[SSAValue]:
+    """Get the values defined in the main function that other functions use."""
+    values = set()
+    for op in get_function_ops(main):
+        for result in op.results:
+            if any(use.operation.parent.parent.parent is not main
+                   for use in result.uses):
+                values.add(result)
+    return values
+
+
+def run_register_allocation(
+    func: riscvssa.FuncOp,
+    register_allocator: str,
+    pinned: Set[SSAValue] = set()
+) -> Allocation:
+    """Allocate the registers of a function with the given strategy."""
+    if register_allocator == "spill":
+        spilled_reg, stack_pos, stack_vars, alloc_to_stack_var = allocate_registers(
+            func, pinned)
+        return Allocation(spilled_reg, stack_pos, dict(), stack_vars,
+                          alloc_to_stack_var)
+    if register_allocator == "linear-scan":
+        return allocate_registers_linear_scan(func, pinned)
+    if register_allocator == "graph-coloring":
+        return allocate_registers_graph_coloring(func, pinned)
+    raise Exception(f"Unknown register allocator '{register_allocator}'")
+
+
+class SSANameTable:
+    """
+    The names the xDSL printer gives to the SSA values of a module. They
+    are computed once, so that single operations and values can be
+    formatted for comments without printing the whole module.
+
+    The names must mirror the numbering of `Printer` in xDSL 0.8.1, which
+    this table reproduces and then hands to a printer through its private
+    `_ssa_values`: a name hint used again gets a counter suffix, other
+    results and the arguments of printed blocks are numbered in printing
+    order. The riscv_ssa_to_riscv comment_names test checks the comments
+    against the printer, and has to pass again after any xDSL update.
+    """
+
+    def __init__(self, mod: ModuleOp):
+        self.names: Dict[SSAValue, str] = dict()
+        self._name_counts: Dict[str, int] = dict()
+        self._next_id = 0
+        self._add_op_names(mod)
+
+        self._stream = StringIO()
+        self._printer = Printer(self._stream)
+        self._printer._ssa_values = self.names
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id - 1)
+
+    def _add_op_names(self, op: Operation):
+        """Name the values of an operation, in the order of the printer."""
+        for result in op.results:
+            if result.name:
+                count = self._name_counts.get(result.name, 0)
+                self.names[result] = result.name + (str(count)
+                                                    if count != 0 else "")
+                self._name_counts[result.name] = count + 1
+            else:
+                self.names[result] = self._new_id()
+        for region in op.regions:
+            named_blocks = len(region.blocks) > 1 or (
+                len(region.blocks) == 1 and len(region.blocks[0].args) > 0)
+            for block in region.blocks:
+                if named_blocks:
+                    for arg in block.args:
+                        self.names[arg] = self._new_id()
+                for child in block.ops:
+                    self._add_op_names(child)
+
+    def _take_output(self) -> str:
+        output = self._stream.getvalue()
+        self._stream.seek(0)
+        self._stream.truncate()
+        return output
+
+    def format_operand(self, val: SSAValue) -> str:
+        """Format a value as the printer prints an operand."""
+        self._printer._print_operand(val)
+        return self._take_output()
+
+    def format_op(self, op: Operation) -> str:
+        """
+        Format an operation as the printer prints it, without its location,
+        which the assembly gives in .loc directives.
+        """
+        loc = op.attributes.pop('loc', None)
+        self._printer.print_op(op)
+        if loc is not None:
+            op.attributes['loc'] = loc
+        return self._take_output()[:-1]
+
+
+def fits_in_immediate(value: int) -> bool:
+    """Check whether a value fits in the 12-bit immediate of an instruction."""
+    return -2**11 <= value < 2**11
+
+
+def get_stack_address(base: Union[str, Register], offset: int,
+                      scratch: Register) -> Tuple[List[Operation], Union[
+                          str, Register], int]:
+    """
+    Get a base register and an immediate offset addressing `offset` bytes
+    after `base`. Offsets that do not fit in an immediate are added to the
+    base in the scratch register.
+    returns the operations computing the address, the base register, and
+    the immediate offset.
+    """
+    if fits_in_immediate(offset):
+        return [], base, offset
+    return [
+        riscv.LIOp.get(scratch, offset),
+        riscv.AddOp.get(scratch, base, scratch)
+    ], scratch, 0
+
+
+def adjust_stack_pointer(offset: int, comment: str) -> List[Operation]:
+    """
+    Add an offset to the stack pointer, going through t0 if the offset
+    does not fit in an immediate.
+    """
+    if fits_in_immediate(offset):
+        return [riscv.AddIOp.get("sp", "sp", offset, comment)]
+    return [
+        riscv.LIOp.get("t0", offset),
+        riscv.AddOp.get("sp", "sp", "t0", comment)
+    ]
 
 
 @dataclass(eq=False)
@@ -56,59 +768,87 @@ class RiscvToRiscvSSAPattern(RewritePattern):
     stack_pos: Dict[SSAValue, int]
     alloc_to_stack_var: Dict[SSAValue, int]
     """Position of the variables on the stack."""
-    printer: Printer
-    output: StringIO
+    names: Optional[SSANameTable]
+    """Names of the variables, or None to not emit comments."""
     global_stack_pos: Optional[Dict[SSAValue, int]] = field(default=None)
+    register_pos: Dict[SSAValue, Register] = field(default_factory=dict)
+    """Physical register of the variables that are not spilled."""
+    spilled_reg: int = field(default=0)
+    """Number of stack slots used by spilled variables."""
+
+    def get_callee_saved_registers(self) -> List[Register]:
+        """Get the callee-saved registers that the function uses."""
+        used = set(self.register_pos.values())
+        return [
+            Register.from_name(name) for name in callee_saved_registers
+            if Register.from_name(name) in used
+        ]
 
     def add_stack_allocation(self,
-                             func: FuncOp,
+                             func: riscvssa.FuncOp,
                              spilled_reg: int,
                              stack_vars: int,
                              is_main=False):
         """
         Allocate data on the stack at the beginning of the
         module, and deallocate it at the end.
+        Functions other than main also save the callee-saved registers
+        they use.
         """
+        saved_regs = [] if is_main else self.get_callee_saved_registers()
         header_ops: List[Operation] = [
             riscv.AddIOp.get("sp", "sp", -4, "Reserve space for ra"),
             riscv.SWOp.get("ra", "sp", 0, "Store return address"),
-            riscv.AddIOp.get("sp", "sp", -4 * spilled_reg,
-                             "Reserve stack space for spilled registers")
         ]
-        if stack_vars > 0:
+        if saved_regs:
             header_ops.append(
-                riscv.AddIOp.get(
-                    "sp", "sp", -4 * stack_vars,
-                    "Reserve stack space for stack-allocated memory"))
+                riscv.AddIOp.get("sp", "sp", -4 * len(saved_regs),
+                                 "Reserve space for callee-saved registers"))
+            for idx, reg in enumerate(saved_regs):
+                header_ops.append(
+                    riscv.SWOp.get(reg, "sp", 4 * idx,
+                                   "Save callee-saved register"))
+        header_ops += adjust_stack_pointer(
+            -4 * spilled_reg, "Reserve stack space for spilled registers")
+        if stack_vars > 0:
+            header_ops += adjust_stack_pointer(
+                -4 * stack_vars,
+                "Reserve stack space for stack-allocated memory")
         if is_main:
             header_ops.append(
                 riscv.MVOp.get("tp", "sp",
                                "Move main stack pointer to special register"))
 
-        idx = 0
-        for arg in func.func_body.blocks[0].args:
-            header_ops += self.store_variable_from_register(
-                Register.from_name(f"a{idx}"), arg)
-            idx += 1
+        args = func.func_body.blocks[0].args
+        header_ops += self.store_variables_from_registers(
+            [Register.from_name(f"a{idx}") for idx in range(len(args))],
+            list(args))
 
         footer_ops: List[Operation] = [
             riscv.CommentOp.get(""),
             riscv.CommentOp.get("Footer Ops"),
             riscv.LabelOp.get("_" + func.attributes['func_name'].data +
-                              "_return"),
-            riscv.AddIOp.get(
-                "sp", "sp", 4 * spilled_reg,
-                "Free stack space reserved for spilled registers")
+                              "_return")
         ]
+        footer_ops += adjust_stack_pointer(
+            4 * spilled_reg, "Free stack space reserved for spilled registers")
         if stack_vars:
+            footer_ops += adjust_stack_pointer(
+                4 * stack_vars,
+                "Free stack space reserved for stack-allocated memory")
+        if saved_regs:
+            for idx, reg in enumerate(saved_regs):
+                footer_ops.append(
+                    riscv.LWOp.get(reg, "sp", 4 * idx,
+                                   "Restore callee-saved register"))
             footer_ops.append(
-                riscv.AddIOp.get(
-                    "sp", "sp", 4 * stack_vars,
-                    "Free stack space reserved for stack-allocated memory"))
+                riscv.AddIOp.get("sp", "sp", 4 * len(saved_regs),
+                                 "Free space for callee-saved registers"))
         footer_ops += [
             riscv.LWOp.get("ra", "sp", 0, "Store return address"),
             riscv.AddIOp.get("sp", "sp", 4, "Free space for ra")
         ]
+        copy_location(func, header_ops + footer_ops)
         block = func.regions[0].blocks[0]
         block.insert_op(header_ops, 0)
         block.insert_op(footer_ops, len(block.ops))
@@ -117,34 +857,30 @@ class RiscvToRiscvSSAPattern(RewritePattern):
                                  reg: Register) -> List[Operation]:
         """Place a variable on a specific register."""
 
+        # The variable is already in a register
+        if val in self.register_pos:
+            if self.register_pos[val] == reg:
+                return []
+            return [riscv.MVOp.get(reg, self.register_pos[val])]
+
         # Get the variable name
-        full = self.output.getvalue()
-        self.printer._print_operand(val)
-        formatted_op = self.output.getvalue()
-        formatted_op = formatted_op[len(full):]
+        comment = None
+        if self.names is not None:
+            comment = f"Unspill register '{self.names.format_operand(val)}'"
 
         # Get its address if the variable is defined in main
         if val not in self.stack_pos:
             if self.global_stack_pos is None or val not in self.global_stack_pos:
                 raise Exception("Critical error in riscv variable allocator.")
             pos = self.global_stack_pos[val]
-            if pos * 4 > 2**12:
-                raise NotImplementedError(
-                    "Register allocator is not working for more than 128 variables."
-                )
-            op = riscv.LWOp.get(reg, "tp", pos * 4,
-                                f"Unspill register '{formatted_op}'")
-            return [op]
+            new_ops, base, offset = get_stack_address("tp", pos * 4, reg)
+            new_ops.append(riscv.LWOp.get(reg, base, offset, comment))
+            return new_ops
 
         pos = self.stack_pos[val]
-        if pos * 4 > 2**12:
-            raise NotImplementedError(
-                "Register allocator is not working for more than 128 variables."
-            )
-
-        op = riscv.LWOp.get(reg, "sp", pos * 4,
-                            f"Unspill register '{formatted_op}'")
-        return [op]
+        new_ops, base, offset = get_stack_address("sp", pos * 4, reg)
+        new_ops.append(riscv.LWOp.get(reg, base, offset, comment))
+        return new_ops
 
     def store_variable_from_register(self, reg: Register,
                                      val: SSAValue) -> List[Operation]:
@@ -152,24 +888,93 @@ class RiscvToRiscvSSAPattern(RewritePattern):
         Store a variable into its place in the stack, knowing the
         current position of the variable in the registers.
         """
+        if val in self.register_pos:
+            if self.register_pos[val] == reg:
+                return []
+            return [riscv.MVOp.get(self.register_pos[val], reg)]
+
+        # The variable is never used
+        if val not in self.stack_pos:
+            return []
+
         pos = self.stack_pos[val]
-        if pos * 4 > 2**12:
-            raise NotImplementedError(
-                "Register allocator is not working for more than 128 variables."
-            )
-        op = riscv.SWOp.get(reg, "sp", pos * 4, "Spill register")
-        return [op]
+        scratch = Register.from_name("t2" if reg == Register.from_name("t1")
+                                     else "t1")
+        new_ops, base, offset = get_stack_address("sp", pos * 4, scratch)
+        new_ops.append(riscv.SWOp.get(reg, base, offset, "Spill register"))
+        return new_ops
+
+    def get_register_of_variable(
+            self, val: SSAValue,
+            scratch: Register) -> Tuple[List[Operation], Register]:
+        """
+        Get a register holding a variable, loading the variable in the
+        scratch register if it is spilled.
+        """
+        if val in self.register_pos:
+            return [], self.register_pos[val]
+        return self.get_variable_on_register(val, scratch), scratch
+
+    @staticmethod
+    def parallel_move(moves: List[Tuple[Register, Register]]) -> List[Operation]:
+        """
+        Move registers into other registers, given as (destination, source)
+        pairs, as if all the moves happened at the same time.
+        Cycles are broken with the t0 scratch register.
+        """
+        moves = [(dst, src) for dst, src in moves if dst != src]
+        new_ops: List[Operation] = []
+        while moves:
+            sources = set(src for _, src in moves)
+            ready = [(dst, src) for dst, src in moves if dst not in sources]
+            if ready:
+                dst, src = ready[0]
+                new_ops.append(riscv.MVOp.get(dst, src))
+                moves.remove((dst, src))
+                continue
+            # All remaining moves form cycles, free one of the destinations
+            tmp = Register.from_name("t0")
+            dst, src = moves[0]
+            new_ops.append(riscv.MVOp.get(tmp, src))
+            moves[0] = (dst, tmp)
+        return new_ops
+
+    def get_variables_on_registers(self, vals: List[SSAValue],
+                                   regs: List[Register]) -> List[Operation]:
+        """
+        Place variables on specific registers at the same time. Variables
+        held in registers are moved first, so that they are not overwritten
+        by the variables loaded from the stack.
+        """
+        moves = [(reg, self.register_pos[val])
+                 for val, reg in zip(vals, regs) if val in self.register_pos]
+        new_ops = self.parallel_move(moves)
+        for val, reg in zip(vals, regs):
+            if val not in self.register_pos:
+                new_ops.extend(self.get_variable_on_register(val, reg))
+        return new_ops
+
+    def store_variables_from_registers(
+            self, regs: List[Register],
+            vals: List[SSAValue]) -> List[Operation]:
+        """
+        Store variables held in specific registers at the same time.
+        Variables spilled on the stack are stored first, so that their
+        registers are not overwritten by the moves.
+        """
+        new_ops: List[Operation] = []
+        for reg, val in zip(regs, vals):
+            if val not in self.register_pos:
+                new_ops.extend(self.store_variable_from_register(reg, val))
+        moves = [(self.register_pos[val], reg)
+                 for reg, val in zip(regs, vals) if val in self.register_pos]
+        return new_ops + self.parallel_move(moves)
 
     def rewrite_ecall(self, op: riscvssa.ECALLOp,
                       rewriter: PatternRewriter) -> None:
-        new_ops = []
-        new_ops.extend(
-            self.get_variable_on_register(op.syscall_num,
-                                          Register.from_name("a7")))
-        for idx, operand in enumerate(op.args):
-            new_ops.extend(
-                self.get_variable_on_register(
-                    operand, Register.from_name("a" + str(idx))))
+        new_ops = self.get_variables_on_registers(
+            [op.syscall_num] + list(op.args), [Register.from_name("a7")] +
+            [Register.from_name("a" + str(idx)) for idx in range(len(op.args))])
         new_ops.append(riscv.ECALLOp.get())
         rewriter.replace_op(op,
                             new_ops, [None] * len(op.results),
@@ -177,11 +982,17 @@ class RiscvToRiscvSSAPattern(RewritePattern):
 
     def rewrite_call(self, op: riscvssa.CallOp,
                      rewriter: PatternRewriter) -> None:
-        new_ops = [riscv.CommentOp.get(""), riscv.CommentOp.get(f"{op.name}")]
-        for idx, operand in enumerate(op.args):
-            new_ops.extend(
-                self.get_variable_on_register(
-                    operand, Register.from_name("a" + str(idx))))
+        new_ops = []
+        if self.names is not None:
+            new_ops += [
+                riscv.CommentOp.get(""),
+                riscv.CommentOp.get(f"{op.name}")
+            ]
+        new_ops.extend(
+            self.get_variables_on_registers(
+                list(op.args),
+                [Register.from_name("a" + str(idx))
+                 for idx in range(len(op.args))]))
         jump = riscv.JALOp.get(Register.from_name("ra"), op.func_name.data)
         new_ops = new_ops + [jump]
 
@@ -199,22 +1010,31 @@ class RiscvToRiscvSSAPattern(RewritePattern):
 
     def rewrite_alloc(self, op: riscvssa.AllocOp,
                       rewriter: PatternRewriter) -> None:
-        stack_pos = 4 * (self.alloc_to_stack_var[op] + len(self.stack_pos))
-        new_ops = [
-            riscv.AddIOp.get(Register.from_name("t0"),
-                             Register.from_name("sp"), stack_pos,
-                             "Save ptr of stack-slot into register")
-        ]
-        new_ops.extend(
-            self.store_variable_from_register(Register.from_name('t0'),
-                                              op.results[0]))
+        stack_pos = 4 * (self.alloc_to_stack_var[op] + self.spilled_reg)
+        reg = self.register_pos.get(op.results[0], Register.from_name("t0"))
+        if fits_in_immediate(stack_pos):
+            new_ops = [
+                riscv.AddIOp.get(reg, Register.from_name("sp"), stack_pos,
+                                 "Save ptr of stack-slot into register")
+            ]
+        else:
+            new_ops = [
+                riscv.LIOp.get(reg, stack_pos),
+                riscv.AddOp.get(reg, Register.from_name("sp"), reg,
+                                "Save ptr of stack-slot into register")
+            ]
+        new_ops.extend(self.store_variable_from_register(reg, op.results[0]))
         rewriter.replace_op(op,
                             new_ops, [None] * len(op.results),
                             safe_erase=True)
 
     def rewrite_return(self, ret: riscvssa.ReturnOp,
                        rewriter: PatternRewriter):
-        new_ops = self.get_variable_on_register(ret.value, "a0")
+        new_ops = []
+        if ret.value is not None:
+            new_ops.extend(
+                self.get_variable_on_register(ret.value,
+                                              Register.from_name("a0")))
         new_ops.append(
             riscv.JOp.get(
                 "_" + ret.parent.parent.parent.attributes['func_name'].data +
@@ -249,16 +1069,13 @@ class RiscvToRiscvSSAPattern(RewritePattern):
             return None
         new_op_type = self.ctx.get_op('riscv.' + opname)
 
-        full = self.output.getvalue()
-        self.printer.print_op(op)
-        formatted_op = self.output.getvalue()
-        formatted_op = formatted_op[len(full):-1]
-
         # The operations that will be added
-        new_ops = [
-            riscv.CommentOp.get(""),
-            riscv.CommentOp.get(f"{formatted_op}")
-        ]
+        new_ops = []
+        if self.names is not None:
+            new_ops += [
+                riscv.CommentOp.get(""),
+                riscv.CommentOp.get(self.names.format_op(op))
+            ]
 
         # The attributes of the riscv operation that will be created
         new_op_attributes = op.attributes.copy()
@@ -268,28 +1085,32 @@ class RiscvToRiscvSSAPattern(RewritePattern):
         # Fill the attributes with the right values for operands and results.
         # Also move operand variables to specific registers.
         if len(op.operands) > 0:
-            new_ops.extend(
-                self.get_variable_on_register(op.operands[0],
-                                              Register.from_name('t1')))
-            new_op_attributes['rs1'] = RegisterAttr.from_name('t1')
+            load_ops, rs1 = self.get_register_of_variable(
+                op.operands[0], Register.from_name('t1'))
+            new_ops.extend(load_ops)
+            new_op_attributes['rs1'] = RegisterAttr.from_register(rs1)
 
         if len(op.operands) > 1:
-            new_ops.extend(
-                self.get_variable_on_register(op.operands[1],
-                                              Register.from_name('t2')))
-            new_op_attributes['rs2'] = RegisterAttr.from_name('t2')
+            load_ops, rs2 = self.get_register_of_variable(
+                op.operands[1], Register.from_name('t2'))
+            new_ops.extend(load_ops)
+            new_op_attributes['rs2'] = RegisterAttr.from_register(rs2)
 
+        rd = Register.from_name('t0')
         if len(op.results) != 0:
-            new_op_attributes['rd'] = RegisterAttr.from_name('t0')
+            rd = self.register_pos.get(op.results[0], rd)
+            new_op_attributes['rd'] = RegisterAttr.from_register(rd)
 
-        # Create the new corresponding operation
-        new_ops.append(new_op_type.create(attributes=new_op_attributes))
+        # Create the new corresponding operation, unless it is a copy
+        # between coalesced variables
+        if not (is_copy(op) and new_op_attributes['rd']
+                == new_op_attributes['rs1']):
+            new_ops.append(new_op_type.create(attributes=new_op_attributes))
 
         # Place the result in its right place on the stack
         if len(op.results) != 0:
             new_ops.extend(
-                self.store_variable_from_register(Register.from_name('t0'),
-                                                  op.results[0]))
+                self.store_variable_from_register(rd, op.results[0]))
 
         rewriter.replace_op(op,
                             new_ops, [None] * len(op.results),
@@ -613,50 +1434,97 @@ def add_return(op: Operation):
     op.regions[0].blocks[0].add_ops(new_ops)
 
 
-def riscv_ssa_to_riscv(ctx: MLContext, mod: ModuleOp):
+def report_frame_size(func: riscvssa.FuncOp,
+                      pattern: RiscvToRiscvSSAPattern,
+                      stack_vars: int,
+                      is_main=False):
+    """
+    Print the size of the stack frame of a function on stderr, before
+    and after spilled variables share stack slots.
+    """
+    fixed_size = 1 + stack_vars
+    if not is_main:
+        fixed_size += len(pattern.get_callee_saved_registers())
+    before = len(pattern.stack_pos)
+    after = pattern.spilled_reg
+    print(f"{func.attributes['func_name'].data}: frame size "
+          f"{4 * (fixed_size + before)} -> {4 * (fixed_size + after)} bytes "
+          f"({before} -> {after} stack slots)",
+          file=sys.stderr)
+
+
+def riscv_ssa_to_riscv(ctx: MLContext,
+                       mod: ModuleOp,
+                       register_allocator: str = "linear-scan",
+                       report_frame_sizes: bool = False,
+                       asm_comments: bool = True):
     """
     Translate a riscvssa program into an equivalent RISCV program.
+    `register_allocator` is one of `register_allocators`, "spill" placing
+    every variable on the stack. If `report_frame_sizes` is set, the
+    stack frame size of each function is printed on stderr. If
+    `asm_comments` is not set, the generated code is not annotated with
+    the riscvssa operations it comes from.
     """
 
-    output = StringIO()
-    printer = Printer(output, )
-    printer.print_op(mod)
+    if register_allocator not in register_allocators:
+        raise Exception(f"Unknown register allocator '{register_allocator}'")
+
+    names = SSANameTable(mod) if asm_comments else None
 
     assert len(mod.ops) == 1, "expected at least one main function"
     main = mod.ops[0]
 
-    global_spilled_reg, global_stack_pos, global_stack_vars, global_alloc_to_stack_var = allocate_registers(
-        main)
+    # Variables of main used in other functions are accessed through the
+    # main stack pointer, so they stay on the stack.
+    global_allocation = run_register_allocation(
+        main, register_allocator, get_values_used_in_functions(main))
 
     # Allocate registers in all function definitions
     for func in main.func_body.ops:
         if not isinstance(func, riscvssa.FuncOp):
             continue
-        spilled_reg, stack_pos, stack_vars, alloc_to_stack_var = allocate_registers(
-            func)
-        pattern = RiscvToRiscvSSAPattern(ctx,
-                                         func,
-                                         stack_pos,
-                                         alloc_to_stack_var,
-                                         printer,
-                                         output,
-                                         global_stack_pos=global_stack_pos)
-        pattern.add_stack_allocation(func, spilled_reg, stack_vars)
+        allocation = run_register_allocation(func, register_allocator)
+        pattern = RiscvToRiscvSSAPattern(
+            ctx,
+            func,
+            allocation.stack_pos,
+            allocation.alloc_to_stack_var,
+            names,
+            global_stack_pos=global_allocation.stack_pos,
+            register_pos=allocation.register_pos,
+            spilled_reg=allocation.spilled_reg)
+        if report_frame_sizes:
+            report_frame_size(func, pattern, allocation.stack_vars)
+        pattern.add_stack_allocation(func, allocation.spilled_reg,
+                                     allocation.stack_vars)
         add_return(func)
-        walker = PatternRewriteWalker(GreedyRewritePatternApplier([pattern]),
+        walker = PatternRewriteWalker(LocatedPattern(
+            GreedyRewritePatternApplier([pattern])),
                                       apply_recursively=True,
                                       walk_reverse=True)
         walker.rewrite_module(func)
 
     # Allocate registers in the main function
-    pattern = RiscvToRiscvSSAPattern(ctx, main, global_stack_pos,
-                                     global_alloc_to_stack_var, printer,
-                                     output)
+    pattern = RiscvToRiscvSSAPattern(
+        ctx,
+        main,
+        global_allocation.stack_pos,
+        global_allocation.alloc_to_stack_var,
+        names,
+        register_pos=global_allocation.register_pos,
+        spilled_reg=global_allocation.spilled_reg)
+    if report_frame_sizes:
+        report_frame_size(main,
+                          pattern,
+                          global_allocation.stack_vars,
+                          is_main=True)
     pattern.add_stack_allocation(main,
-                                 global_spilled_reg,
-                                 global_stack_vars,
+                                 global_allocation.spilled_reg,
+                                 global_allocation.stack_vars,
                                  is_main=True)
-    walker = PatternRewriteWalker(GreedyRewritePatternApplier([pattern]),
+    walker = PatternRewriteWalker(LocatedPattern(
+        GreedyRewritePatternApplier([pattern])),
                                   apply_recursively=True,
                                   walk_reverse=True)
     walker.rewrite_module(main)
@@ -0,0 +1,635 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+"""
+A simulator of RV32IM programs in the `riscv` dialect, as parsed by
+`riscv.parser` from the assembly printed by choco-opt.
+
+The text section is not stored in memory: the address of the instruction at
+index i is `text_base + 4 * i`. The data section follows it, at
+`min_data_base` or at the next page after the text section if the text
+section is larger, and the stack is placed after it. As in riscemu, the `read`, `write` and `exit`
+system calls are supported, and programs start at the `_start` or `main`
+label if any, and at the first instruction otherwise.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import (Callable, Dict, Iterable, List, Optional, Set, TextIO,
+                    Tuple, Type)
+
+from xdsl.ir import Operation
+from xdsl.dialects.builtin import IntegerAttr
+
+import riscv.dialect as riscv
+
+text_base = 0x1000
+min_data_base = 0x10000
+"""
+The address of the data section of programs with at most 15360 instructions.
+"""
+page_size = 0x1000
+default_stack_size = 512 * 1024
+"""The size of the stack of riscemu, the interpreter this simulator replaces."""
+
+syscall_read = 63
+syscall_write = 64
+syscall_exit = 93
+
+syscall_symbols = {
+    'SCALL_READ': syscall_read,
+    'SCALL_WRITE': syscall_write,
+    'SCALL_EXIT': syscall_exit,
+}
+"""The symbols defined for the system call numbers, as in riscemu."""
+
+
+class SimulatorError(Exception):
+    """An error of the simulated program, e.g. an invalid memory access."""
+    pass
+
+
+def to_signed(value: int) -> int:
+    """Truncate a value to 32 bits, as a signed integer."""
+    return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def to_unsigned(value: int) -> int:
+    """Truncate a value to 32 bits, as an unsigned integer."""
+    return value & 0xFFFFFFFF
+
+
+def check_divisor(b: int):
+    if b == 0:
+        raise SimulatorError("Division by zero")
+
+
+# As in riscemu, divisions round down rather than towards zero as specified
+# by the M extension, which is the semantics of `//` and `%` in ChocoPy.
+
+
+def div(a: int, b: int) -> int:
+    check_divisor(b)
+    return a // b
+
+
+def rem(a: int, b: int) -> int:
+    check_divisor(b)
+    return a % b
+
+
+def divu(a: int, b: int) -> int:
+    check_divisor(b)
+    return to_unsigned(a) // to_unsigned(b)
+
+
+def remu(a: int, b: int) -> int:
+    check_divisor(b)
+    return to_unsigned(a) % to_unsigned(b)
+
+
+# The operations of each class of instruction, on the signed 32-bit values of
+# their operands. Their results are truncated to 32 bits by the caller.
+
+alu_ops: Dict[Type[Operation], Callable[[int, int], int]] = {
+    riscv.AddOp: lambda a, b: a + b,
+    riscv.SubOp: lambda a, b: a - b,
+    riscv.SLLOp: lambda a, b: a << (b & 31),
+    riscv.SRLOp: lambda a, b: to_unsigned(a) >> (b & 31),
+    riscv.SRAOp: lambda a, b: a >> (b & 31),
+    riscv.XOROp: lambda a, b: a ^ b,
+    riscv.OROp: lambda a, b: a | b,
+    riscv.ANDOp: lambda a, b: a & b,
+    riscv.SLTOp: lambda a, b: int(a < b),
+    riscv.SLTUOp: lambda a, b: int(to_unsigned(a) < to_unsigned(b)),
+    riscv.MULOp: lambda a, b: a * b,
+    riscv.MULHOp: lambda a, b: (a * b) >> 32,
+    riscv.MULHSUOp: lambda a, b: (a * to_unsigned(b)) >> 32,
+    riscv.MULHUOp: lambda a, b: (to_unsigned(a) * to_unsigned(b)) >> 32,
+    riscv.DIVOp: div,
+    riscv.DIVUOp: divu,
+    riscv.REMOp: rem,
+    riscv.REMUOp: remu,
+}
+"""The operation of the instructions with two register operands."""
+
+alu_imm_ops: Dict[Type[Operation], Callable[[int, int], int]] = {
+    riscv.AddIOp: alu_ops[riscv.AddOp],
+    riscv.SLLIOp: alu_ops[riscv.SLLOp],
+    riscv.SRLIOp: alu_ops[riscv.SRLOp],
+    riscv.SRAIOp: alu_ops[riscv.SRAOp],
+    riscv.XORIOp: alu_ops[riscv.XOROp],
+    riscv.ORIOp: alu_ops[riscv.OROp],
+    riscv.ANDIOp: alu_ops[riscv.ANDOp],
+    riscv.SLTIOp: alu_ops[riscv.SLTOp],
+    riscv.SLTIUOp: alu_ops[riscv.SLTUOp],
+}
+"""The operation of the instructions with a register and an immediate."""
+
+unary_ops: Dict[Type[Operation], Callable[[int], int]] = {
+    riscv.MVOp: lambda a: a,
+    riscv.NOTOp: lambda a: ~a,
+    riscv.NEGOp: lambda a: -a,
+    riscv.NEGWOp: lambda a: -a,
+    riscv.SEQZOp: lambda a: int(a == 0),
+    riscv.SNEZOp: lambda a: int(a != 0),
+    riscv.SLTZOp: lambda a: int(a < 0),
+    riscv.SGTZOp: lambda a: int(a > 0),
+}
+"""The operation of the pseudo instructions with a register operand."""
+
+branch_conditions: Dict[Type[Operation], Callable[[int, int], bool]] = {
+    riscv.BEQOp: lambda a, b: a == b,
+    riscv.BNEOp: lambda a, b: a != b,
+    riscv.BLTOp: lambda a, b: a < b,
+    riscv.BGEOp: lambda a, b: a >= b,
+    riscv.BLTUOp: lambda a, b: to_unsigned(a) < to_unsigned(b),
+    riscv.BGEUOp: lambda a, b: to_unsigned(a) >= to_unsigned(b),
+    riscv.BGTOp: lambda a, b: a > b,
+    riscv.BLEOp: lambda a, b: a <= b,
+    riscv.BGTUOp: lambda a, b: to_unsigned(a) > to_unsigned(b),
+    riscv.BLEUOp: lambda a, b: to_unsigned(a) <= to_unsigned(b),
+}
+"""The condition of the branches comparing two registers."""
+
+branch_zero_conditions: Dict[Type[Operation], Callable[[int], bool]] = {
+    riscv.BEQZOp: lambda a: a == 0,
+    riscv.BNEZOp: lambda a: a != 0,
+    riscv.BLEZOp: lambda a: a <= 0,
+    riscv.BGEZOp: lambda a: a >= 0,
+    riscv.BLTZOp: lambda a: a < 0,
+    riscv.BGTZOp: lambda a: a > 0,
+}
+"""The condition of the branches comparing a register with zero."""
+
+loads: Dict[Type[Operation], Tuple[int, bool]] = {
+    riscv.LBOp: (1, True),
+    riscv.LBUOp: (1, False),
+    riscv.LHOp: (2, True),
+    riscv.LHUOp: (2, False),
+    riscv.LWOp: (4, True),
+}
+"""The size in bytes of the value loaded by each load, and if it is signed."""
+
+stores: Dict[Type[Operation], int] = {
+    riscv.SBOp: 1,
+    riscv.SHOp: 2,
+    riscv.SWOp: 4,
+}
+"""The size in bytes of the value stored by each store."""
+
+
+@dataclass
+class Program:
+    """
+    A program loaded for simulation: the instructions of its text section,
+    the initial contents of its data section, and the address of its labels.
+    """
+    instructions: List[Operation] = field(default_factory=list)
+    data: bytearray = field(default_factory=bytearray)
+    labels: Dict[str, int] = field(default_factory=dict)
+    text_labels: Set[str] = field(default_factory=set)
+    """The labels defined in the text section."""
+    data_base: int = min_data_base
+    """The address of the data section, which follows the text section."""
+    entry: int = 0
+    """The index of the first instruction executed."""
+    lines: List[int] = field(default_factory=list)
+    """
+    The source line of each instruction, given by the last .loc directive
+    before it, or 0 if unknown.
+    """
+
+    def get_symbol(self, name: str) -> int:
+        """Get the value of a symbol, the address of a label or a system call number"""
+        if name in self.labels:
+            return self.labels[name]
+        if name in syscall_symbols:
+            return syscall_symbols[name]
+        raise SimulatorError(f"Unknown symbol '{name}'")
+
+    def get_instruction_index(self, address: int) -> int:
+        """Get the index of the instruction at the given address"""
+        index = (address - text_base) >> 2
+        if (address & 3 or not 0 <= index < len(self.instructions)):
+            raise SimulatorError(
+                f"Invalid instruction address {address:#x}")
+        return index
+
+    def get_target(self, op: Operation, index: int) -> int:
+        """Get the index of the instruction the branch or jump at index goes to"""
+        attr = op.attributes['offset']
+        if isinstance(attr, IntegerAttr):
+            # the offset is relative to the address of the branch itself
+            return index + (attr.value.data >> 2)
+        return self.get_instruction_index(self.get_symbol(attr.data))
+
+
+def parse_string_literal(literal: str) -> bytes:
+    """Get the bytes of a string literal of an .ascii directive"""
+    if len(literal) < 2 or literal[0] != '"' or literal[-1] != '"':
+        raise SimulatorError(f"Expected a string literal, got '{literal}'")
+    return literal[1:-1].encode('latin-1').decode('unicode_escape').encode(
+        'latin-1')
+
+
+def load_program(ops: Iterable[Operation]) -> Program:
+    """Lay out the sections of a program given as a list of `riscv` operations"""
+    program = Program()
+    data = program.data
+    # the words of the data section initialized with the address of a label
+    symbol_words: List[Tuple[int, str]] = []
+    # the offset of the labels of the data section, placed once the size of
+    # the text section is known
+    data_labels: Dict[str, int] = dict()
+    section = 'text'
+    line = 0
+
+    for op in ops:
+        if isinstance(op, riscv.LabelOp):
+            label = op.attributes['label'].data
+            if label in program.labels or label in data_labels:
+                raise SimulatorError(f"Label '{label}' is defined twice")
+            if section == 'text':
+                program.labels[label] = text_base + 4 * len(
+                    program.instructions)
+                program.text_labels.add(label)
+            else:
+                data_labels[label] = len(data)
+            continue
+
+        if isinstance(op, riscv.CommentOp):
+            continue
+
+        if not isinstance(op, riscv.DirectiveOp):
+            if section != 'text':
+                raise SimulatorError(
+                    f"Instruction '{op.name[6:]}' outside of the text section")
+            program.instructions.append(op)
+            program.lines.append(line)
+            continue
+
+        directive = op.attributes['directive'].data
+        value = op.attributes['value'].data
+        if directive in ['text', 'data', 'bss', 'rodata']:
+            section = directive
+        elif directive == 'section':
+            section = value.lstrip('.').split('.')[0]
+        elif directive in ['globl', 'global', 'type', 'size', 'file']:
+            pass
+        elif directive == 'loc':
+            # .loc file line [column]
+            fields = value.split(',')
+            if len(fields) < 2 or not fields[1].strip().isdigit():
+                raise SimulatorError(f"Expected a line in .loc, got '{value}'")
+            line = int(fields[1])
+        elif directive in ['align', 'p2align', 'balign']:
+            alignment = int(value) if directive == 'balign' else 1 << int(
+                value)
+            if section != 'text':
+                data.extend(bytes(-len(data) % alignment))
+        elif section == 'text':
+            raise SimulatorError(
+                f"Directive '.{directive}' in the text section")
+        elif directive in ['space', 'zero']:
+            data.extend(bytes(int(value)))
+        elif directive in ['ascii', 'asciz', 'string']:
+            data.extend(parse_string_literal(value))
+            if directive != 'ascii':
+                data.append(0)
+        elif directive in ['byte', 'half', 'word']:
+            size = {'byte': 1, 'half': 2, 'word': 4}[directive]
+            for item in value.split(','):
+                item = item.strip()
+                if item.lstrip('-').isdigit():
+                    word = int(item)
+                elif directive == 'word':
+                    symbol_words.append((len(data), item))
+                    word = 0
+                else:
+                    raise SimulatorError(
+                        f"Expected an integer in .{directive}, got '{item}'")
+                data.extend(
+                    (word & ((1 << 8 * size) - 1)).to_bytes(size, 'little'))
+        else:
+            raise SimulatorError(f"Unsupported directive '.{directive}'")
+
+    text_end = text_base + 4 * len(program.instructions)
+    program.data_base = max(min_data_base,
+                            (text_end + page_size - 1) & ~(page_size - 1))
+    for label, offset in data_labels.items():
+        program.labels[label] = program.data_base + offset
+
+    for offset, symbol in symbol_words:
+        data[offset:offset + 4] = to_unsigned(
+            program.get_symbol(symbol)).to_bytes(4, 'little')
+
+    for entry_label in ['_start', 'main']:
+        if entry_label in program.labels:
+            program.entry = program.get_instruction_index(
+                program.labels[entry_label])
+            break
+
+    return program
+
+
+def parse_program(stream: TextIO) -> Program:
+    """Parse and load the program of an assembly file"""
+    from riscv.parser import Parser
+    return load_program(Parser(stream).parse_())
+
+
+Executor = Callable[['Simulator', Operation], None]
+
+executors: Dict[Type[Operation], Executor] = dict()
+"""The function executing the instructions of each class, built lazily."""
+
+
+@dataclass
+class Simulator:
+    """
+    Runs a program one instruction at a time, reading the operands of each
+    instruction from its attributes whenever it is executed.
+
+    Registers hold signed 32-bit values. The memory is a single bytearray,
+    whose bytes before the data section are not accessible so that dereferencing
+    a null pointer fails.
+    """
+    program: Program
+    stdin: TextIO = field(default_factory=lambda: sys.stdin)
+    stdout: TextIO = field(default_factory=lambda: sys.stdout)
+    stderr: TextIO = field(default_factory=lambda: sys.stderr)
+    stack_size: int = default_stack_size
+    max_instructions: Optional[int] = None
+    """The number of instructions after which the simulation is aborted."""
+
+    registers: List[int] = field(default_factory=lambda: [0] * 32)
+    memory: bytearray = field(default_factory=bytearray)
+    pc: int = 0
+    """The index of the next instruction."""
+    instructions_executed: int = 0
+    run_time: float = 0
+    """The time spent running the program, in seconds."""
+    exit_code: Optional[int] = None
+
+    def __post_init__(self):
+        data_base = self.program.data_base
+        data_end = data_base + len(self.program.data)
+        stack_start = (data_end + 15) & ~15
+        self.memory = bytearray(data_base) + self.program.data + bytearray(
+            stack_start - data_end + self.stack_size)
+        self.registers[riscv.Register.abi_names['sp']] = len(self.memory)
+        self.pc = self.program.entry
+
+    def run(self) -> int:
+        """Run the program until it exits, returning its exit code"""
+        start = time.perf_counter()
+        try:
+            while self.exit_code is None:
+                if (self.max_instructions is not None and
+                        self.instructions_executed >= self.max_instructions):
+                    raise SimulatorError(
+                        f"Aborted after {self.instructions_executed} instructions"
+                    )
+                self.step()
+        finally:
+            self.run_time += time.perf_counter() - start
+        return self.exit_code
+
+    @property
+    def instructions_per_second(self) -> float:
+        if not self.run_time:
+            return 0
+        return self.instructions_executed / self.run_time
+
+    def format_statistics(self) -> str:
+        return (f"{self.instructions_executed} instructions in "
+                f"{self.run_time:.3f} s "
+                f"({self.instructions_per_second:.0f} instructions/s)")
+
+    def step(self):
+        """Execute the next instruction"""
+        if not 0 <= self.pc < len(self.program.instructions):
+            raise SimulatorError(
+                "Execution reached the end of the program")
+        index = self.pc
+        op = self.program.instructions[index]
+        self.pc += 1
+        self.instructions_executed += 1
+        try:
+            get_executor(type(op))(self, op)
+        except SimulatorError:
+            # leave the pc at the instruction that failed
+            self.pc = index
+            raise
+
+    def get_register(self, op: Operation, name: str) -> int:
+        return self.registers[op.attributes[name].data.index]
+
+    def set_register(self, op: Operation, name: str, value: int):
+        index = op.attributes[name].data.index
+        if index:
+            self.registers[index] = to_signed(value)
+
+    def get_immediate(self, op: Operation) -> int:
+        attr = op.attributes['immediate']
+        if isinstance(attr, IntegerAttr):
+            return attr.value.data
+        return self.program.get_symbol(attr.data)
+
+    def get_target(self, op: Operation) -> int:
+        """Get the index of the instruction the executed branch goes to"""
+        return self.program.get_target(op, self.pc - 1)
+
+    def check_address(self, address: int, size: int) -> int:
+        address = to_unsigned(address)
+        if (address < self.program.data_base
+                or address + size > len(self.memory)):
+            raise SimulatorError(f"Invalid memory access at {address:#x}")
+        return address
+
+    def load(self, address: int, size: int, signed: bool) -> int:
+        address = self.check_address(address, size)
+        return int.from_bytes(self.memory[address:address + size],
+                              'little',
+                              signed=signed)
+
+    def store(self, address: int, size: int, value: int):
+        address = self.check_address(address, size)
+        self.memory[address:address + size] = (
+            value & ((1 << 8 * size) - 1)).to_bytes(size, 'little')
+
+    def ecall(self):
+        """Execute the system call whose number is in a7"""
+        a0, a1, a2 = self.registers[10:13]
+        number = self.registers[17]
+        if number == syscall_exit:
+            self.exit_code = a0
+        elif number == syscall_read:
+            self.registers[10] = self.read(a0, a1, a2)
+        elif number == syscall_write:
+            self.registers[10] = self.write(a0, a1, a2)
+        else:
+            raise SimulatorError(f"Unknown system call {number}")
+
+    def read(self, file: int, address: int, size: int) -> int:
+        """Read a line of at most size characters of stdin at address"""
+        if file != 0:
+            return -1
+        try:
+            data = self.stdin.readline(to_unsigned(size)).encode('ascii')
+        except UnicodeError:
+            return -1
+        address = self.check_address(address, len(data))
+        self.memory[address:address + len(data)] = data
+        return len(data)
+
+    def write(self, file: int, address: int, size: int) -> int:
+        """Write the size bytes at address to stdout or stderr"""
+        streams = {1: self.stdout, 2: self.stderr}
+        if file not in streams:
+            return -1
+        address = self.check_address(address, to_unsigned(size))
+        data = self.memory[address:address + to_unsigned(size)]
+        streams[file].write(data.decode('ascii', errors='replace'))
+        return size
+
+
+def get_executor(op_type: Type[Operation]) -> Executor:
+    """Get the function executing the instructions of a class"""
+    if op_type in executors:
+        return executors[op_type]
+
+    if op_type in alu_ops:
+        f2 = alu_ops[op_type]
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(
+                op, 'rd',
+                f2(sim.get_register(op, 'rs1'), sim.get_register(op, 'rs2')))
+    elif op_type in alu_imm_ops:
+        fi = alu_imm_ops[op_type]
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(
+                op, 'rd', fi(sim.get_register(op, 'rs1'),
+                             to_signed(sim.get_immediate(op))))
+    elif op_type in unary_ops:
+        f1 = unary_ops[op_type]
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(op, 'rd', f1(sim.get_register(op, 'rs')))
+    elif op_type in branch_conditions:
+        cond2 = branch_conditions[op_type]
+        # the pseudo branches name their operands rs and rt
+        lhs, rhs = ('rs1', 'rs2') if issubclass(
+            op_type, riscv.Riscv2Rs1OffOperation) else ('rs', 'rt')
+
+        def execute(sim: Simulator, op: Operation):
+            if cond2(sim.get_register(op, lhs), sim.get_register(op, rhs)):
+                sim.pc = sim.get_target(op)
+    elif op_type in branch_zero_conditions:
+        cond1 = branch_zero_conditions[op_type]
+
+        def execute(sim: Simulator, op: Operation):
+            if cond1(sim.get_register(op, 'rs')):
+                sim.pc = sim.get_target(op)
+    elif op_type in loads:
+        size, signed = loads[op_type]
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(
+                op, 'rd',
+                sim.load(
+                    sim.get_register(op, 'rs1') + sim.get_immediate(op), size,
+                    signed))
+    elif op_type in stores:
+        store_size = stores[op_type]
+
+        # stores keep the stored value in rs1, and the base address in rs2
+        def execute(sim: Simulator, op: Operation):
+            sim.store(sim.get_register(op, 'rs2') + sim.get_immediate(op),
+                      store_size, sim.get_register(op, 'rs1'))
+    elif op_type is riscv.LIOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(op, 'rd', sim.get_immediate(op))
+    elif op_type is riscv.LUIOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(op, 'rd', sim.get_immediate(op) << 12)
+    elif op_type is riscv.AUIPCOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(
+                op, 'rd',
+                text_base + 4 * (sim.pc - 1) + (sim.get_immediate(op) << 12))
+    elif op_type is riscv.LAOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.set_register(
+                op, 'rd',
+                sim.program.get_symbol(op.attributes['offset'].data))
+    elif op_type is riscv.JOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.pc = sim.get_target(op)
+    elif op_type is riscv.JALOp:
+
+        def execute(sim: Simulator, op: Operation):
+            target = sim.get_target(op)
+            sim.set_register(op, 'rd', text_base + 4 * sim.pc)
+            sim.pc = target
+    elif op_type is riscv.JALROp:
+
+        def execute(sim: Simulator, op: Operation):
+            attr = op.attributes['offset']
+            offset = attr.value.data if isinstance(
+                attr, IntegerAttr) else sim.program.get_symbol(attr.data)
+            target = (sim.get_register(op, 'rs1') + offset) & ~1
+            sim.set_register(op, 'rd', text_base + 4 * sim.pc)
+            sim.pc = sim.program.get_instruction_index(to_unsigned(target))
+    elif op_type is riscv.RETOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.pc = sim.program.get_instruction_index(
+                to_unsigned(sim.registers[riscv.Register.abi_names['ra']]))
+    elif op_type is riscv.ECALLOp:
+
+        def execute(sim: Simulator, op: Operation):
+            sim.ecall()
+    elif op_type is riscv.NOPOp:
+
+        def execute(sim: Simulator, op: Operation):
+            pass
+    else:
+        raise SimulatorError(f"Unsupported instruction '{op_type.name[6:]}'")
+
+    executors[op_type] = execute
+    return execute
+
+
+def run_program(program: Program,
+                stdin: Optional[TextIO] = None,
+                stdout: Optional[TextIO] = None,
+                stderr: Optional[TextIO] = None,
+                max_instructions: Optional[int] = None,
+                engine: Optional[Type[Simulator]] = None) -> int:
+    """
+    Run a program with the given standard streams, the ones of this process
+    by default, returning its exit code. Raises a SimulatorError if the
+    program fails. The program is run by the block engine, as in
+    riscv-interpreter, unless another subclass of Simulator is given as
+    engine.
+    """
+    if engine is None:
+        from riscv.block_simulator import BlockSimulator
+        engine = BlockSimulator
+    return engine(program,
+                  stdin=stdin or sys.stdin,
+                  stdout=stdout or sys.stdout,
+                  stderr=stderr or sys.stderr,
+                  max_instructions=max_instructions).run()
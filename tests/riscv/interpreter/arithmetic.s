@@ -0,0 +1,30 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+# RUN: riscv-interpreter %s | filecheck %s
+
+# Compute -7 // 2 and -7 % 2 rounding down, as ChocoPy does, and count down
+# a loop with a pseudo branch, returning the results in the exit code
+
+main:
+	li t0, -7
+	li t1, 2
+	div t2, t0, t1
+	rem t3, t0, t1
+	li t4, 4
+	li t5, 0
+loop:
+	addi t5, t5, 10
+	addi t4, t4, -1
+	bgtz t4, loop
+	neg t2, t2
+	add a0, t2, t3
+	add a0, a0, t5
+	j exit
+	li a0, 0
+exit:
+	li a7, 93
+	ecall
+
+# -(-4) + 1 + 40
+# CHECK: Return code: 45
@@ -0,0 +1,40 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+# RUN: riscv-interpreter --engine interpreter %s | filecheck %s
+# RUN: riscv-interpreter --engine predecoded --stats %s 2>&1 | filecheck %s --check-prefix=STATS
+# RUN: riscv-interpreter --engine blocks %s | filecheck %s
+# RUN: riscv-interpreter --check %s | filecheck %s
+# RUN: not riscv-interpreter --engine blocks --profile %t.json %s 2>&1 | filecheck %s --check-prefix=CONFLICT
+# RUN: not riscv-interpreter --engine predecoded --check %s 2>&1 | filecheck %s --check-prefix=CONFLICT
+
+# Sum the first 100 integers in a loop storing the sum in memory, which all
+# engines must execute the same way
+
+main:
+	la s0, sum
+	li t0, 0
+	li t1, 100
+loop:
+	lw t2, 0(s0)
+	add t2, t2, t0
+	sw t2, 0(s0)
+	addi t0, t0, 1
+	ble t0, t1, loop
+	lw a0, 0(s0)
+	andi a0, a0, 255
+	li a7, 93
+	ecall
+
+.data
+sum:
+.word 0
+
+# CHECK:      Return code: 186
+# CHECK-NEXT: Interpreter Errors:
+
+# STATS:      Return code: 186
+# STATS-NEXT: Interpreter Errors:
+# STATS-NEXT: 512 instructions in {{.*}} s ({{[0-9]+}} instructions/s)
+
+# CONFLICT: error: {{.*}} cannot be combined with --engine
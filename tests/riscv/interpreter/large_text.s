@@ -0,0 +1,49 @@
+# RUN: python3 -c 'import sys; print(open(sys.argv[1]).read().replace("# ADDI\n", "\taddi t0, t0, 1\n" * 16000))' %s > %t.s
+# RUN: riscv-interpreter --engine interpreter %t.s | filecheck %s
+# RUN: riscv-interpreter --engine predecoded %t.s | filecheck %s
+# RUN: riscv-interpreter --engine blocks %t.s | filecheck %s
+# RUN: riscv-interpreter --check %t.s | filecheck %s
+# RUN: riscv-interpreter --profile %t.json %t.s
+# RUN: filecheck %s --check-prefix=PROFILE < %t.json
+# RUN: riscv-interpreter --profile %t.folded --profile-format folded %t.s
+# RUN: filecheck %s --check-prefix=FOLDED < %t.folded
+
+# A program with more than 15360 instructions, whose text section no longer
+# fits before the address of the data section of smaller programs. The
+# instructions are added where the ADDI comment is. The loop sums the
+# integers from 1 to 10 in memory, and 128 is added to the sum if the text
+# section comes before the data section. The label of the data section
+# is not counted as the label of any instruction.
+
+main:
+	la s0, sum
+	li t1, 10
+# ADDI
+loop:
+	lw t2, 0(s0)
+	add t2, t2, t1
+	sw t2, 0(s0)
+	addi t1, t1, -1
+	bnez t1, loop
+	lw a0, 0(s0)
+	la t3, loop
+	sltu t4, t3, s0
+	slli t4, t4, 7
+	add a0, a0, t4
+	li a7, 93
+	ecall
+
+.data
+sum:
+.word 0
+
+# CHECK:      Return code: 183
+# CHECK-NEXT: Interpreter Errors:
+
+# PROFILE:      "labels": {
+# PROFILE-NEXT:   "main": 16002,
+# PROFILE-NEXT:   "loop": 57
+# PROFILE-NEXT: }
+
+# FOLDED:     main 16059
+# FOLDED-NOT: sum
@@ -0,0 +1,54 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+# RUN: riscv-interpreter --profile %t.json %s | filecheck %s --check-prefix=OUTPUT
+# RUN: filecheck %s < %t.json
+# RUN: riscv-interpreter --profile %t.folded --profile-format folded %s
+# RUN: filecheck %s --check-prefix=FOLDED < %t.folded
+
+# Call twice a function summing the integers from 1 to a0 in a loop, first
+# with 3 and then with the result, 6
+
+main:
+	li a0, 3
+	jal ra, sum
+	jal ra, sum
+	li a7, 93
+	ecall
+sum:
+	li t0, 0
+loop:
+	add t0, t0, a0
+	addi a0, a0, -1
+	bnez a0, loop
+	mv a0, t0
+	ret
+
+# OUTPUT:      Return code: 21
+# OUTPUT-NEXT: Interpreter Errors:
+
+# CHECK:      "instructions": 38,
+# CHECK-NEXT: "classes": {
+# CHECK-NEXT:   "alu": 24,
+# CHECK-NEXT:   "branch": 9,
+# CHECK-NEXT:   "jump": 4,
+# CHECK-NEXT:   "system": 1
+# CHECK-NEXT: },
+# CHECK-NEXT: "functions": {
+# CHECK-NEXT:   "sum": {
+# CHECK-NEXT:     "instructions": 33,
+# CHECK-NEXT:     "calls": 2
+# CHECK-NEXT:   },
+# CHECK-NEXT:   "main": {
+# CHECK-NEXT:     "instructions": 5,
+# CHECK-NEXT:     "calls": 0
+# CHECK-NEXT:   }
+# CHECK-NEXT: },
+# CHECK-NEXT: "labels": {
+# CHECK-NEXT:   "loop": 31,
+# CHECK-NEXT:   "main": 5,
+# CHECK-NEXT:   "sum": 2
+# CHECK-NEXT: }
+
+# FOLDED:      main 5
+# FOLDED-NEXT: main;sum 33
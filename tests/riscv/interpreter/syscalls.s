@@ -0,0 +1,37 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+# RUN: echo "ChocoPy" | riscv-interpreter %s | filecheck %s
+
+# Echo a line read from stdin after a greeting, then exit with code 3
+
+	.data
+greeting:	.ascii "Hello, "
+	.text
+_start:
+	addi sp, sp, -16
+	li a0, 0
+	mv a1, sp
+	li a2, 16
+	li a7, 63
+	ecall
+	mv s1, a0
+	li a0, 1
+	la a1, greeting
+	li a2, 7
+	li a7, 64
+	ecall
+	li a0, 1
+	mv a1, sp
+	mv a2, s1
+	li a7, 64
+	ecall
+	addi sp, sp, 16
+	li a0, 3
+	li a7, 93
+	ecall
+
+# CHECK:      Hello, ChocoPy
+# CHECK-EMPTY:
+# CHECK-NEXT: Return code: 3
+# CHECK-NEXT: Interpreter Errors:
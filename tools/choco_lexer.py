@@ -4,15 +4,19 @@ Email: tutorcs@163.com
 #!/usr/bin/env python3
 
 import argparse
-from choco.lexer import Lexer, TokenKind
+from choco.lexer import Lexer, TokenKind, tokenizers
 
 
 def __main__():
     parser = argparse.ArgumentParser(description='A ChocoPy lexer')
     parser.add_argument('file', type=argparse.FileType('r'))
+    parser.add_argument('--backend',
+                        choices=list(tokenizers),
+                        default='handwritten',
+                        help='The tokenizer used to lex the file')
     args = parser.parse_args()
 
-    lexer = Lexer(args.file)
+    lexer = Lexer(args.file, args.backend)
     while True:
         token = lexer.consume()
         print(token)
@@ -3,29 +3,30 @@ QQ: 749389476
 Email: tutorcs@163.com
 #!/usr/bin/env python3
 
+# The passes, dialects and targets of choco-opt are imported on first use,
+# and the modules only needed by the batch mode and the compile server are
+# imported by them, to keep the startup time low. Run
+# utils/bench-choco-opt-startup.py to measure it.
+
+from __future__ import annotations
+
 import argparse
 import ast
-from io import IOBase
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from io import IOBase, StringIO
+
+from xdsl.printer import Printer
 
 from xdsl.ir import MLContext
 from xdsl.dialects.builtin import ModuleOp
 
-from choco.check_assign_target import check_assign_target
-from choco.for_to_while import for_to_while
-from choco.name_analysis import name_analysis
-from choco.type_checking import type_checking
-from choco.warn_dead_code import DeadCodeError, warn_dead_code
-from riscv.dialect import RISCV
-from riscv.printer import print_program
-from riscv.register_allocation import riscv_ssa_to_riscv
-from riscv.function_lowering import riscv_function_lowering
-from riscv.ssa_dialect import RISCVSSA
-from choco.choco_ast_to_choco_flat import choco_ast_to_choco_flat
-from choco.constant_folding import choco_flat_constant_folding
-from choco.dead_code_elimination import choco_flat_dead_code_elimination
-from choco.choco_flat_introduce_library_calls import choco_flat_introduce_library_calls
-
-from choco.choco_flat_to_riscv_ssa import choco_flat_to_riscv_ssa
+from choco.compile_cache import CacheEntry, CompileCache
+from choco.warn_dead_code import DeadCodeError
+from riscv import register_allocators
 
 from choco.lexer import Lexer as ChocoLexer
 from choco.parser import Parser as ChocoParser
@@ -33,48 +34,257 @@ from choco.parser import SyntaxError
 
 from choco.semantic_error import SemanticError
 
-from choco.dialects.choco_ast import ChocoAST
-from choco.dialects.choco_flat import ChocoFlat
-
-from typing import Callable, Dict, List
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, List,
+                    Optional, Tuple, TypeVar)
 
 from xdsl.xdsl_opt_main import xDSLOptMain
 
+if TYPE_CHECKING:
+    import multiprocessing.pool
+
+    from choco.pass_statistics import PassStatistics
+
+T = TypeVar('T')
+
+
+def import_object(path: str) -> Any:
+    """Import the object at the given path, e.g. `choco.lexer.Lexer`"""
+    module_name, name = path.rsplit('.', 1)
+    # __import__ rather than importlib.import_module, whose imports are
+    # missing from the reports of `python -X importtime`
+    __import__(module_name)
+    return getattr(sys.modules[module_name], name)
+
+
+def get_pass_name(path: str) -> str:
+    """Get the name of the pass whose function is at the given path"""
+    return path.rsplit('.', 1)[1].replace("_", "-")
+
+
+def lazy_pass(path: str) -> Callable[[MLContext, ModuleOp], None]:
+    """
+    Get a function running the pass at the given path, importing it on the
+    first run
+    """
+
+    def run_pass(ctx: MLContext, module: ModuleOp):
+        return import_object(path)(ctx, module)
+
+    return run_pass
+
+
+@dataclass
+class LazyMLContext(MLContext):
+    """
+    Context registering a dialect when one of its operations or attributes
+    is first looked up, relating the prefix of the names in the dialect to
+    the path of the dialect.
+    """
+    lazy_dialects: Dict[str, str] = field(default_factory=dict)
+
+    def register_lazy_dialect(self, prefix: str):
+        self.register_dialect(import_object(self.lazy_dialects.pop(prefix)))
+
+    def register_lazy_dialects(self, name: str):
+        """
+        Register the dialects matching the prefix of name, or all remaining
+        dialects if name is still not registered, as dialects may define
+        attributes with the prefix of another dialect.
+        """
+        for prefix in list(self.lazy_dialects):
+            if name.startswith(prefix + '.'):
+                self.register_lazy_dialect(prefix)
+        if name in self._registeredOps or name in self._registeredAttrs:
+            return
+        for prefix in list(self.lazy_dialects):
+            self.register_lazy_dialect(prefix)
+
+    def get_optional_op(self, name: str):
+        if name not in self._registeredOps and self.lazy_dialects:
+            self.register_lazy_dialects(name)
+        return super().get_optional_op(name)
+
+    def get_optional_attr(self, name: str):
+        if name not in self._registeredAttrs and self.lazy_dialects:
+            self.register_lazy_dialects(name)
+        return super().get_optional_attr(name)
+
 
 class ChocoOptMain(xDSLOptMain):
 
     passes_native = [
         # Semantic Analysis
-        check_assign_target,
-        name_analysis,
-        type_checking,
-        warn_dead_code,
+        'choco.check_assign_target.check_assign_target',
+        'choco.name_analysis.name_analysis',
+        'choco.type_checking.type_checking',
+        'choco.warn_dead_code.warn_dead_code',
 
         # IR Generation
-        choco_ast_to_choco_flat,
+        'choco.choco_ast_to_choco_flat.choco_ast_to_choco_flat',
 
         # IR Optimization
-        choco_flat_introduce_library_calls,
-        choco_flat_constant_folding,
-        choco_flat_dead_code_elimination,
-        for_to_while,
+        'choco.choco_flat_introduce_library_calls.choco_flat_introduce_library_calls',
+        'choco.constant_folding.choco_flat_constant_folding',
+        'choco.dead_code_elimination.choco_flat_dead_code_elimination',
+        'choco.for_to_while.for_to_while',
 
         # Code Generation
-        choco_flat_to_riscv_ssa,
-        riscv_ssa_to_riscv,
-        riscv_function_lowering,
+        'choco.choco_flat_to_riscv_ssa.choco_flat_to_riscv_ssa',
+        'riscv.register_allocation.riscv_ssa_to_riscv',
+        'riscv.function_lowering.riscv_function_lowering',
+    ]
+
+    # The dialects of the compiler, by the prefix of their operation and
+    # attribute names
+    dialects = {
+        'riscv': 'riscv.dialect.RISCV',
+        'riscv_ssa': 'riscv.ssa_dialect.RISCVSSA',
+        'choco.ast': 'choco.dialects.choco_ast.ChocoAST',
+        'choco.ir': 'choco.dialects.choco_flat.ChocoFlat',
+    }
+
+    # The options the output of choco-opt depends on, besides the input
+    cache_key_options = [
+        'passes', 'target', 'frontend', 'disable_verify',
+        'allow_unregistered_ops', 'register_allocator', 'no_asm_comments',
+        'source_locations'
     ]
 
+    flat_ir: Optional[str] = None
+
+    compile_cache: Optional[CompileCache] = None
+
+    pass_statistics: Optional[PassStatistics] = None
+
+    def register_all_arguments(self, arg_parser: argparse.ArgumentParser):
+        super().register_all_arguments(arg_parser)
+        arg_parser.add_argument(
+            "--register-allocator",
+            type=str,
+            required=False,
+            choices=register_allocators,
+            default="linear-scan",
+            help="Register allocator used by riscv-ssa-to-riscv, 'spill' "
+            "placing every variable on the stack")
+        arg_parser.add_argument(
+            "--report-frame-sizes",
+            default=False,
+            action='store_true',
+            help="Print the stack frame size of each function on stderr, "
+            "before and after stack slots are shared")
+        arg_parser.add_argument(
+            "--no-asm-comments",
+            default=False,
+            action='store_true',
+            help="Do not annotate the generated assembly with the riscv_ssa "
+            "operations and variables it comes from")
+        arg_parser.add_argument(
+            "--source-locations",
+            default=False,
+            action='store_true',
+            help="Annotate the operations with their line and column in the "
+            "ChocoPy source, and the generated assembly with .loc directives, "
+            "from which riscv-interpreter --profile counts the instructions "
+            "executed per line")
+        arg_parser.add_argument(
+            "--cache-dir",
+            type=str,
+            required=False,
+            default=os.environ.get("CHOCO_OPT_CACHE_DIR"),
+            help="Directory of the compile cache, reusing the output of "
+            "previous compilations of the same input with the same options. "
+            "Defaults to $CHOCO_OPT_CACHE_DIR, the cache is disabled if unset")
+        arg_parser.add_argument(
+            "--cache-max-size",
+            type=int,
+            required=False,
+            default=64,
+            help="Size of the compile cache in MiB, above which the least "
+            "recently used entries are evicted")
+        arg_parser.add_argument(
+            "--cache-flat-ir",
+            default=False,
+            action='store_true',
+            help="Also store the choco_flat IR in the compile cache")
+        arg_parser.add_argument(
+            "--cache-stats",
+            default=False,
+            action='store_true',
+            help="Print the hit, miss and eviction counts of the compile "
+            "cache on stderr")
+        arg_parser.add_argument(
+            "--batch",
+            type=str,
+            nargs='+',
+            required=False,
+            help="Compile all the given input files in one invocation, "
+            "reporting the compilation time of each file on stderr")
+        arg_parser.add_argument(
+            "--batch-manifest",
+            type=str,
+            required=False,
+            help="File listing the input files of the batch, one per line")
+        arg_parser.add_argument(
+            "--batch-output-dir",
+            type=str,
+            required=False,
+            help="Directory receiving the output of each input of the batch, "
+            "as <input path>.<target>. The outputs are printed on stdout in "
+            "the order of the inputs if unset")
+        arg_parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            required=False,
+            default=1,
+            help="Number of worker processes compiling the batch or the "
+            "requests of --serve, 0 using one per CPU")
+        arg_parser.add_argument(
+            "--serve",
+            default=False,
+            action='store_true',
+            help="Run as a compile server, reading requests as JSON lines "
+            "{\"id\", \"source\", \"passes\", \"target\"} and writing one "
+            "JSON line {\"id\", \"output\", \"diagnostic\", \"error\", "
+            "\"time\"} per request. The passes and target default to the "
+            "options of the server")
+        arg_parser.add_argument(
+            "--serve-socket",
+            type=str,
+            required=False,
+            help="Unix socket the compile server listens on, instead of "
+            "stdin and stdout")
+        arg_parser.add_argument(
+            "--time-passes",
+            default=False,
+            action='store_true',
+            help="Print the wall time, the op counts before and after, and "
+            "the peak traced memory of the frontend, each pass and the "
+            "output on stderr. Memory tracing slows down the compilation")
+        arg_parser.add_argument(
+            "--profile-passes",
+            type=str,
+            required=False,
+            metavar="DIR",
+            help="Write a cProfile profile of the frontend, each pass and the "
+            "output in DIR, as <index>-<name>.pstats")
+
     def register_all_passes(self):
         self.available_passes = self.get_passes_as_dict()
+        self.available_passes['semantic-analysis'] = lazy_pass(
+            'choco.semantic_analysis.semantic_analysis')
+        self.available_passes['riscv-ssa-to-riscv'] = lambda ctx, mod: import_object(
+            'riscv.register_allocation.riscv_ssa_to_riscv')(
+                ctx, mod, self.args.register_allocator,
+                self.args.report_frame_sizes, not self.args.no_asm_comments)
 
     def _output_risc(self, prog: ModuleOp, output: IOBase):
+        print_program = import_object('riscv.printer.print_program')
         print_program(prog.ops, "riscv", stream=output)  #type: ignore
 
     def register_all_targets(self):
         super().register_all_targets()
-        self.available_targets['riscv'] = lambda prog, output: print_program(
-            prog.ops, "riscv", stream=output)  #type: ignore
+        self.available_targets['riscv'] = self._output_risc
 
     def pipeline_entry(self, k: str, entries: Dict):
         """Helper function that returns a pass"""
@@ -102,6 +312,7 @@ class ChocoOptMain(xDSLOptMain):
                 pipeline = pipeline[:pipeline.index(entry) + 1]  # type: ignore
             else:
                 super().setup_pipeline()
+                self.instrument_pipeline()
                 return
 
         else:
@@ -111,14 +322,104 @@ class ChocoOptMain(xDSLOptMain):
 
         self.pipeline = [(p, lambda op, p=p: self.available_passes[p]
                           (self.ctx, op)) for p in pipeline]
+        self.instrument_pipeline()
+
+    def instrument_pipeline(self):
+        """
+        Record the statistics of each pass if --time-passes or
+        --profile-passes is set
+        """
+        if not (self.args.time_passes or self.args.profile_passes):
+            self.pass_statistics = None
+            return
+        PassStatistics = import_object('choco.pass_statistics.PassStatistics')
+        self.pass_statistics = PassStatistics(
+            trace_memory=self.args.time_passes,
+            profile_dir=self.args.profile_passes)
+        self.pipeline = [(pass_name, lambda op, pass_name=pass_name, p=p: self.
+                          measure(pass_name, lambda: p(op), op))
+                         for pass_name, p in self.pipeline]
+
+    def measure(self,
+                name: str,
+                run: Callable[[], T],
+                module: Optional[ModuleOp] = None) -> T:
+        """
+        Run a stage of the compilation, recording its statistics if the
+        pipeline is instrumented
+        """
+        if self.pass_statistics is None:
+            return run()
+        return self.pass_statistics.measure(name, run, module)
+
+    def print_pass_statistics(self):
+        """
+        Print the statistics of the stages run since the pipeline was set
+        up, if it is instrumented
+        """
+        if self.pass_statistics is None or not self.pass_statistics.records:
+            return
+        if self.args.time_passes:
+            sys.stderr.write(self.pass_statistics.format_report())
+        self.pass_statistics.records = []
+
+    def capture_flat_ir(self):
+        """Record the choco_flat IR in `flat_ir` once the pipeline generated it"""
+        for i, (pass_name, p) in enumerate(self.pipeline):
+            if pass_name != 'choco-ast-to-choco-flat':
+                continue
+
+            def generate_flat_ir(op: ModuleOp, p=p):
+                p(op)
+                output = StringIO()
+                Printer(stream=output).print_op(op)
+                self.flat_ir = output.getvalue()
+
+            self.pipeline[i] = (pass_name, generate_flat_ir)
+
+    def captures_flat_ir(self) -> bool:
+        """Check whether the cache entries of this run hold the choco_flat IR"""
+        return self.args.cache_flat_ir and any(
+            pass_name == 'choco-ast-to-choco-flat'
+            for pass_name, _ in self.pipeline)
+
+    def parse_source(self, source: str) -> ModuleOp:
+        """Parse the given source text with the selected frontend, choc by default"""
+        frontend = self.args.frontend or 'choc'
+        return self.available_frontends[frontend](StringIO(source))
+
+    def get_compile_cache(self) -> Optional[CompileCache]:
+        """
+        Get the compile cache, if it is enabled and the output of this run
+        can be cached
+        """
+        if (self.args.cache_dir is None or self.args.input_file is None
+                or self.args.print_between_passes
+                or self.args.report_frame_sizes or self.args.time_passes
+                or self.args.profile_passes):
+            return None
+        if self.compile_cache is None:
+            self.compile_cache = CompileCache(
+                self.args.cache_dir, self.args.cache_max_size * 1024 * 1024)
+        return self.compile_cache
+
+    def get_cache_key(self, cache: CompileCache) -> str:
+        """Get the key of the output of this run in the compile cache"""
+        options = {
+            name: str(getattr(self.args, name))
+            for name in ChocoOptMain.cache_key_options
+        }
+        _, options['extension'] = os.path.splitext(self.args.input_file)
+        with open(self.args.input_file, 'rb') as f:
+            return cache.key(f.read(), options)
 
     def register_all_dialects(self):
+        """
+        Register all dialects that can be used, the dialects of the compiler
+        on first use.
+        """
+        self.ctx = LazyMLContext(lazy_dialects=dict(ChocoOptMain.dialects))
         super().register_all_dialects()
-        """Register all dialects that can be used."""
-        self.ctx.register_dialect(RISCV)
-        self.ctx.register_dialect(RISCVSSA)
-        self.ctx.register_dialect(ChocoAST)
-        self.ctx.register_dialect(ChocoFlat)
 
     @staticmethod
     def get_passes_as_dict(
@@ -129,9 +430,8 @@ class ChocoOptMain(xDSLOptMain):
 
         passes = ChocoOptMain.passes_native
 
-        for pass_function in passes:
-            pass_dictionary[pass_function.__name__.replace(
-                "_", "-")] = pass_function
+        for pass_path in passes:
+            pass_dictionary[get_pass_name(pass_path)] = lazy_pass(pass_path)
 
         return pass_dictionary
 
@@ -144,8 +444,8 @@ class ChocoOptMain(xDSLOptMain):
             passes = ChocoOptMain.passes_native
         else:
             passes = ChocoOptMain.passes_native
-        for pass_function in passes:
-            pass_list.append(pass_function.__name__.replace("_", "-"))
+        for pass_path in passes:
+            pass_list.append(get_pass_name(pass_path))
 
         return pass_list
 
@@ -154,31 +454,343 @@ class ChocoOptMain(xDSLOptMain):
 
         def parse_choco(f: IOBase):
             lexer = ChocoLexer(f)  # type: ignore
-            parser = ChocoParser(lexer)
+            parser = ChocoParser(lexer, self.args.source_locations)
             program = parser.parse_program()
             return program
 
         self.available_frontends['choc'] = parse_choco
 
 
-def __main__():
-    choco_main = ChocoOptMain()
-
+def compile_program(choco_main: ChocoOptMain,
+                    source: Optional[str] = None) -> CacheEntry:
+    """
+    Compile the input, or the given source text, returning the resulting
+    program or diagnostic.
+    """
     try:
-        module = choco_main.parse_input()
+        if source is None:
+            module = choco_main.measure('frontend', choco_main.parse_input)
+        else:
+            module = choco_main.measure(
+                'frontend', lambda: choco_main.parse_source(source))
         choco_main.apply_passes(module)
+        contents = choco_main.measure(
+            'output', lambda: choco_main.output_resulting_program(module),
+            module)
     except SyntaxError as e:
-        print(e.get_message())
-        exit(0)
+        return CacheEntry(e.get_message(), is_diagnostic=True)
     except SemanticError as e:
-        print("Semantic error: %s" % str(e))
-        exit(0)
+        return CacheEntry("Semantic error: %s" % str(e), is_diagnostic=True)
     except DeadCodeError as e:
-        print(f"[Warning] Dead code found: {e}")
+        return CacheEntry(f"[Warning] Dead code found: {e}",
+                          is_diagnostic=True)
+    finally:
+        choco_main.print_pass_statistics()
+
+    return CacheEntry(contents, flat_ir=choco_main.flat_ir)
+
+
+def compile_input(choco_main: ChocoOptMain,
+                  cache: Optional[CompileCache]) -> CacheEntry:
+    """Compile the input, reusing the entry of the compile cache if any"""
+    if cache is None:
+        return compile_program(choco_main)
+
+    key = choco_main.get_cache_key(cache)
+    entry = cache.get(key, choco_main.captures_flat_ir())
+    if entry is None:
+        choco_main.flat_ir = None
+        entry = compile_program(choco_main)
+        cache.put(key, entry)
+    return entry
+
+
+def flush_cache_stats(choco_main: ChocoOptMain):
+    """Record the hits and misses of the compile cache of choco_main"""
+    if choco_main.compile_cache is not None:
+        choco_main.compile_cache.flush_stats()
+
+
+def print_cache_stats(cache: CompileCache):
+    stats = cache.stats()
+    print(", ".join(f"{name}: {count}" for name, count in stats.items()),
+          file=sys.stderr)
+
+
+# The ChocoOptMain compiling the inputs of a batch, or the requests of the
+# compile server, in this process
+worker_main: Optional[ChocoOptMain] = None
+
+
+def init_worker(argv: List[str]):
+    """
+    Set up a worker process of the batch mode or of the compile server,
+    parsing the options once
+    """
+    from multiprocessing.util import Finalize
+
+    global worker_main
+    worker_main = ChocoOptMain(args=argv)
+    if worker_main.args.cache_flat_ir:
+        worker_main.capture_flat_ir()
+    # record the cache statistics once, when the worker exits
+    Finalize(None, flush_cache_stats, args=(worker_main, ), exitpriority=0)
+
+
+def compile_batch_input(
+        input_file: str
+) -> Tuple[str, Optional[CacheEntry], Optional[str], float]:
+    """
+    Compile an input of the batch, returning the input file, the compilation
+    result or error, and the compilation time in seconds.
+    """
+    assert worker_main is not None
+    start = time.perf_counter()
+    worker_main.args.input_file = input_file
+    entry: Optional[CacheEntry] = None
+    error: Optional[str] = None
+    try:
+        entry = compile_input(worker_main, worker_main.get_compile_cache())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return input_file, entry, error, time.perf_counter() - start
+
+
+def get_batch_inputs(args: argparse.Namespace) -> List[str]:
+    """Get the inputs of the batch, from the command line and the manifest"""
+    inputs: List[str] = list(args.batch or [])
+    if args.batch_manifest:
+        with open(args.batch_manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    inputs.append(line)
+    return inputs
+
+
+def get_batch_output_path(output_dir: str, input_file: str,
+                          target: str) -> str:
+    """
+    Get the path of the output of input_file, mirroring its path relative to
+    the working directory below output_dir.
+    """
+    path = os.path.relpath(input_file)
+    if os.path.isabs(path) or path.startswith(os.pardir):
+        path = os.path.abspath(input_file).lstrip(os.sep)
+    return os.path.join(output_dir, f"{path}.{target}")
+
+
+def run_batch(choco_main: ChocoOptMain, inputs: List[str]) -> int:
+    """
+    Compile all inputs, in this process or over a pool of worker processes,
+    and write the outputs in the order of the inputs. The compilation time
+    of each input is reported on stderr. Returns the number of inputs that
+    failed to compile.
+    """
+    import multiprocessing
+
+    global worker_main
+    args = choco_main.args
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    failures = 0
+    start = time.perf_counter()
+
+    def write_results(results: Iterable[Tuple[str, Optional[CacheEntry],
+                                              Optional[str], float]]):
+        nonlocal failures
+        for input_file, entry, error, seconds in results:
+            print(f"{seconds:8.3f} s  {input_file}", file=sys.stderr)
+            if entry is None:
+                failures += 1
+                print(f"error: {input_file}: {error}", file=sys.stderr)
+            elif args.batch_output_dir:
+                path = get_batch_output_path(args.batch_output_dir,
+                                             input_file, args.target)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(entry.output)
+            else:
+                print(f"==> {input_file} <==")
+                print(entry.output)
+
+    if jobs == 1:
+        worker_main = choco_main
+        if args.cache_flat_ir:
+            choco_main.capture_flat_ir()
+        write_results(map(compile_batch_input, inputs))
+        flush_cache_stats(choco_main)
+    else:
+        with multiprocessing.Pool(jobs,
+                                  initializer=init_worker,
+                                  initargs=(sys.argv[1:], )) as pool:
+            write_results(pool.imap(compile_batch_input, inputs))
+            # let the workers exit, flushing their cache statistics, rather
+            # than being terminated
+            pool.close()
+            pool.join()
+
+    print(f"{time.perf_counter() - start:8.3f} s  total, {len(inputs)} "
+          f"inputs, {failures} failed, {jobs} jobs",
+          file=sys.stderr)
+    return failures
+
+
+def error_response(id: Any,
+                   error: str,
+                   elapsed: float = 0.0) -> Dict[str, Any]:
+    """Get the response of the compile server to a request that failed"""
+    return {
+        'id': id,
+        'output': None,
+        'diagnostic': False,
+        'error': error,
+        'time': elapsed
+    }
+
+
+def compile_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Compile the source of a request of the compile server"""
+    assert worker_main is not None
+    start = time.perf_counter()
+    args = worker_main.args
+    passes, target = args.passes, args.target
+    try:
+        args.passes = request.get('passes', passes)
+        args.target = request.get('target', target)
+        worker_main.setup_pipeline()
+        entry = compile_program(worker_main, request['source'])
+        response = {
+            'id': request.get('id'),
+            'output': entry.output,
+            'diagnostic': entry.is_diagnostic,
+            'error': None
+        }
+    except Exception as e:
+        response = error_response(request.get('id'),
+                                  f"{type(e).__name__}: {e}")
+    finally:
+        args.passes, args.target = passes, target
+    response['time'] = time.perf_counter() - start
+    return response
+
+
+def parse_request(line: str) -> Dict[str, Any]:
+    """Parse a JSON line request of the compile server"""
+    request = json.loads(line)
+    if not isinstance(request, dict) or not isinstance(
+            request.get('source'), str):
+        raise ValueError("expected an object with a 'source' string")
+    return request
+
+
+def serve_requests(pool: multiprocessing.pool.Pool, lines: Iterable[str],
+                   write: Callable[[str], None]):
+    """
+    Compile the requests read from lines on the pool, writing each response
+    once its compilation finished. Returns once all responses are written.
+    """
+    import threading
+
+    lock = threading.Lock()
+    pending: List[multiprocessing.pool.AsyncResult] = []
+
+    def respond(response: Dict[str, Any]):
+        with lock:
+            write(json.dumps(response) + '\n')
+
+    for line in lines:
+        if not line.strip():
+            continue
+        start = time.perf_counter()
+        try:
+            request = parse_request(line)
+        except ValueError as e:
+            respond(
+                error_response(None, f"Invalid request: {e}",
+                               time.perf_counter() - start))
+            continue
+        pending = [result for result in pending if not result.ready()]
+        pending.append(
+            pool.apply_async(
+                compile_request, (request, ),
+                callback=respond,
+                error_callback=lambda e, id=request.get('id'): respond(
+                    error_response(id, f"{type(e).__name__}: {e}"))))
+
+    for result in pending:
+        result.wait()
+
+
+def serve(choco_main: ChocoOptMain):
+    """
+    Run the compile server, keeping the options, dialects and passes loaded
+    in a pool of worker processes.
+    """
+    import multiprocessing
+    import signal
+    import socketserver
+
+    args = choco_main.args
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    with multiprocessing.Pool(jobs,
+                              initializer=init_worker,
+                              initargs=(sys.argv[1:], )) as pool:
+        if args.serve_socket is None:
+
+            def write_stdout(response: str):
+                sys.stdout.write(response)
+                sys.stdout.flush()
+
+            serve_requests(pool, sys.stdin, write_stdout)
+            return
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                lines = (line.decode() for line in self.rfile)
+                serve_requests(pool, lines,
+                               lambda response: self.wfile.write(
+                                   response.encode()))
+
+        if os.path.exists(args.serve_socket):
+            os.remove(args.serve_socket)
+        # exit through the finally clause below when terminated
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            with socketserver.ThreadingUnixStreamServer(
+                    args.serve_socket, RequestHandler) as server:
+                server.serve_forever()
+        finally:
+            os.remove(args.serve_socket)
+
+
+def __main__():
+    choco_main = ChocoOptMain()
+
+    if choco_main.args.serve:
+        serve(choco_main)
+        return
+
+    inputs = get_batch_inputs(choco_main.args)
+    if inputs:
+        failures = run_batch(choco_main, inputs)
+        if choco_main.args.cache_dir and choco_main.args.cache_stats:
+            print_cache_stats(CompileCache(choco_main.args.cache_dir))
+        exit(1 if failures else 0)
+
+    cache = choco_main.get_compile_cache()
+    if cache is not None and choco_main.args.cache_flat_ir:
+        choco_main.capture_flat_ir()
+    entry = compile_input(choco_main, cache)
+    flush_cache_stats(choco_main)
+    if cache is not None and choco_main.args.cache_stats:
+        print_cache_stats(cache)
+
+    if entry.is_diagnostic:
+        print(entry.output)
         exit(0)
 
-    contents = choco_main.output_resulting_program(module)
-    choco_main.print_to_output_stream(contents)
+    choco_main.print_to_output_stream(entry.output)
 
 
 if __name__ == "__main__":
@@ -3,27 +3,93 @@ QQ: 749389476
 Email: tutorcs@163.com
 #!/usr/bin/env python3
 """
-This script calls 'python3 -m riscemu' with the right options,
-and removes the additional prints created by riscemu.
-With this script, we only have the output generated by the program file, and
-additionally have one line for the return code.
+This script runs a RISC-V assembly file in the simulator of riscv.simulator.
+We only print the output generated by the program file, and additionally
+one line for the return code and one line for the errors of the
+interpreter, in the format of the riscemu wrapper this script replaces.
 """
 
-import subprocess
 import argparse
+import sys
+from io import StringIO
 
-from riscv.parser import *
+from riscv.block_simulator import BlockSimulator, LockStepSimulator
+from riscv.predecoded_simulator import PredecodedSimulator
+from riscv.profiler import ProfilingSimulator
+from riscv.simulator import Simulator, SimulatorError, parse_program
+
+engines = {
+    'interpreter': Simulator,
+    'predecoded': PredecodedSimulator,
+    'blocks': BlockSimulator,
+}
 
 
 def __main__():
     parser = argparse.ArgumentParser(description='A RISC-V interpreter')
     parser.add_argument('file', type=argparse.FileType('r'))
+    parser.add_argument('--engine',
+                        choices=list(engines),
+                        help='the engine executing the instructions, blocks '
+                        'by default')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='translate blocks and check them against the interpreter, '
+        'instead of running an --engine')
+    parser.add_argument(
+        '--profile',
+        type=argparse.FileType('w'),
+        help='count the instructions executed per function, label and class '
+        'of instruction, and write the counts to the given file. The '
+        'instructions are run by the predecoded engine, instead of an '
+        '--engine')
+    parser.add_argument('--profile-format',
+                        choices=['json', 'folded'],
+                        default='json',
+                        help='write the profile as JSON, or as the folded '
+                        'call stacks of flame graph tools')
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='print the number of instructions executed per second to stderr')
     args = parser.parse_args()
-    result = subprocess.run(["python3", "-m", "riscemu", args.file.name],
-                            capture_output=True)
-    print(result.stdout.decode("ascii"))
-    print(f"Return code: {result.returncode}")
-    print(f"Interpreter Errors: {result.stderr.decode('utf8')}")
+    if args.profile and (args.engine or args.check):
+        parser.error("--profile cannot be combined with --engine or --check")
+    if args.check and args.engine:
+        parser.error("--check cannot be combined with --engine")
+
+    errors = StringIO()
+    return_code = 255
+    simulator = None
+    try:
+        program = parse_program(args.file)
+        if args.profile:
+            engine = ProfilingSimulator
+        elif args.check:
+            engine = LockStepSimulator
+        else:
+            engine = engines[args.engine or 'blocks']
+        simulator = engine(program, stderr=errors)
+        # riscemu exits with the exit code of the program
+        return_code = simulator.run() & 0xFF
+    except SimulatorError as e:
+        errors.write(f"Error: {e}")
+    except Exception as e:
+        # the parser reports syntax errors with plain exceptions
+        errors.write(f"Error: {type(e).__name__}: {e}")
+    sys.stdout.write("\n")
+    print(f"Return code: {return_code}")
+    print(f"Interpreter Errors: {errors.getvalue()}")
+    if args.profile and isinstance(simulator, ProfilingSimulator):
+        if args.profile_format == 'json':
+            args.profile.write(simulator.format_json())
+        else:
+            args.profile.write(simulator.format_folded_stacks())
+        args.profile.close()
+    if args.stats and simulator is not None:
+        sys.stdout.flush()
+        print(simulator.format_statistics(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+#!/usr/bin/env python3
+
+import argparse
+import io
+import time
+
+from choco.lexer import Lexer, TokenKind, tokenizers
+
+
+def generate_program(size: int, line_length: int) -> str:
+    """
+    Generate a ChocoPy program of about `size` characters. Besides ordinary
+    functions and loops, the program contains list literals of about
+    `line_length` characters on a single line.
+    """
+    parts = []
+    length = 0
+    i = 0
+    while length < size:
+        elems = ", ".join(str(j) for j in range(line_length // 6))
+        part = (f"# Function number {i}\n"
+                f"def f{i}(x: int, s: str) -> int:\n"
+                f"    y: int = 0\n"
+                f"    l: [int] = None\n"
+                f"    l = [{elems}]\n"
+                f"    while y < x and not (s == \"a\\tb\"):\n"
+                f"        y = y + x // 2 - {i} % 3  # Update y\n"
+                f"        if y >= 10:\n"
+                f"            return y\n"
+                f"        elif y != 5:\n"
+                f"            pass\n"
+                f"    return l[0]\n"
+                f"\n"
+                f"print(f{i}({i}, \"iteration {i}\"))\n")
+        parts.append(part)
+        length += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def lex(program: str, backend: str) -> int:
+    """Lex a program and return the number of tokens."""
+    lexer = Lexer(io.StringIO(program), backend)
+    num_tokens = 0
+    while lexer.consume().kind != TokenKind.EOF:
+        num_tokens += 1
+    return num_tokens
+
+
+def __main__():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the ChocoPy lexer')
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024,
+                        help='Size in characters of the generated program')
+    parser.add_argument('--line-length', type=int, default=20000,
+                        help='Length in characters of the longest lines')
+    parser.add_argument('--backend', choices=list(tokenizers),
+                        default='handwritten',
+                        help='The tokenizer used to lex the program')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write the generated program to this file')
+    args = parser.parse_args()
+
+    program = generate_program(args.size, args.line_length)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(program)
+
+    start = time.perf_counter()
+    num_tokens = lex(program, args.backend)
+    elapsed = time.perf_counter() - start
+
+    print(f"program size: {len(program)} characters")
+    print(f"tokens: {num_tokens}")
+    print(f"time: {elapsed:.2f} s")
+    print(f"throughput: {len(program) / elapsed / 1e6:.2f} MB/s, "
+          f"{num_tokens / elapsed:,.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    __main__()
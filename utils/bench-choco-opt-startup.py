@@ -0,0 +1,102 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The choco-opt invocations measured, by name
+invocations = {
+    'help': ['--help'],
+    'type': ['-p', 'type'],
+    'ir': ['-p', 'ir'],
+    'riscv': ['-p', 'all', '-t', 'riscv'],
+}
+
+
+def run_choco_opt(args: List[str], import_time: bool) -> Tuple[float, str]:
+    """Run choco-opt with args, returning its wall time and stderr"""
+    command = [sys.executable]
+    if import_time:
+        command += ['-X', 'importtime']
+    command += [os.path.join(root, 'tools', 'choco_opt.py')] + args
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    start = time.perf_counter()
+    result = subprocess.run(command,
+                            env=env,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            text=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def parse_import_times(report: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Get the self and cumulative import time in microseconds of each module
+    of a `python -X importtime` report.
+    """
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[0].strip().isdigit():
+            continue
+        module = fields[2].strip()
+        times[module] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def __main__():
+    parser = argparse.ArgumentParser(
+        description='Measure the startup time of choco-opt, and report the '
+        'modules taking the longest to import')
+    parser.add_argument('--input',
+                        type=str,
+                        default=os.path.join(root, 'tests', 'end-to-end',
+                                             'print-integer-literal.choc'),
+                        help='ChocoPy program compiled by the invocations')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times each invocation is run')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of modules reported per invocation')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='Exit with status 1 if an invocation takes '
+                        'longer than this many seconds')
+    args = parser.parse_args()
+
+    slow = False
+    for name, invocation in invocations.items():
+        invocation = invocation + ([] if name == 'help' else [args.input])
+        wall_time = min(
+            run_choco_opt(invocation, False)[0] for _ in range(args.repeat))
+        _, report = run_choco_opt(invocation, True)
+        times = parse_import_times(report)
+        total = sum(self_time for self_time, _ in times.values())
+
+        print(f"{name}: {wall_time:.3f} s, {len(times)} modules imported in "
+              f"{total / 1e6:.3f} s")
+        top = sorted(times.items(), key=lambda item: -item[1][1])[:args.top]
+        for module, (self_time, cumulative) in top:
+            print(f"  {cumulative / 1e3:8.1f} ms  {self_time / 1e3:8.1f} ms  "
+                  f"{module}")
+
+        if args.max_time is not None and wall_time > args.max_time:
+            slow = True
+
+    if slow:
+        print(f"error: an invocation took longer than {args.max_time} s",
+              file=sys.stderr)
+        exit(1)
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,267 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from riscv.profiler import ProfilingSimulator
+from riscv.simulator import SimulatorError, parse_program
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_baseline = os.path.join(root, 'utils', 'bench-end-to-end.json')
+
+# The metrics recorded per program, by name, and their column header
+metrics = {
+    'code_size': 'code',
+    'instructions': 'instrs',
+    'loads': 'loads',
+    'stores': 'stores',
+    'heap': 'heap',
+}
+
+# The input the RUN line of a test pipes into the interpreter, if any
+stdin_pattern = re.compile(r'echo "([^"]*)" \| riscv-interpreter')
+
+Result = Dict[str, int]
+
+# The result of a program in the baseline, or its error if it failed
+BaselineEntry = Dict[str, Any]
+
+
+def get_programs(directory: str) -> List[str]:
+    """Get the ChocoPy programs below directory, relative to the root"""
+    programs = []
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if file_name.endswith('.choc'):
+                programs.append(
+                    os.path.relpath(os.path.join(dir_path, file_name), root))
+    return sorted(programs)
+
+
+def get_stdin(program: str) -> str:
+    """Get the standard input the test of a program runs it with"""
+    with open(os.path.join(root, program)) as f:
+        match = stdin_pattern.search(f.read())
+    return match.group(1) + "\n" if match else ""
+
+
+def compile_programs(programs: List[str], output_dir: str,
+                     jobs: int) -> Dict[str, str]:
+    """
+    Compile the programs with a batch invocation of choco-opt, writing the
+    assembly of each program to output_dir. Returns the error of each
+    program that failed to compile.
+    """
+    command = [
+        sys.executable,
+        os.path.join(root, 'tools', 'choco_opt.py'), '-p', 'all', '-t',
+        'riscv', '--batch-output-dir', output_dir, '-j',
+        str(jobs), '--batch'
+    ] + programs
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run(command,
+                            cwd=root,
+                            env=env,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            text=True)
+    errors: Dict[str, str] = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('error: '):
+            program, _, error = line[len('error: '):].partition(': ')
+            errors[program] = error.rstrip(': ')
+    return errors
+
+
+def measure(assembly: str, stdin: str, max_instructions: int) -> Result:
+    """
+    Run the assembly of a program in the simulator, returning its static
+    code size, dynamic instruction count, loads and stores executed, peak
+    heap use in bytes and exit code.
+    """
+    with open(assembly) as f:
+        program = parse_program(f)
+    simulator = ProfilingSimulator(program,
+                                   stdin=StringIO(stdin),
+                                   stdout=StringIO(),
+                                   stderr=StringIO(),
+                                   max_instructions=max_instructions)
+    exit_code = simulator.run()
+    classes = simulator.get_profile()['classes']
+    assert isinstance(classes, dict)
+
+    # The heap is a bump allocator, so the final value of its pointer is
+    # also its peak
+    heap = 0
+    if '_heap' in program.labels and '_heap_tree_ptr' in program.labels:
+        heap = simulator.load(program.labels['_heap_tree_ptr'], 4,
+                              False) - program.labels['_heap']
+
+    return {
+        'code_size': len(program.instructions),
+        'instructions': simulator.instructions_executed,
+        'loads': classes.get('load', 0),
+        'stores': classes.get('store', 0),
+        'heap': heap,
+        'exit_code': exit_code,
+    }
+
+
+def run_programs(programs: List[str], jobs: int, max_instructions: int
+                 ) -> Tuple[Dict[str, Result], Dict[str, str]]:
+    """
+    Compile and run the programs, returning the results of the programs that
+    ran, and the error of the others.
+    """
+    results: Dict[str, Result] = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        errors = compile_programs(programs, output_dir, jobs)
+        for program in programs:
+            if program in errors:
+                continue
+            assembly = os.path.join(output_dir, f"{program}.riscv")
+            try:
+                results[program] = measure(assembly, get_stdin(program),
+                                           max_instructions)
+            except SimulatorError as e:
+                errors[program] = f"SimulatorError: {e}"
+            except Exception as e:
+                # the parser reports syntax errors with plain exceptions
+                errors[program] = f"{type(e).__name__}: {e}"
+    return results, errors
+
+
+def format_value(value: int, old: Optional[int]) -> str:
+    """Format the value of a metric, with its change from the baseline"""
+    if old is None or value == old:
+        return str(value)
+    if old == 0:
+        return f"{value} (new)"
+    return f"{value} ({100 * (value - old) / old:+.1f}%)"
+
+
+def compare(program: str, result: Result, old: BaselineEntry,
+            threshold: float) -> List[str]:
+    """
+    Get the regressions of a program with respect to the baseline, skipping
+    the metrics the baseline does not record.
+    """
+    regressions = []
+    old_exit_code = old.get('exit_code')
+    if old_exit_code is not None and result['exit_code'] != old_exit_code:
+        regressions.append(f"{program}: exit code {result['exit_code']}, "
+                           f"expected {old_exit_code}")
+    for metric in metrics:
+        value, old_value = result[metric], old.get(metric)
+        if old_value is None:
+            continue
+        if value > old_value * (1 + threshold / 100):
+            regressions.append(
+                f"{program}: {metric} {format_value(value, old_value)}, "
+                f"above the threshold of {threshold}%")
+    return regressions
+
+
+def __main__():
+    parser = argparse.ArgumentParser(
+        description='Compile and run the end-to-end tests, and compare their '
+        'static code size, dynamic instruction count, loads and stores '
+        'executed and peak heap use with a baseline')
+    parser.add_argument('programs',
+                        type=str,
+                        nargs='*',
+                        help='ChocoPy programs measured, all the programs of '
+                        'tests/end-to-end by default')
+    parser.add_argument('--baseline',
+                        type=str,
+                        default=default_baseline,
+                        help='JSON file of the results compared against')
+    parser.add_argument('--update',
+                        action='store_true',
+                        help='Write the results to the baseline instead of '
+                        'comparing them')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=1.0,
+                        help='Increase of a metric, in percent, above which '
+                        'it is reported as a regression')
+    parser.add_argument('--warn-only',
+                        action='store_true',
+                        help='Report the regressions, but exit with status 0')
+    parser.add_argument('--max-instructions',
+                        type=int,
+                        default=10**7,
+                        help='Number of instructions after which a program '
+                        'is aborted')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=0,
+                        help='Number of processes compiling the programs, '
+                        '0 using one per CPU')
+    args = parser.parse_args()
+
+    programs = [os.path.relpath(os.path.abspath(program), root)
+                for program in args.programs] or get_programs(
+                    os.path.join(root, 'tests', 'end-to-end'))
+    results, errors = run_programs(programs, args.jobs, args.max_instructions)
+
+    if args.update:
+        # record the failures too, so that a program that stops failing, or
+        # starts failing, is noticed
+        new_baseline: Dict[str, BaselineEntry] = dict(results)
+        for program, error in errors.items():
+            new_baseline[program] = {'error': error}
+        with open(args.baseline, 'w') as f:
+            json.dump(new_baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"{len(results)} programs ran, {len(errors)} failed, written "
+              f"to {args.baseline}")
+        return
+
+    baseline: Dict[str, BaselineEntry] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    width = max(len(program) for program in programs)
+    print(f"{'program':<{width}}" +
+          "".join(f"  {header:>14}" for header in metrics.values()))
+    regressions: List[str] = []
+    for program in programs:
+        old = baseline.get(program)
+        if program not in results:
+            print(f"{program:<{width}}  error: {errors[program]}")
+            if old is not None and 'error' not in old:
+                regressions.append(
+                    f"{program}: failed, but ran in the baseline")
+            continue
+        result, old_values = results[program], old or {}
+        print(f"{program:<{width}}" + "".join(
+            f"  {format_value(result[metric], old_values.get(metric)):>14}"
+            for metric in metrics))
+        if old is not None:
+            regressions += compare(program, result, old, args.threshold)
+
+    print(f"{len(results)} programs ran, {len(errors)} failed, "
+          f"{len(regressions)} regressions")
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    if regressions and not args.warn_only:
+        exit(1)
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,70 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+#!/usr/bin/env python3
+
+import argparse
+import io
+import time
+
+from riscv.dialect import *
+from riscv.printer import print_program
+
+
+def build_program(num_blocks: int):
+    """
+    Build a synthetic program of `num_blocks` basic blocks, each made of the
+    kind of code the register allocator emits: stack loads and stores,
+    arithmetic, a comment and a conditional branch.
+    """
+    sp = RegisterAttr.from_name("sp")
+    t0 = RegisterAttr.from_name("t0")
+    t1 = RegisterAttr.from_name("t1")
+    s1 = RegisterAttr.from_name("s1")
+    a0 = RegisterAttr.from_name("a0")
+
+    instructions = []
+    for i in range(num_blocks):
+        label = f"block_{i}"
+        instructions += [
+            LabelOp.get(label),
+            CommentOp.get(f"Block {i}"),
+            LWOp.get(t0, sp, 4 * (i % 512), f"Load %{i} from the stack"),
+            AddIOp.get(t1, t0, i % 2048),
+            MULOp.get(s1, t0, t1, f"%{i + 1} = %{i} * %{i}"),
+            SWOp.get(s1, sp, 4 * (i % 512)),
+            LIOp.get(a0, i),
+            BEQOp.get(a0, s1, label),
+            JOp.get(f"block_{i + 1}"),
+        ]
+    instructions.append(LabelOp.get(f"block_{num_blocks}"))
+    return instructions
+
+
+def __main__():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the RISC-V assembly printer')
+    parser.add_argument('--blocks', type=int, default=20000,
+                        help='Number of basic blocks of the synthetic program')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times the program is printed')
+    args = parser.parse_args()
+
+    instructions = build_program(args.blocks)
+
+    best = None
+    for _ in range(args.repeat):
+        stream = io.StringIO()
+        start = time.perf_counter()
+        print_program(instructions, 'riscv', stream)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"instructions: {len(instructions)}")
+    print(f"output size: {len(stream.getvalue())} bytes")
+    print(f"best time: {best * 1000:.1f} ms")
+    print(f"throughput: {len(instructions) / best:,.0f} instructions/s")
+
+
+if __name__ == "__main__":
+    __main__()
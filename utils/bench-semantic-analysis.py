@@ -0,0 +1,83 @@
+WeChat: cstutorcs
+QQ: 749389476
+Email: tutorcs@163.com
+#!/usr/bin/env python3
+
+import argparse
+import io
+import time
+
+from choco.check_assign_target import check_assign_target
+from choco.lexer import Lexer
+from choco.name_analysis import name_analysis
+from choco.parser import Parser
+from choco.semantic_analysis import semantic_analysis
+from choco.type_checking import type_checking
+from choco.warn_dead_code import warn_dead_code
+
+
+def generate_program(num_functions: int) -> str:
+    """Generate a well-typed ChocoPy program with `num_functions` functions."""
+    parts = ["total: int = 0\nnames: [str] = None\n"]
+    for i in range(num_functions):
+        parts.append(f"def f{i}(x: int, s: str) -> int:\n"
+                     f"    global total\n"
+                     f"    y: int = 0\n"
+                     f"    l: [int] = None\n"
+                     f"    l = [x, x + 1, x * 2]\n"
+                     f"    while y < x and not (s == \"a\"):\n"
+                     f"        y = y + l[1] // 2 - {i} % 3\n"
+                     f"        if y >= 10:\n"
+                     f"            total = total + y\n"
+                     f"            return y\n"
+                     f"        elif y != 5:\n"
+                     f"            print(s + \"!\")\n"
+                     f"    for y in l:\n"
+                     f"        total = total + len(l)\n"
+                     f"    return l[0]\n"
+                     f"\n")
+    for i in range(num_functions):
+        parts.append(f"total = total + f{i}({i}, \"iteration\")\n")
+    return "".join(parts)
+
+
+separate_passes = [
+    check_assign_target, name_analysis, type_checking, warn_dead_code
+]
+
+
+def __main__():
+    parser = argparse.ArgumentParser(
+        description='Compare the fused semantic analysis with the separate '
+        'semantic analysis passes')
+    parser.add_argument('--functions', type=int, default=2000,
+                        help='Number of functions of the generated program')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times each analysis is run')
+    args = parser.parse_args()
+
+    program = generate_program(args.functions)
+    module = Parser(Lexer(io.StringIO(program))).parse_program()
+
+    separate = None
+    fused = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for semantic_pass in separate_passes:
+            semantic_pass(None, module)
+        elapsed = time.perf_counter() - start
+        separate = elapsed if separate is None else min(separate, elapsed)
+
+        start = time.perf_counter()
+        semantic_analysis(None, module)
+        elapsed = time.perf_counter() - start
+        fused = elapsed if fused is None else min(fused, elapsed)
+
+    print(f"program size: {len(program)} characters")
+    print(f"separate passes: {separate:.2f} s")
+    print(f"semantic-analysis: {fused:.2f} s")
+    print(f"speedup: {separate / fused:.2f}x")
+
+
+if __name__ == "__main__":
+    __main__()